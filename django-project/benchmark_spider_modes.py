@@ -0,0 +1,97 @@
+"""
+Compares per-search latency of the two spider execution modes:
+
+    'subprocess' - one `scrapy crawl` process per spider (cold start every time)
+    'in_process' - crawls scheduled into a warm, long-lived CrawlerRunner
+
+A "search" runs booking_spider and agoda_spider concurrently, exactly like the
+Celery group started by run_spiders_for_query. Run it from the django-project
+directory with Postgres up (the pipeline writes to the DB):
+
+    uv run python benchmark_spider_modes.py --city London --searches 5
+"""
+import argparse
+import os
+import statistics
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'django_project.settings')
+
+import django
+django.setup()
+
+from hotel_search.crawler_runtime import get_runtime
+from hotel_search.tasks import build_spider_kwargs, run_spider
+
+SPIDERS = ('booking_spider', 'agoda_spider')
+
+
+def run_search(mode, city):
+    """
+    Runs every spider for one search in the given mode and returns the wall-clock time.
+    """
+    search_task_id = f"benchmark-{uuid.uuid4()}"
+    checkin = datetime.now().strftime("%Y-%m-%d")
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(SPIDERS)) as executor:
+        futures = [
+            executor.submit(
+                run_spider,
+                spider_name,
+                build_spider_kwargs(city, search_task_id, f"{search_task_id}-{spider_name}", checkin=checkin),
+                f"{search_task_id}-{spider_name}",
+                mode,
+            )
+            for spider_name in SPIDERS
+        ]
+        results = [future.result() for future in futures]
+    elapsed = time.perf_counter() - started
+
+    failed = [result for result in results if result['status'] != 'SUCCESS']
+    if failed:
+        print(f"WARNING: {len(failed)} spider(s) failed in {mode} mode: {[r.get('error') for r in failed]}")
+    return elapsed
+
+
+def summarize(mode, timings):
+    ordered = sorted(timings)
+    p95 = ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))]
+    print(f"{mode:<12} searches={len(timings):<4} "
+          f"min={ordered[0]:.2f}s median={statistics.median(ordered):.2f}s "
+          f"p95={p95:.2f}s max={ordered[-1]:.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--city', default='London')
+    parser.add_argument('--searches', type=int, default=5, help='Searches to time per mode.')
+    args = parser.parse_args()
+
+    results = {}
+    for mode in ('subprocess', 'in_process'):
+        if mode == 'in_process':
+            # Boot the reactor up front: a warm worker has already paid this at fork time.
+            warmup_started = time.perf_counter()
+            get_runtime().start()
+            print(f"In-process runtime warm-up took {time.perf_counter() - warmup_started:.2f}s")
+
+        results[mode] = []
+        for i in range(args.searches):
+            elapsed = run_search(mode, args.city)
+            print(f"[{mode}] search {i + 1}/{args.searches}: {elapsed:.2f}s")
+            results[mode].append(elapsed)
+
+    print("\n--- Per-search latency ---")
+    for mode, timings in results.items():
+        summarize(mode, timings)
+
+    speedup = statistics.median(results['subprocess']) / statistics.median(results['in_process'])
+    print(f"Median speed-up of in_process over subprocess: {speedup:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -96,6 +96,47 @@ CACHES = {
     }
 }
 
+# Identical searches (normalized city/price/rating/checkin) reuse the same crawl for this long (seconds)
+SEARCH_RESULT_CACHE_TTL = 10 * 60
+
+# Server-Sent Events for search results (Redis pub/sub, see hotel_search/search_events.py)
+SEARCH_EVENTS_REDIS_URL = 'redis://localhost:6379/0'
+SEARCH_EVENTS_TTL = 60 * 60 # how long per-spider final statuses are kept for late subscribers (seconds)
+SEARCH_EVENTS_STREAM_TIMEOUT = 15 * 60 # longest a single stream stays open (seconds)
+SEARCH_EVENTS_HEARTBEAT = 15 # keep-alive comment interval on an idle stream (seconds)
+
+# poll_search_results deltas
+POLL_PAGE_SIZE = 200 # most hotels returned by one poll
+POLL_CURSOR_SETTLE_SECONDS = 5 # rows younger than this are re-sent until concurrent writers have committed
+
+# Agoda city ID resolution tiers: in-process LRU -> Redis -> AgodaCityAlias table -> shared browser
+AGODA_CITY_ID_LRU_SIZE = 1024
+AGODA_CITY_ID_CACHE_TTL = 30 * 24 * 60 * 60 # Redis copy of a resolved ID (seconds)
+AGODA_CITY_ID_MISS_TTL = 10 * 60 # how long a city the browser could not resolve is not retried
+
+# Day-partitioned raw price history and its rollups (see hotel_search/price_history.py)
+PRICE_HISTORY_PARTITIONS_AHEAD = 3 # days of partitions created ahead of ingest
+PRICE_HISTORY_RAW_RETENTION_DAYS = 35 # raw partitions older than this are dropped
+PRICE_HISTORY_HOURLY_RETENTION_DAYS = 14 # hourly rollups older than this are deleted; daily ones are kept
+PRICE_HISTORY_ROLLUP_LOOKBACK_HOURS = 2 # each rollup run recomputes this many recent hours
+PRICE_HISTORY_ROLLUP_INTERVAL = 5 * 60 # seconds between rollup runs (Celery beat)
+
+# Prometheus metrics (see hotel_search/metrics.py), served at /metrics. Every process of a
+# search (web, Celery workers, `scrapy crawl` subprocesses) writes its samples under this directory.
+METRICS_DIR = os.environ.get('PROMETHEUS_MULTIPROC_DIR', os.path.join(BASE_DIR, '.metrics'))
+
+# Per-search latency tracing (see hotel_search/tracing.py), rendered in the SearchRun admin
+TRACING_ENABLED = True
+TRACING_DIR = os.path.join(BASE_DIR, '.traces') # one JSON-lines file of spans per search
+TRACING_RETENTION_DAYS = 7 # trace files untouched for this long are deleted (Celery beat)
+TRACING_ADMIN_RECENT_SEARCHES = 50 # searches the slowest-stages admin page aggregates
+
+SPIDER_LOG_DIR = os.path.join(BASE_DIR, 'logs', 'spiders') # one log per individual_spider_task (subprocess mode)
+SPIDER_LOG_MAX_BYTES = 5 * 1024 * 1024 # a task's log is rotated at this size
+SPIDER_LOG_BACKUP_COUNT = 2 # rotated files kept per task log
+SPIDER_LOG_TAIL_LINES = 20 # last lines of output put into a failed task's error
+SPIDER_LOG_RETENTION_DAYS = 7 # task logs untouched for this long are deleted (Celery beat)
+
 AUTH_USER_MODEL = 'hotel_search.Customer'
 
 # Password validation
@@ -160,6 +201,31 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'Asia/Dhaka' # Or your desired timezone
+# Run with `celery -A django_project beat`
+CELERY_BEAT_SCHEDULE = {
+    'rollup-price-history': {
+        'task': 'hotel_search.tasks.rollup_price_history',
+        'schedule': PRICE_HISTORY_ROLLUP_INTERVAL,
+    },
+    'maintain-price-history': {
+        'task': 'hotel_search.tasks.maintain_price_history',
+        'schedule': 60 * 60,
+    },
+    'prune-traces': {
+        'task': 'hotel_search.tasks.prune_traces',
+        'schedule': 60 * 60,
+    },
+    'prune-spider-logs': {
+        'task': 'hotel_search.tasks.prune_spider_logs',
+        'schedule': 60 * 60,
+    },
+}
+
+# How individual_spider_task runs a spider:
+#   'in_process' - schedule the crawl into a long-lived CrawlerRunner kept warm in each worker process
+#   'subprocess' - fork a fresh `scrapy crawl` process per spider (also the automatic fallback)
+SPIDER_EXECUTION_MODE = os.environ.get('SPIDER_EXECUTION_MODE', 'in_process')
+SPIDER_CRAWL_TIMEOUT = 15 * 60 # seconds before an in-process crawl is asked to stop
 
 # CELERY_IMPORTS = (
 #     'hotel_search.tasks'
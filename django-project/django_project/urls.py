@@ -1,8 +1,11 @@
 from django.contrib import admin
 from django.urls import include, path
 
+from hotel_search.views import metrics_view
+
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', metrics_view, name='metrics'), # Prometheus scrape endpoint
     # path('', include('hotel_search.urls')),
     path('hotels/', include('hotel_search.urls')),
     # path('accounts/', include('django.contrib.auth.urls')),
@@ -1,3 +1,89 @@
+from datetime import datetime, timezone
+
+from django.conf import settings
 from django.contrib import admin
+from django.template.response import TemplateResponse
+from django.urls import NoReverseMatch, path, reverse
+from django.utils.html import format_html
+
+from . import tracing
+from .models import AgodaCity, AgodaCityAlias, Hotel, Property, SearchRun
+
+
+class AgodaCityAliasInline(admin.TabularInline):
+    model = AgodaCityAlias
+    extra = 1
+
+
+@admin.register(AgodaCity)
+class AgodaCityAdmin(admin.ModelAdmin):
+    list_display = ('name', 'agoda_city_id', 'created_at')
+    search_fields = ('name', 'agoda_city_id', 'aliases__alias')
+    inlines = [AgodaCityAliasInline]
+
+
+@admin.register(SearchRun)
+class SearchRunAdmin(admin.ModelAdmin):
+    """
+    Also serves the search traces (see tracing.py): traces/ ranks the stages of the
+    TRACING_ADMIN_RECENT_SEARCHES most recent searches by their p95 duration, and
+    traces/<task_id>/ draws one search's waterfall.
+    """
+    list_display = ('task_id', 'city', 'checkin', 'price', 'rating', 'created_at', 'trace_link')
+    search_fields = ('task_id', 'city')
+    date_hierarchy = 'created_at'
+
+    def get_urls(self):
+        return [
+            path('traces/', self.admin_site.admin_view(self.traces_view), name='hotel_search_searchrun_traces'),
+            path('traces/<uuid:task_id>/', self.admin_site.admin_view(self.trace_view), name='hotel_search_searchrun_trace'),
+        ] + super().get_urls()
+
+    @admin.display(description='Trace')
+    def trace_link(self, run):
+        try:
+            url = reverse('admin:hotel_search_searchrun_trace', args=[run.task_id])
+        except NoReverseMatch: # not a UUID (a crawl started by hand)
+            return '-'
+        return format_html('<a href="{}">waterfall</a>', url)
+
+    def traces_view(self, request):
+        traces = [tracing.load_trace(trace_id) for trace_id in tracing.recent_trace_ids(settings.TRACING_ADMIN_RECENT_SEARCHES)]
+        searches = [tracing.summarize(spans) for spans in traces if spans]
+        for search in searches:
+            search['started_at'] = datetime.fromtimestamp(search['started_at'], tz=timezone.utc)
+        context = dict(
+            self.admin_site.each_context(request),
+            opts=self.model._meta,
+            title='Slowest search stages',
+            stages=tracing.slowest_stages(traces),
+            searches=sorted(searches, key=lambda search: search['duration'], reverse=True),
+        )
+        return TemplateResponse(request, 'admin/hotel_search/searchrun/traces.html', context)
+
+    def trace_view(self, request, task_id):
+        spans = tracing.load_trace(tracing.trace_id_for(task_id))
+        context = dict(
+            self.admin_site.each_context(request),
+            opts=self.model._meta,
+            title=f'Trace of search {task_id}',
+            summary=tracing.summarize(spans),
+            rows=tracing.waterfall(spans),
+        )
+        return TemplateResponse(request, 'admin/hotel_search/searchrun/trace.html', context)
+
+
+class HotelInline(admin.TabularInline):
+    model = Hotel
+    fields = ('name', 'location', 'source', 'price')
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
+
 
-# Register your models here.
+@admin.register(Property)
+class PropertyAdmin(admin.ModelAdmin):
+    list_display = ('name', 'normalized_location', 'created_at')
+    search_fields = ('name', 'normalized_name', 'hotels__name')
+    exclude = ('block_keys',)
+    inlines = [HotelInline]
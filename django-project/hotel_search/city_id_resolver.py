@@ -1,66 +1,227 @@
 import asyncio
+import threading
+from collections import OrderedDict
 from playwright.async_api import async_playwright, TimeoutError as PlaywrightTimeoutError
 from urllib.parse import urlparse, parse_qs
 from loguru import logger
+from django.conf import settings
+from django.core.cache import cache
+
+
+async def get_agoda_city_id(city_name: str, browser=None) -> str | None:
+    """
+    Resolves an Agoda city ID by submitting the Agoda search form in a browser.
+    Uses the given (long-lived) browser if provided, otherwise launches its own.
+    """
+    if browser is None:
+        async with async_playwright() as p:
+            own_browser = await p.chromium.launch(headless=True)
+            try:
+                return await get_agoda_city_id(city_name, browser=own_browser)
+            finally:
+                await own_browser.close()
 
-async def get_agoda_city_id(city_name: str) -> str | None:
     logger.info(f"Attempting to get Agoda city ID for: {city_name}")
-    async with async_playwright() as p:
-        browser = None
+    context = None
+    try:
+        # A throwaway context per lookup keeps cookies/state from leaking between cities.
+        context = await browser.new_context()
+        page = await context.new_page()
+            
+        # Navigate to Agoda homepage
+        await page.goto("https://www.agoda.com/en-gb/", wait_until="domcontentloaded")
+        logger.info(f"Navigated to Agoda homepage: {page.url}")
+
         try:
-            browser = await p.chromium.launch(headless=True)
-            page = await browser.new_page()
+            # Fill destination
+            await page.fill("#textInput", city_name)
+
+            # Wait for the search button
+            await page.wait_for_selector("button[data-selenium='searchButton']", timeout=1000)
             
-            # Navigate to Agoda homepage
-            await page.goto("https://www.agoda.com/en-gb/", wait_until="domcontentloaded")
-            logger.info(f"Navigated to Agoda homepage: {page.url}")
+            # Click the search button
+            await page.click("button[data-selenium='searchButton']")
+            logger.info("Clicked search input.")
+    
+            # Wait for navigation (search results page)
+            await page.wait_for_load_state("networkidle")
+        except PlaywrightTimeoutError:
+            logger.warning("Could not find direct search input, trying alternative selectors.")
+            # Fallback 
+            await page.click("button[data-selenium='searchButton']", timeout=1000)
+            logger.info("Clicked alternative search input.")
 
-            try:
-                # Fill destination
-                await page.fill("#textInput", city_name)
-
-                # Wait for the search button
-                await page.wait_for_selector("button[data-selenium='searchButton']", timeout=1000)
-                
-                # Click the search button
-                await page.click("button[data-selenium='searchButton']")
-                logger.info("Clicked search input.")
         
-                # Wait for navigation (search results page)
-                await page.wait_for_load_state("networkidle")
-            except PlaywrightTimeoutError:
-                logger.warning("Could not find direct search input, trying alternative selectors.")
-                # Fallback 
-                await page.click("button[data-selenium='searchButton']", timeout=1000)
-                logger.info("Clicked alternative search input.")
+        # Extract city ID from the URL
+        parsed_url = urlparse(page.url)
+        query_params = parse_qs(parsed_url.query)
+        
+        city_id = query_params.get('city', [None])[0]
+        
+        if city_id:
+            logger.info(f"Successfully extracted Agoda city ID: {city_id}")
+            return city_id
+        else:
+            logger.warning(f"Could not find 'city' parameter in URL: {page.url}")
+            return None
 
-            
-            # Extract city ID from the URL
-            parsed_url = urlparse(page.url)
-            query_params = parse_qs(parsed_url.query)
-            
-            city_id = query_params.get('city', [None])[0]
-            
-            if city_id:
-                logger.info(f"Successfully extracted Agoda city ID: {city_id}")
-                return city_id
-            else:
-                logger.warning(f"Could not find 'city' parameter in URL: {page.url}")
-                return None
-
-        except PlaywrightTimeoutError as e:
-            logger.error(f"Playwright operation timed out: {e}")
-            if browser:
-                await browser.close()
+    except PlaywrightTimeoutError as e:
+        logger.error(f"Playwright operation timed out: {e}")
+        return None
+    except Exception as e:
+        logger.error(f"An unexpected error occurred during Agoda city ID resolution: {e}")
+        return None
+    finally:
+        if context:
+            await context.close()
+
+class SharedAgodaBrowser:
+    """
+    One long-lived headless Chromium per process, driven from its own event loop
+    thread so that synchronous callers (views, Celery tasks) can share it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loop = None
+        self._playwright = None
+        self._browser = None
+        self._launch_lock = None
+
+    def _ensure_loop(self):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name='agoda-browser', daemon=True).start()
+
+    async def _get_browser(self):
+        if self._launch_lock is None:
+            self._launch_lock = asyncio.Lock()
+        async with self._launch_lock:
+            if self._browser is None or not self._browser.is_connected():
+                if self._playwright is None:
+                    self._playwright = await async_playwright().start()
+                logger.info("Launching shared headless Chromium for Agoda city ID lookups.")
+                self._browser = await self._playwright.chromium.launch(headless=True)
+        return self._browser
+
+    async def _lookup(self, city_name):
+        return await get_agoda_city_id(city_name, browser=await self._get_browser())
+
+    def lookup(self, city_name, timeout=60):
+        self._ensure_loop()
+        return asyncio.run_coroutine_threadsafe(self._lookup(city_name), self._loop).result(timeout)
+
+
+class AgodaCityIdResolver:
+    """
+    Resolves city names to Agoda city IDs through three cache tiers, fastest first:
+
+    1. an in-process LRU (microseconds),
+    2. the shared Redis cache (one round trip),
+    3. the AgodaCity / AgodaCityAlias tables (durable, editable in the admin).
+
+    Only a miss in all three falls through to the shared browser, and the answer
+    is then written back to every tier.
+    """
+
+    # Stored in Redis for names the browser could not resolve, so they are not retried on every search.
+    MISS = ''
+
+    def __init__(self, browser=None):
+        self.browser = browser or SharedAgodaBrowser()
+        self._lru = OrderedDict()
+        self._lru_lock = threading.Lock()
+
+    @staticmethod
+    def _cache_key(normalized_name):
+        return f"agoda_city_id:v1:{normalized_name}"
+
+    def _lru_get(self, normalized_name):
+        with self._lru_lock:
+            city_id = self._lru.get(normalized_name)
+            if city_id is not None:
+                self._lru.move_to_end(normalized_name)
+            return city_id
+
+    def _lru_put(self, normalized_name, city_id):
+        with self._lru_lock:
+            self._lru[normalized_name] = city_id
+            self._lru.move_to_end(normalized_name)
+            while len(self._lru) > settings.AGODA_CITY_ID_LRU_SIZE:
+                self._lru.popitem(last=False)
+
+    def resolve(self, city_name, allow_browser=True):
+        """
+        Returns the Agoda city ID for `city_name`, or None.
+        With `allow_browser=False` only the cache tiers are consulted (never slow).
+        """
+        from .models import AgodaCityAlias # imported lazily so this module still runs as a script
+
+        normalized_name = AgodaCityAlias.normalize(city_name)
+        if not normalized_name:
+            return None
+
+        city_id = self._lru_get(normalized_name)
+        if city_id is not None:
+            return city_id
+
+        city_id = cache.get(self._cache_key(normalized_name))
+        if city_id == self.MISS:
             return None
-        except Exception as e:
-            logger.error(f"An unexpected error occurred during Agoda city ID resolution: {e}")
-            if browser:
-                await browser.close()
+        if city_id is not None:
+            self._lru_put(normalized_name, city_id)
+            return city_id
+
+        city_id = (AgodaCityAlias.objects.filter(alias=normalized_name)
+                   .values_list('city__agoda_city_id', flat=True).first())
+        if city_id is not None:
+            cache.set(self._cache_key(normalized_name), city_id, timeout=settings.AGODA_CITY_ID_CACHE_TTL)
+            self._lru_put(normalized_name, city_id)
+            return city_id
+
+        if not allow_browser:
+            return None
+
+        city_id = self.browser.lookup(city_name.strip())
+        if not city_id:
+            cache.set(self._cache_key(normalized_name), self.MISS, timeout=settings.AGODA_CITY_ID_MISS_TTL)
             return None
-        finally:
-            if browser:
-                await browser.close()
+
+        self.remember(city_name, city_id)
+        return city_id
+
+    def remember(self, city_name, city_id, aliases=()):
+        """
+        Stores a city name (and optional aliases) -> city ID mapping in every tier.
+        """
+        from .models import AgodaCity, AgodaCityAlias
+
+        city_id = str(city_id)
+        city, _ = AgodaCity.objects.get_or_create(agoda_city_id=city_id, defaults={'name': city_name.strip()})
+        for name in (city_name, *aliases):
+            normalized_name = AgodaCityAlias.normalize(name)
+            if not normalized_name:
+                continue
+            AgodaCityAlias.objects.update_or_create(alias=normalized_name, defaults={'city': city})
+            cache.set(self._cache_key(normalized_name), city_id, timeout=settings.AGODA_CITY_ID_CACHE_TTL)
+            self._lru_put(normalized_name, city_id)
+        logger.info(f"Stored Agoda city ID {city_id} for {city_name}")
+
+
+_resolver = None
+_resolver_lock = threading.Lock()
+
+
+def resolve_agoda_city_id(city_name, allow_browser=True):
+    """
+    Resolves through this process' shared AgodaCityIdResolver.
+    """
+    global _resolver
+    with _resolver_lock:
+        if _resolver is None:
+            _resolver = AgodaCityIdResolver()
+    return _resolver.resolve(city_name, allow_browser=allow_browser)
 
 if __name__ == '__main__':
     # Example usage for testing
@@ -0,0 +1,95 @@
+# django-project/hotel_search/crawl_output.py
+"""
+Output and progress of `scrapy crawl` subprocesses.
+
+A crawl can print megabytes (Scrapy's DEBUG log, Playwright's), so the
+'subprocess' execution mode never holds it in memory: `stream_output` copies it
+line by line to the task's log file under SPIDER_LOG_DIR (rotated at
+SPIDER_LOG_MAX_BYTES, SPIDER_LOG_BACKUP_COUNT older files kept) and keeps only
+the last SPIDER_LOG_TAIL_LINES lines for an error message.
+
+Progress events (pages done, items scraped, the current page) are written into
+that output by the scraper's CrawlProgress extension as PROGRESS_MARKER lines and
+picked out of the stream as they arrive. In-process crawls hand the same events
+to a callback instead.
+"""
+import json
+import logging
+import time
+from collections import deque
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+
+from django.conf import settings
+
+PROGRESS_MARKER = 'CRAWL_PROGRESS'
+MAX_LINE_CHARS = 64 * 1024 # longer lines are split; a single line can't grow the worker either
+TAIL_LINE_CHARS = 300 # each tail line in an error message is cut to this
+
+
+def format_progress(event):
+    """
+    {'pages': 3, 'items': 75} -> 'CRAWL_PROGRESS {"pages":3,"items":75}'
+    """
+    return f"{PROGRESS_MARKER} {json.dumps(event, separators=(',', ':'), default=str)}"
+
+
+def parse_progress(line):
+    """
+    The progress event of a line of crawl output (wherever the log format put the
+    marker), or None for any other line.
+    """
+    index = line.find(PROGRESS_MARKER)
+    if index < 0:
+        return None
+    try:
+        event = json.loads(line[index + len(PROGRESS_MARKER):])
+    except ValueError:
+        return None
+    return event if isinstance(event, dict) else None
+
+
+def task_log_path(task_id):
+    return Path(settings.SPIDER_LOG_DIR) / f"{task_id}.log"
+
+
+def stream_output(stream, log_path, on_progress=None):
+    """
+    Copies a crawl's output from `stream` to `log_path` until it ends, calling
+    `on_progress(event)` for every progress line. Returns the last progress event
+    ({} if none) and the last SPIDER_LOG_TAIL_LINES lines.
+    """
+    log_path.parent.mkdir(parents=True, exist_ok=True)
+    handler = RotatingFileHandler(
+        log_path, maxBytes=settings.SPIDER_LOG_MAX_BYTES, backupCount=settings.SPIDER_LOG_BACKUP_COUNT,
+        encoding='utf-8',
+    )
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    tail = deque(maxlen=settings.SPIDER_LOG_TAIL_LINES)
+    progress = {}
+    try:
+        for line in iter(lambda: stream.readline(MAX_LINE_CHARS), ''):
+            line = line.rstrip('\n')
+            handler.emit(logging.makeLogRecord({'msg': line}))
+            tail.append(line[:TAIL_LINE_CHARS])
+            event = parse_progress(line)
+            if event is not None:
+                progress = event
+                if on_progress is not None:
+                    on_progress(event)
+    finally:
+        handler.close()
+    return progress, list(tail)
+
+
+def prune_logs(retention_days):
+    """
+    Deletes task logs (rotated ones included) untouched for `retention_days`; returns how many.
+    """
+    cutoff = time.time() - retention_days * 24 * 60 * 60
+    pruned = 0
+    for path in Path(settings.SPIDER_LOG_DIR).glob('*.log*'):
+        if path.stat().st_mtime < cutoff:
+            path.unlink(missing_ok=True)
+            pruned += 1
+    return pruned
@@ -0,0 +1,135 @@
+# django-project/hotel_search/crawler_runtime.py
+"""
+Long-lived Scrapy runtime for Celery worker processes.
+
+Running `scrapy crawl` in a subprocess means every spider of every search pays
+for Python start-up, the Scrapy import, `django.setup()` and a fresh Playwright
+launch. Instead, each worker process lazily boots ONE Twisted reactor (backed by
+an asyncio event loop, as required by scrapy-playwright) in a daemon thread and
+keeps ONE `CrawlerRunner` alive for its whole lifetime. Crawls are scheduled into
+that warm runtime with `reactor.callFromThread` and the calling Celery task
+blocks on a `concurrent.futures.Future` until the crawl finishes.
+"""
+import asyncio
+import os
+import sys
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from pathlib import Path
+
+from django.conf import settings
+from loguru import logger as LOGGER
+
+
+class CrawlerRuntimeUnavailable(RuntimeError):
+    """Raised when the in-process runtime cannot be started in this process."""
+
+
+class CrawlerRuntime:
+    """
+    Owns the reactor thread and the shared `CrawlerRunner` of one worker process.
+    """
+
+    def __init__(self, scraper_project_path):
+        self.scraper_project_path = Path(scraper_project_path)
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._thread = None
+        self._reactor = None
+        self._runner = None
+        self._startup_error = None
+
+    @property
+    def is_running(self):
+        return self._ready.is_set() and self._startup_error is None
+
+    def start(self, timeout=60):
+        """
+        Starts the reactor thread once; later calls return immediately.
+        """
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run_reactor, name='scrapy-reactor', daemon=True)
+                self._thread.start()
+
+        if not self._ready.wait(timeout):
+            raise CrawlerRuntimeUnavailable(f"Scrapy reactor did not start within {timeout} seconds.")
+        if self._startup_error is not None:
+            raise CrawlerRuntimeUnavailable(f"Could not start the Scrapy runtime: {self._startup_error}")
+
+    def _run_reactor(self):
+        try:
+            # The scraper project must be importable exactly like `scrapy crawl` sees it
+            # from the scraper/ directory (scrapy.cfg -> scraper.settings).
+            if str(self.scraper_project_path) not in sys.path:
+                sys.path.insert(0, str(self.scraper_project_path))
+            os.environ.setdefault('SCRAPY_SETTINGS_MODULE', 'scraper.settings')
+
+            # The reactor (and its asyncio loop) belong to this thread only.
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            from twisted.internet import asyncioreactor
+            asyncioreactor.install(eventloop=loop)
+            from twisted.internet import reactor
+
+            from scrapy.crawler import CrawlerRunner
+            from scrapy.utils.project import get_project_settings
+
+            self._runner = CrawlerRunner(get_project_settings())
+            self._reactor = reactor
+        except Exception as e:
+            LOGGER.error(f"Failed to boot the in-process Scrapy runtime: {e}")
+            self._startup_error = e
+            self._ready.set()
+            return
+
+        reactor.callWhenRunning(self._ready.set)
+        LOGGER.info(f"Starting in-process Scrapy runtime (pid={os.getpid()}).")
+        reactor.run(installSignalHandlers=False)
+
+    def crawl(self, spider_name, timeout=None, **spider_kwargs):
+        """
+        Runs one crawl in the warm runtime and blocks until it is finished.
+        Returns the crawler's final stats. Raises `TimeoutError` (after asking
+        the crawler to stop) if the crawl takes longer than `timeout` seconds.
+        """
+        self.start()
+
+        future = Future()
+        crawler_holder = {}
+
+        def _schedule():
+            try:
+                crawler = self._runner.create_crawler(spider_name)
+                crawler_holder['crawler'] = crawler
+                deferred = self._runner.crawl(crawler, **spider_kwargs)
+            except Exception as e:
+                future.set_exception(e)
+                return
+            deferred.addCallback(lambda _: future.set_result(dict(crawler.stats.get_stats())))
+            deferred.addErrback(lambda failure: future.set_exception(failure.value))
+
+        self._reactor.callFromThread(_schedule)
+
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            crawler = crawler_holder.get('crawler')
+            if crawler is not None:
+                self._reactor.callFromThread(crawler.stop)
+            raise TimeoutError(f"Spider {spider_name} did not finish within {timeout} seconds.")
+
+
+_runtime = None
+_runtime_lock = threading.Lock()
+
+
+def get_runtime():
+    """
+    Returns this process' `CrawlerRuntime`, creating it on first use.
+    """
+    global _runtime
+    with _runtime_lock:
+        if _runtime is None:
+            _runtime = CrawlerRuntime(Path(settings.BASE_DIR).parent / 'scraper')
+        return _runtime
@@ -0,0 +1,245 @@
+# django-project/hotel_search/entity_resolution.py
+"""
+Cross-source hotel entity resolution.
+
+Booking and Agoda spell the same hotel differently ("The Z Hotel Soho" /
+"Z Soho", "Kensington and Chelsea, London" / "Chelsea, London - 68 m to
+center"). Listings are matched in three steps:
+
+1. normalize   - accents, case, punctuation, stop words and distance suffixes
+                 are stripped from names and locations;
+2. block       - MinHash-LSH over character 3-grams of the normalized name: every
+                 listing gets LSH_BANDS band keys, and only listings sharing a key
+                 are ever compared, so matching stays sub-quadratic;
+3. score/link  - candidate pairs are scored on name similarity (3-gram Jaccard)
+                 and location token overlap, best first, and linked with at most
+                 one listing per source in a group.
+
+`resolve_listings` runs the whole thing in memory (used by the benchmark);
+`link_properties` runs it incrementally against the DB, where the band keys of
+every Property live in a GIN-indexed array column.
+"""
+import re
+import random
+import unicodedata
+import zlib
+
+from django.db import connection, transaction
+from loguru import logger as LOGGER
+
+LSH_BANDS = 8
+LSH_ROWS = 3 # hashes per band; 8 bands x 3 rows catch pairs from ~0.5 3-gram Jaccard up
+MATCH_THRESHOLD = 0.6
+NAME_WEIGHT = 0.7
+LOCATION_WEIGHT = 0.3
+# Taken while linking, so two spiders flushing at once can't both create the same Property.
+LINK_LOCK_ID = 0x70726f70
+
+NAME_STOPWORDS = {'the', 'hotel', 'hotels', 'and', 'by', 'at', 'of', 'a', 'an', 'in'}
+# Chain/marketing tails one site adds and the other doesn't.
+NAME_MARKETING_SUFFIXES = re.compile(
+    r'\b(an ihg hotel|autograph collection|tribute portfolio|curio collection by hilton|a member of \w+( \w+)?|'
+    r'a radisson collection hotel|by ihg|an accor hotel)$'
+)
+NAME_ABBREVIATIONS = {'intl': 'international', 'apts': 'apartments', 'apt': 'apartment'}
+LOCATION_STOPWORDS = {'and', 'the', 'of', 'city', 'centre', 'center', 'district', 'area', 'near', 'to', 'from'}
+# "- 68 m to center", "1.2 km from downtown", "(0.3 miles)"
+_DISTANCE_RE = re.compile(r'[\s,\-–(]*\d+(?:[.,]\d+)?\s*(?:m|km|mi|miles?|ft)\b.*$', re.IGNORECASE)
+_NON_WORD_RE = re.compile(r'[\W_]+')
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_rng = random.Random(20240601) # fixed seed: band keys are stored in the DB and must never change
+_HASH_PARAMS = [(_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME)) for _ in range(LSH_BANDS * LSH_ROWS)]
+
+
+def _fold(text):
+    decomposed = unicodedata.normalize('NFKD', str(text or '').replace('&', ' and '))
+    without_accents = ''.join(c for c in decomposed if not unicodedata.combining(c))
+    return _NON_WORD_RE.sub(' ', without_accents.casefold()).split()
+
+
+def normalize_name(name):
+    """
+    'The Z Hotel, Soho & Co.' -> 'z soho co'
+    """
+    folded = NAME_MARKETING_SUFFIXES.sub('', ' '.join(_fold(name))).split()
+    tokens = [NAME_ABBREVIATIONS.get(token, token) for token in folded]
+    kept = [token for token in tokens if token not in NAME_STOPWORDS]
+    return ' '.join(kept or tokens)
+
+
+def normalize_location(location):
+    """
+    'Chelsea, London - 68 m to center' -> 'chelsea london'
+    """
+    return ' '.join(t for t in _fold(_DISTANCE_RE.sub('', str(location or ''))) if t not in LOCATION_STOPWORDS)
+
+
+def shingles(normalized_name):
+    padded = f" {normalized_name} "
+    return {padded[i:i + 3] for i in range(max(len(padded) - 2, 1))}
+
+
+def block_keys(normalized_name):
+    """
+    The LSH band keys of a normalized name: names with 3-gram Jaccard similarity s
+    share at least one key with probability 1 - (1 - s^LSH_ROWS)^LSH_BANDS.
+    """
+    hashed = [zlib.crc32(s.encode()) for s in shingles(normalized_name)]
+    signature = [min((a * x + b) % _MERSENNE_PRIME for x in hashed) for a, b in _HASH_PARAMS]
+    keys = []
+    for band in range(LSH_BANDS):
+        rows = signature[band * LSH_ROWS:(band + 1) * LSH_ROWS]
+        keys.append(f"{band}:{zlib.crc32(repr(rows).encode()):08x}")
+    return keys
+
+
+def _jaccard(a, b):
+    return len(a & b) / len(a | b) if a and b else 0.0
+
+
+def _containment(a, b):
+    return len(a & b) / min(len(a), len(b)) if a and b else 0.0
+
+
+class Listing:
+    """
+    One hotel as listed by one source, with everything matching needs precomputed.
+    """
+    __slots__ = ('id', 'source', 'name', 'location', 'name_shingles', 'name_numbers', 'location_tokens', 'keys')
+
+    def __init__(self, id, source, name, location, keys=None):
+        self.id = id
+        self.source = source
+        self.name = normalize_name(name)
+        self.location = normalize_location(location)
+        self.name_shingles = shingles(self.name)
+        self.name_numbers = {token for token in self.name.split() if token.isdigit()}
+        self.location_tokens = set(self.location.split())
+        self.keys = keys if keys is not None else block_keys(self.name)
+
+    def score(self, other):
+        if self.name_numbers and other.name_numbers and self.name_numbers != other.name_numbers:
+            return 0.0 # 'Room 2 Hammersmith' is not 'Room 3 Hammersmith'
+        name_similarity = _jaccard(self.name_shingles, other.name_shingles)
+        if not self.location_tokens or not other.location_tokens:
+            return name_similarity # nothing to compare locations on; don't penalize
+        return NAME_WEIGHT * name_similarity + LOCATION_WEIGHT * _containment(self.location_tokens, other.location_tokens)
+
+
+def candidate_pairs(listings):
+    """
+    Yields each cross-source pair of listings that share at least one LSH band key, once.
+    """
+    buckets = {}
+    for index, listing in enumerate(listings):
+        for key in listing.keys:
+            buckets.setdefault(key, []).append(index)
+    seen = set()
+    for members in buckets.values():
+        for i, left in enumerate(members):
+            for right in members[i + 1:]:
+                if listings[left].source != listings[right].source and (left, right) not in seen:
+                    seen.add((left, right))
+                    yield left, right
+
+
+def resolve_listings(listings, threshold=MATCH_THRESHOLD):
+    """
+    Groups `listings` (Listing objects) into entities. Returns {listing id: group id},
+    where a group ID is the ID of one of the group's listings.
+    """
+    scored = []
+    for left, right in candidate_pairs(listings):
+        score = listings[left].score(listings[right])
+        if score >= threshold:
+            scored.append((score, left, right))
+    scored.sort(reverse=True)
+
+    # Union-find, keeping at most one listing per source in a group.
+    parent = list(range(len(listings)))
+    group_sources = [{listing.source} for listing in listings]
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for _, left, right in scored:
+        left_root, right_root = find(left), find(right)
+        if left_root == right_root or group_sources[left_root] & group_sources[right_root]:
+            continue
+        parent[right_root] = left_root
+        group_sources[left_root] |= group_sources[right_root]
+
+    return {listing.id: listings[find(i)].id for i, listing in enumerate(listings)}
+
+
+def link_properties(hotels):
+    """
+    Links each saved Hotel without a Property to the best-matching Property from another
+    source, or to a new Property. Sets `property_id` on the given Hotel objects too and
+    returns the number of hotels linked.
+    """
+    from .models import Hotel, Property
+
+    unlinked_ids = set(Hotel.objects.filter(
+        id__in=[hotel.id for hotel in hotels], property__isnull=True,
+    ).values_list('id', flat=True))
+    known = dict(Hotel.objects.filter(
+        id__in=[hotel.id for hotel in hotels], property__isnull=False,
+    ).values_list('id', 'property_id'))
+    for hotel in hotels:
+        if hotel.id in known:
+            hotel.property_id = known[hotel.id]
+    if not unlinked_ids:
+        return 0
+
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_xact_lock(%s)", [LINK_LOCK_ID])
+
+        listings = {
+            hotel.id: Listing(hotel.id, hotel.source, hotel.name, hotel.location)
+            for hotel in hotels if hotel.id in unlinked_ids
+        }
+        all_keys = sorted({key for listing in listings.values() for key in listing.keys})
+        # One GIN index lookup for the whole batch: properties sharing any band key.
+        candidates = {
+            prop.id: (prop, Listing(prop.id, None, prop.normalized_name, prop.normalized_location, keys=prop.block_keys))
+            for prop in Property.objects.filter(block_keys__overlap=all_keys)
+        }
+        taken_sources = {}
+        for property_id, source in Hotel.objects.filter(property_id__in=candidates).values_list('property_id', 'source'):
+            taken_sources.setdefault(property_id, set()).add(source)
+
+        to_update = []
+        for hotel in hotels:
+            listing = listings.get(hotel.id)
+            if listing is None:
+                continue
+            best_score, best_property = 0.0, None
+            for prop, candidate in candidates.values():
+                if hotel.source in taken_sources.get(prop.id, ()) or not set(listing.keys) & set(candidate.keys):
+                    continue
+                score = listing.score(candidate)
+                if score >= MATCH_THRESHOLD and score > best_score:
+                    best_score, best_property = score, prop
+            if best_property is None:
+                best_property = Property.objects.create(
+                    name=hotel.name,
+                    normalized_name=listing.name,
+                    normalized_location=listing.location,
+                    block_keys=listing.keys,
+                )
+                candidates[best_property.id] = (best_property, Listing(
+                    best_property.id, None, listing.name, listing.location, keys=listing.keys,
+                ))
+            taken_sources.setdefault(best_property.id, set()).add(hotel.source)
+            hotel.property_id = best_property.id
+            to_update.append(hotel)
+
+        Hotel.objects.bulk_update(to_update, ['property'])
+    LOGGER.debug(f"Linked {len(to_update)} hotels to properties")
+    return len(to_update)
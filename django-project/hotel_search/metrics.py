@@ -0,0 +1,117 @@
+# django-project/hotel_search/metrics.py
+"""
+Prometheus metrics for the whole search pipeline.
+
+Recorded by:
+    the scraper (scraper/extensions.py, scraper/middlewares.py, scraper/pipelines.py)
+        scraper_pages_fetched_total, scraper_response_bytes_total, scraper_download_seconds,
+        scraper_parse_seconds, scraper_items_total, scraper_crawls_total,
+        scraper_crawl_items, scraper_crawl_seconds,
+        scraper_pipeline_flush_seconds, scraper_pipeline_items_total
+    Celery signal handlers (tasks.py)
+        celery_task_queue_wait_seconds, celery_task_run_seconds
+    the poll endpoint (views.py)
+        search_poll_seconds
+
+and served by the `metrics` view at /metrics.
+
+Searches run in several processes at once: the web server, every Celery worker
+process and, in the 'subprocess' execution mode, one `scrapy crawl` per spider.
+prometheus_client's multiprocess mode covers that: each process writes its samples
+to memory-mapped files under METRICS_DIR (PROMETHEUS_MULTIPROC_DIR, inherited by
+the crawler subprocesses) and /metrics adds up the files of all of them. The files
+are named after host and pid, so containers sharing the directory through a volume
+don't overwrite each other's. Empty the directory when the stack is (re)started.
+"""
+import os
+import socket
+import time
+from functools import wraps
+
+from django.conf import settings
+
+# Must be set before prometheus_client is imported; it picks the multiprocess value class then.
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', str(settings.METRICS_DIR))
+os.makedirs(os.environ['PROMETHEUS_MULTIPROC_DIR'], exist_ok=True)
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess, values
+
+_HOSTNAME = socket.gethostname().replace('_', '-') # '_' separates the parts of the file names
+values.ValueClass = values.MultiProcessValue(lambda: f"{_HOSTNAME}-{os.getpid()}")
+
+# --- Scraper ---
+PAGES_FETCHED = Counter(
+    'scraper_pages_fetched', 'Pages downloaded (cache hits excluded).', ['spider', 'status', 'renderer'],
+)
+RESPONSE_BYTES = Counter(
+    'scraper_response_bytes', 'Bytes downloaded, as received (before decompression).', ['spider'],
+)
+DOWNLOAD_SECONDS = Histogram(
+    'scraper_download_seconds', 'Time from sending a request to receiving its response.', ['spider', 'renderer'],
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+PARSE_SECONDS = Histogram(
+    'scraper_parse_seconds', "Time spent in a spider callback for one page.", ['spider'],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1),
+)
+ITEMS = Counter(
+    'scraper_items', 'Items the spiders produced, by outcome (scraped or dropped).', ['spider', 'outcome'],
+)
+CRAWLS = Counter(
+    'scraper_crawls', 'Finished crawls.', ['spider', 'finish_reason'],
+)
+CRAWL_ITEMS = Histogram(
+    'scraper_crawl_items', "Items scraped per crawl (item_scraped_count of the crawl's stats).", ['spider'],
+    buckets=(0, 10, 25, 50, 100, 200, 500, 1000),
+)
+CRAWL_SECONDS = Histogram(
+    'scraper_crawl_seconds', 'Duration of a crawl.', ['spider'],
+    buckets=(5, 10, 30, 60, 120, 300, 600, 900),
+)
+PIPELINE_FLUSH_SECONDS = Histogram(
+    'scraper_pipeline_flush_seconds', 'Duration of one BulkHotelScraperPipeline flush.', ['spider'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+PIPELINE_ITEMS = Counter(
+    'scraper_pipeline_items', 'Hotels the pipeline flushed, by outcome (upserted or failed).', ['spider', 'outcome'],
+)
+
+# --- Celery ---
+TASK_QUEUE_WAIT_SECONDS = Histogram(
+    'celery_task_queue_wait_seconds', 'Time from publishing a task to a worker starting it.', ['task'],
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300),
+)
+TASK_RUN_SECONDS = Histogram(
+    'celery_task_run_seconds', 'Task run time, by final state.', ['task', 'state'],
+    buckets=(0.1, 0.5, 1, 5, 10, 30, 60, 120, 300, 900),
+)
+
+# --- Web ---
+POLL_SECONDS = Histogram(
+    'search_poll_seconds', 'Latency of the poll_search_results endpoint, by response status.', ['status'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+
+
+def time_view(histogram):
+    """
+    Decorator observing a view's duration in `histogram`, labelled with the response's status code.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            started = time.perf_counter()
+            response = view(request, *args, **kwargs)
+            histogram.labels(status=response.status_code).observe(time.perf_counter() - started)
+            return response
+        return wrapper
+    return decorator
+
+
+def render():
+    """
+    The samples of every process, added up, in the Prometheus text format: (body, content type).
+    """
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
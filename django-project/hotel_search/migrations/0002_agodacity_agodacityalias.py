@@ -0,0 +1,37 @@
+# Generated by Django 5.2.4 on 2026-10-18 11:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hotel_search', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AgodaCity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('agoda_city_id', models.CharField(max_length=32, unique=True)),
+                ('name', models.CharField(help_text='City name as it was first searched', max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Agoda cities',
+            },
+        ),
+        migrations.CreateModel(
+            name='AgodaCityAlias',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('alias', models.CharField(max_length=255, unique=True)),
+                ('city', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='aliases', to='hotel_search.agodacity')),
+            ],
+            options={
+                'verbose_name_plural': 'Agoda city aliases',
+            },
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.4 on 2026-10-18 11:40
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hotel_search', '0002_agodacity_agodacityalias'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='hotel',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now, help_text="Last insert or update; the poll endpoint's delta cursor"),
+            preserve_default=False,
+        ),
+        migrations.AddIndex(
+            model_name='hotel',
+            index=models.Index(fields=['search_task_id', 'updated_at', 'id'], name='hotel_task_updated_idx'),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.4 on 2026-10-18 11:26
+
+import re
+from decimal import Decimal, InvalidOperation
+
+from django.db import migrations, models
+
+
+def backfill_price_amount(apps, schema_editor):
+    """
+    Existing prices are digit strings ('53', '1234'); parse them once so old rows take part in best-offer queries.
+    """
+    Hotel = apps.get_model('hotel_search', 'Hotel')
+    for hotel in Hotel.objects.exclude(price__isnull=True).exclude(price='').only('id', 'price').iterator():
+        digits = re.sub(r'[^\d.]', '', hotel.price.replace(',', ''))
+        try:
+            amount = Decimal(digits) if digits else None
+        except InvalidOperation:
+            amount = None
+        if amount is not None:
+            Hotel.objects.filter(id=hotel.id).update(price_amount=amount)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hotel_search', '0003_hotel_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='hotel',
+            name='currency',
+            field=models.CharField(blank=True, help_text='ISO 4217 code', max_length=3, null=True),
+        ),
+        migrations.AddField(
+            model_name='hotel',
+            name='price_amount',
+            field=models.DecimalField(blank=True, decimal_places=2, help_text='Parsed once at ingest', max_digits=12, null=True),
+        ),
+        migrations.AlterField(
+            model_name='hotel',
+            name='price',
+            field=models.CharField(blank=True, help_text='Price as displayed by the source', max_length=100, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='hotel',
+            index=models.Index(fields=['search_task_id', 'name', 'location', 'price_amount'], name='hotel_task_best_offer_idx'),
+        ),
+        migrations.RunPython(backfill_price_amount, migrations.RunPython.noop),
+    ]
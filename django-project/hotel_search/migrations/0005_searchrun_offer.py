@@ -0,0 +1,106 @@
+# Generated by Django 5.2.4 on 2026-10-18 11:30
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def backfill_runs_and_offers(apps, schema_editor):
+    """
+    Turns each hotel's current search_task_id into a SearchRun with one Offer, so
+    searches made before this migration keep their results.
+    """
+    Hotel = apps.get_model('hotel_search', 'Hotel')
+    SearchRun = apps.get_model('hotel_search', 'SearchRun')
+    Offer = apps.get_model('hotel_search', 'Offer')
+
+    runs = {}
+    offers = []
+    for hotel in Hotel.objects.order_by('id').iterator():
+        if hotel.search_task_id not in runs:
+            runs[hotel.search_task_id], _ = SearchRun.objects.get_or_create(task_id=hotel.search_task_id, defaults={'city': ''})
+        offers.append(Offer(
+            run=runs[hotel.search_task_id], hotel=hotel, price=hotel.price, price_amount=hotel.price_amount,
+            currency=hotel.currency, rating=hotel.rating, scraped_at=hotel.updated_at,
+        ))
+        if len(offers) >= 1000:
+            Offer.objects.bulk_create(offers)
+            offers = []
+    Offer.objects.bulk_create(offers)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hotel_search', '0004_hotel_price_amount_currency'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Offer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('price', models.CharField(blank=True, help_text='Price as displayed by the source', max_length=100, null=True)),
+                ('price_amount', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('currency', models.CharField(blank=True, help_text='ISO 4217 code', max_length=3, null=True)),
+                ('rating', models.CharField(blank=True, max_length=50, null=True)),
+                ('scraped_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SearchRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('task_id', models.CharField(help_text='Celery task ID of run_spiders_for_query', max_length=255, unique=True)),
+                ('city', models.CharField(max_length=255)),
+                ('price', models.CharField(blank=True, help_text='Price filter as submitted', max_length=50, null=True)),
+                ('rating', models.CharField(blank=True, help_text='Rating filter as submitted', max_length=50, null=True)),
+                ('checkin', models.DateField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.RemoveIndex(
+            model_name='hotel',
+            name='hotel_task_updated_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='hotel',
+            name='hotel_task_best_offer_idx',
+        ),
+        migrations.AlterField(
+            model_name='hotel',
+            name='search_task_id',
+            field=models.CharField(help_text='Celery task ID of the last search that found it; per-search results are Offers', max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='hotel',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, help_text='Last insert or update'),
+        ),
+        migrations.AddField(
+            model_name='offer',
+            name='hotel',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='offers', to='hotel_search.hotel'),
+        ),
+        migrations.AddField(
+            model_name='offer',
+            name='run',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='offers', to='hotel_search.searchrun'),
+        ),
+        migrations.AddIndex(
+            model_name='offer',
+            index=models.Index(fields=['run', 'price_amount'], name='offer_run_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='offer',
+            index=models.Index(fields=['hotel', 'scraped_at'], name='offer_hotel_scraped_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='offer',
+            index=models.Index(fields=['run', 'scraped_at', 'id'], name='offer_run_scraped_idx'),
+        ),
+        migrations.RunPython(backfill_runs_and_offers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.4 on 2026-10-18 11:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Append-only raw observations, one partition per day (created by hotel_search.price_history).
+# No FK to hotel: inserts stay cheap and old days go away with DROP TABLE, not DELETE.
+CREATE_OBSERVATIONS = """
+CREATE TABLE hotel_search_price_observation (
+    hotel_id bigint NOT NULL,
+    source varchar(100) NOT NULL,
+    price_amount numeric(12, 2) NOT NULL,
+    currency varchar(3) NOT NULL DEFAULT '',
+    observed_at timestamptz NOT NULL
+) PARTITION BY RANGE (observed_at);
+CREATE INDEX hotel_search_price_observation_observed_brin
+    ON hotel_search_price_observation USING brin (observed_at);
+"""
+DROP_OBSERVATIONS = "DROP TABLE IF EXISTS hotel_search_price_observation CASCADE;"
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hotel_search', '0005_searchrun_offer'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PriceRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=100)),
+                ('granularity', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day')], max_length=4)),
+                ('bucket_start', models.DateTimeField()),
+                ('currency', models.CharField(blank=True, default='', help_text="ISO 4217 code; '' if unknown", max_length=3)),
+                ('min_price', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('avg_price', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('max_price', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('sample_count', models.PositiveIntegerField()),
+                ('hotel', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='price_rollups', to='hotel_search.hotel')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('hotel', 'granularity', 'bucket_start', 'currency'), name='price_rollup_bucket_uniq')],
+            },
+        ),
+        migrations.RunSQL(CREATE_OBSERVATIONS, DROP_OBSERVATIONS),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.4 on 2026-10-18 11:34
+
+import django.contrib.postgres.fields
+import django.contrib.postgres.indexes
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hotel_search', '0006_price_history'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Property',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(help_text='Name as first seen', max_length=512)),
+                ('normalized_name', models.CharField(max_length=512)),
+                ('normalized_location', models.CharField(blank=True, default='', max_length=512)),
+                ('block_keys', django.contrib.postgres.fields.ArrayField(base_field=models.CharField(max_length=16), default=list, help_text='MinHash-LSH band keys of normalized_name', size=None)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name_plural': 'properties',
+                'indexes': [django.contrib.postgres.indexes.GinIndex(fields=['block_keys'], name='property_block_keys_gin')],
+            },
+        ),
+        migrations.AddField(
+            model_name='hotel',
+            name='property',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='hotels', to='hotel_search.property'),
+        ),
+    ]
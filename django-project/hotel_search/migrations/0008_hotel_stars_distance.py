@@ -0,0 +1,23 @@
+# Generated by Django 5.2.4 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hotel_search', '0007_property'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='hotel',
+            name='distance_km',
+            field=models.FloatField(blank=True, help_text='Distance to the city centre', null=True),
+        ),
+        migrations.AddField(
+            model_name='hotel',
+            name='stars',
+            field=models.PositiveSmallIntegerField(blank=True, help_text='Star class, 1-5', null=True),
+        ),
+    ]
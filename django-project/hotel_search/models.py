@@ -1,6 +1,11 @@
+import re
+import unicodedata
 from django.db import models
 from django.conf import settings
 from django.contrib.auth.models import AbstractUser
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
+from django.utils import timezone
 
 class Customer(AbstractUser):
     email = models.EmailField(unique=True)
@@ -12,19 +17,47 @@ class Customer(AbstractUser):
         return self.username
 
 
+class Property(models.Model):
+    """
+    A real-world hotel. Hotel rows from different sources that describe the same place
+    link to one Property (see hotel_search/entity_resolution.py).
+    """
+    name = models.CharField(max_length=512, help_text="Name as first seen")
+    normalized_name = models.CharField(max_length=512)
+    normalized_location = models.CharField(max_length=512, blank=True, default='')
+    block_keys = ArrayField(models.CharField(max_length=16), default=list, help_text="MinHash-LSH band keys of normalized_name")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.name
+
+    class Meta:
+        verbose_name_plural = 'properties'
+        indexes = [
+            # Candidate lookup: WHERE block_keys && ARRAY[...]
+            GinIndex(fields=['block_keys'], name='property_block_keys_gin'),
+        ]
+        app_label = 'hotel_search'
+
 class Hotel(models.Model):
     """
     Stores individual hotel data scraped from a source.
     """
-    search_task_id = models.CharField(max_length=255, help_text="Celery task ID for the search")
+    search_task_id = models.CharField(max_length=255, help_text="Celery task ID of the last search that found it; per-search results are Offers")
     name = models.CharField(max_length=512)
     location = models.CharField(max_length=512, null=True, blank=True)
-    price = models.CharField(max_length=100, null=True, blank=True)
+    price = models.CharField(max_length=100, null=True, blank=True, help_text="Price as displayed by the source")
+    price_amount = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True, help_text="Parsed once at ingest")
+    currency = models.CharField(max_length=3, null=True, blank=True, help_text="ISO 4217 code")
     rating = models.CharField(max_length=50, null=True, blank=True)
+    stars = models.PositiveSmallIntegerField(null=True, blank=True, help_text="Star class, 1-5")
+    distance_km = models.FloatField(null=True, blank=True, help_text="Distance to the city centre")
     image_url = models.URLField(max_length=2048, null=True, blank=True)
     hotel_url = models.URLField(max_length=2048, null=True, blank=True)
     source = models.CharField(max_length=100) # e.g., 'Booking.com', 'Agoda'
+    property = models.ForeignKey(Property, on_delete=models.SET_NULL, null=True, blank=True, related_name='hotels')
     scraped_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, help_text="Last insert or update")
 
     def __str__(self):
         return f"{self.name} from {self.source}"
@@ -34,6 +67,82 @@ class Hotel(models.Model):
         unique_together = ('name', 'location', 'source')
         app_label = 'hotel_search'
 
+class SearchRun(models.Model):
+    """
+    One search (the run_spiders_for_query Celery task) and the filters it ran with.
+    """
+    task_id = models.CharField(max_length=255, unique=True, help_text="Celery task ID of run_spiders_for_query")
+    city = models.CharField(max_length=255)
+    price = models.CharField(max_length=50, null=True, blank=True, help_text="Price filter as submitted")
+    rating = models.CharField(max_length=50, null=True, blank=True, help_text="Rating filter as submitted")
+    checkin = models.DateField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Search {self.task_id} for {self.city}"
+
+    class Meta:
+        ordering = ['-created_at']
+        app_label = 'hotel_search'
+
+class Offer(models.Model):
+    """
+    A hotel's price as seen by one search run. Append-only: a hotel found again by
+    another run gets a new Offer, so overlapping searches never overwrite each other.
+    """
+    # Both FKs are covered by the composite indexes below; no extra single-column indexes.
+    run = models.ForeignKey(SearchRun, on_delete=models.CASCADE, related_name='offers', db_index=False)
+    hotel = models.ForeignKey(Hotel, on_delete=models.CASCADE, related_name='offers', db_index=False)
+    price = models.CharField(max_length=100, null=True, blank=True, help_text="Price as displayed by the source")
+    price_amount = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+    currency = models.CharField(max_length=3, null=True, blank=True, help_text="ISO 4217 code")
+    rating = models.CharField(max_length=50, null=True, blank=True)
+    scraped_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.hotel} at {self.price} (run {self.run_id})"
+
+    class Meta:
+        indexes = [
+            # All offers of a run, cheapest first: WHERE run_id = ? ORDER BY price_amount
+            models.Index(fields=['run', 'price_amount'], name='offer_run_price_idx'),
+            # Price history of a hotel: WHERE hotel_id = ? ORDER BY scraped_at
+            models.Index(fields=['hotel', 'scraped_at'], name='offer_hotel_scraped_idx'),
+            # Keyset scan for poll deltas: WHERE run_id = ? AND (scraped_at, id) > (?, ?)
+            models.Index(fields=['run', 'scraped_at', 'id'], name='offer_run_scraped_idx'),
+        ]
+        app_label = 'hotel_search'
+
+class PriceRollup(models.Model):
+    """
+    Min/avg/max price of a hotel per hour or day, aggregated from the partitioned
+    raw price history (see hotel_search/price_history.py).
+    """
+    HOUR = 'hour'
+    DAY = 'day'
+    GRANULARITY_CHOICES = [(HOUR, 'Hour'), (DAY, 'Day')]
+
+    hotel = models.ForeignKey(Hotel, on_delete=models.CASCADE, related_name='price_rollups', db_index=False)
+    source = models.CharField(max_length=100)
+    granularity = models.CharField(max_length=4, choices=GRANULARITY_CHOICES)
+    bucket_start = models.DateTimeField()
+    currency = models.CharField(max_length=3, blank=True, default='', help_text="ISO 4217 code; '' if unknown")
+    min_price = models.DecimalField(max_digits=12, decimal_places=2)
+    avg_price = models.DecimalField(max_digits=12, decimal_places=2)
+    max_price = models.DecimalField(max_digits=12, decimal_places=2)
+    sample_count = models.PositiveIntegerField()
+
+    def __str__(self):
+        return f"{self.hotel_id} {self.granularity} {self.bucket_start:%Y-%m-%d %H:%M}: {self.min_price}-{self.max_price}"
+
+    class Meta:
+        constraints = [
+            # Upsert target of the rollup jobs, and the index behind price trend queries:
+            # WHERE hotel_id = ? AND granularity = ? AND bucket_start >= ?
+            models.UniqueConstraint(fields=['hotel', 'granularity', 'bucket_start', 'currency'], name='price_rollup_bucket_uniq'),
+        ]
+        app_label = 'hotel_search'
+
 class Bookmark(models.Model):
     """
     Connects a user to a bookmarked hotel.
@@ -47,4 +156,48 @@ class Bookmark(models.Model):
 
     class Meta:
         unique_together = ('user', 'hotel')
-        app_label = 'hotel_search'
\ No newline at end of file
+        app_label = 'hotel_search'
+
+
+class AgodaCity(models.Model):
+    """
+    An Agoda city ID, resolved once (via a browser) and kept for good.
+    """
+    agoda_city_id = models.CharField(max_length=32, unique=True)
+    name = models.CharField(max_length=255, help_text="City name as it was first searched")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.agoda_city_id})"
+
+    class Meta:
+        verbose_name_plural = 'Agoda cities'
+        app_label = 'hotel_search'
+
+class AgodaCityAlias(models.Model):
+    """
+    A normalized city name (e.g. 'new york', 'nyc', 'sao paulo') that resolves to an AgodaCity.
+    """
+    alias = models.CharField(max_length=255, unique=True)
+    city = models.ForeignKey(AgodaCity, on_delete=models.CASCADE, related_name='aliases')
+
+    @staticmethod
+    def normalize(name):
+        """
+        Case-, accent-, punctuation- and whitespace-insensitive form of a city name:
+        ' São-Paulo ' -> 'sao paulo'.
+        """
+        decomposed = unicodedata.normalize('NFKD', str(name or ''))
+        without_accents = ''.join(c for c in decomposed if not unicodedata.combining(c))
+        return ' '.join(re.sub(r'[\W_]+', ' ', without_accents.casefold()).split())
+
+    def save(self, *args, **kwargs):
+        self.alias = self.normalize(self.alias)
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.alias} -> {self.city.agoda_city_id}"
+
+    class Meta:
+        verbose_name_plural = 'Agoda city aliases'
+        app_label = 'hotel_search'
@@ -0,0 +1,228 @@
+# django-project/hotel_search/price_history.py
+"""
+Append-only price history with hourly/daily rollups.
+
+Every priced offer the pipeline stores is also appended to
+`hotel_search_price_observation`, a table natively partitioned by day
+(RANGE on observed_at, one `hotel_search_price_observation_pYYYYMMDD`
+partition per UTC day). On top of it:
+
+    rollup_hourly / rollup_daily - idempotent INSERT ... ON CONFLICT upserts into
+                                   PriceRollup (min/avg/max/count per hotel, source,
+                                   currency and bucket), run by a periodic Celery task
+    drop_expired_partitions     - retention: whole days are dropped with DROP TABLE
+    price_trend                 - reads a hotel's trend from the rollups only, one
+                                  range scan of price_rollup_bucket_uniq
+
+Raw rows are never read by user-facing requests, so they can grow to hundreds of
+millions without slowing the trend API down.
+"""
+import re
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+from loguru import logger as LOGGER
+
+from .models import PriceRollup
+
+OBSERVATION_TABLE = 'hotel_search_price_observation'
+ROLLUP_TABLE = PriceRollup._meta.db_table
+_PARTITION_RE = re.compile(rf'^{OBSERVATION_TABLE}_p(\d{{8}})$')
+
+# Partitions this process has already made sure exist.
+_known_partitions = set()
+
+
+def partition_name(day):
+    return f"{OBSERVATION_TABLE}_p{day:%Y%m%d}"
+
+
+def _day_start(day):
+    return datetime.combine(day, time.min, tzinfo=dt_timezone.utc)
+
+
+def ensure_partition(day):
+    """
+    Creates the partition for `day` (UTC) if it does not exist yet.
+    """
+    name = partition_name(day)
+    if name in _known_partitions:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT to_regclass(%s)", [name])
+        if cursor.fetchone()[0] is not None:
+            _known_partitions.add(name)
+            return
+        # Not cached yet: the surrounding transaction may still roll the CREATE back.
+        # DDL takes no bind parameters; the bounds are formatted from date objects.
+        cursor.execute(
+            f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {OBSERVATION_TABLE} "
+            f"FOR VALUES FROM ('{_day_start(day).isoformat()}') TO ('{_day_start(day + timedelta(days=1)).isoformat()}')"
+        )
+    LOGGER.info(f"Created price history partition {name}")
+
+
+def ensure_partitions(days_ahead=None):
+    """
+    Creates the partitions for today and the next `days_ahead` days, so ingest never waits on DDL.
+    """
+    days_ahead = settings.PRICE_HISTORY_PARTITIONS_AHEAD if days_ahead is None else days_ahead
+    today = timezone.now().date()
+    for offset in range(days_ahead + 1):
+        ensure_partition(today + timedelta(days=offset))
+
+
+def record_observations(offers):
+    """
+    Appends the priced offers to the raw history. Called inside the pipeline's
+    transaction; offers must have `hotel` attached.
+    """
+    rows = [
+        (offer.hotel_id, offer.hotel.source, offer.price_amount, offer.currency or '', offer.scraped_at)
+        for offer in offers
+        if offer.price_amount is not None
+    ]
+    if not rows:
+        return 0
+    for day in {observed_at.astimezone(dt_timezone.utc).date() for *_, observed_at in rows}:
+        ensure_partition(day)
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"INSERT INTO {OBSERVATION_TABLE} (hotel_id, source, price_amount, currency, observed_at) "
+            f"VALUES (%s, %s, %s, %s, %s)",
+            rows,
+        )
+    return len(rows)
+
+
+def rollup_hourly(since, until):
+    """
+    (Re)computes the hourly rollups of every hour in [since, until) from the raw observations.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO {ROLLUP_TABLE}
+                (hotel_id, source, granularity, bucket_start, currency, min_price, avg_price, max_price, sample_count)
+            SELECT hotel_id, source, %s, date_trunc('hour', observed_at), currency,
+                   min(price_amount), round(avg(price_amount), 2), max(price_amount), count(*)
+            FROM {OBSERVATION_TABLE}
+            WHERE observed_at >= date_trunc('hour', %s::timestamptz) AND observed_at < %s
+            GROUP BY hotel_id, source, date_trunc('hour', observed_at), currency
+            ON CONFLICT (hotel_id, granularity, bucket_start, currency) DO UPDATE SET
+                min_price = EXCLUDED.min_price,
+                avg_price = EXCLUDED.avg_price,
+                max_price = EXCLUDED.max_price,
+                sample_count = EXCLUDED.sample_count
+            """,
+            [PriceRollup.HOUR, since, until],
+        )
+        return cursor.rowcount
+
+
+def rollup_daily(since, until):
+    """
+    (Re)computes the daily rollups of every UTC day in [since, until) from the hourly rollups.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO {ROLLUP_TABLE}
+                (hotel_id, source, granularity, bucket_start, currency, min_price, avg_price, max_price, sample_count)
+            SELECT hotel_id, source, %s, date_trunc('day', bucket_start, 'UTC'), currency,
+                   min(min_price), round(sum(avg_price * sample_count) / sum(sample_count), 2),
+                   max(max_price), sum(sample_count)
+            FROM {ROLLUP_TABLE}
+            WHERE granularity = %s
+              AND bucket_start >= date_trunc('day', %s::timestamptz, 'UTC') AND bucket_start < %s
+            GROUP BY hotel_id, source, date_trunc('day', bucket_start, 'UTC'), currency
+            ON CONFLICT (hotel_id, granularity, bucket_start, currency) DO UPDATE SET
+                min_price = EXCLUDED.min_price,
+                avg_price = EXCLUDED.avg_price,
+                max_price = EXCLUDED.max_price,
+                sample_count = EXCLUDED.sample_count
+            """,
+            [PriceRollup.DAY, PriceRollup.HOUR, since, until],
+        )
+        return cursor.rowcount
+
+
+def rollup_recent(now=None):
+    """
+    Refreshes the rollups touched by recent ingest: the last PRICE_HISTORY_ROLLUP_LOOKBACK_HOURS
+    hours, and every day those hours fall in. Safe to run as often as you like.
+    """
+    now = now or timezone.now()
+    since = now - timedelta(hours=settings.PRICE_HISTORY_ROLLUP_LOOKBACK_HOURS)
+    hourly = rollup_hourly(since, now)
+    daily = rollup_daily(since, now)
+    return hourly, daily
+
+
+def existing_partitions():
+    """
+    Returns {day: partition name} for the partitions of the raw history table.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE parent.relname = %s",
+            [OBSERVATION_TABLE],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+    partitions = {}
+    for name in names:
+        match = _PARTITION_RE.match(name)
+        if match:
+            partitions[datetime.strptime(match.group(1), '%Y%m%d').date()] = name
+    return partitions
+
+
+def drop_expired_partitions(retain_days=None, today=None):
+    """
+    Drops raw partitions older than `retain_days` days. Their data only lives on in the rollups.
+    """
+    retain_days = settings.PRICE_HISTORY_RAW_RETENTION_DAYS if retain_days is None else retain_days
+    cutoff = (today or timezone.now().date()) - timedelta(days=retain_days)
+    dropped = []
+    for day, name in sorted(existing_partitions().items()):
+        if day >= cutoff:
+            continue
+        # Make sure nothing in the partition misses its rollup before it goes.
+        rollup_hourly(_day_start(day), _day_start(day + timedelta(days=1)))
+        rollup_daily(_day_start(day), _day_start(day + timedelta(days=1)))
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {name}")
+        _known_partitions.discard(name)
+        dropped.append(name)
+        LOGGER.info(f"Dropped price history partition {name}")
+    return dropped
+
+
+def drop_expired_hourly_rollups(retain_days=None):
+    """
+    Hourly rollups are kept for PRICE_HISTORY_HOURLY_RETENTION_DAYS; daily ones are kept for good.
+    """
+    retain_days = settings.PRICE_HISTORY_HOURLY_RETENTION_DAYS if retain_days is None else retain_days
+    cutoff = timezone.now() - timedelta(days=retain_days)
+    deleted, _ = PriceRollup.objects.filter(granularity=PriceRollup.HOUR, bucket_start__lt=cutoff).delete()
+    return deleted
+
+
+def price_trend(hotel_id, days=90, granularity=PriceRollup.DAY):
+    """
+    Returns the hotel's price per bucket over the last `days` days, oldest first.
+    """
+    since = timezone.now() - timedelta(days=days)
+    if granularity == PriceRollup.DAY:
+        since = _day_start(since.astimezone(dt_timezone.utc).date())
+    rollups = PriceRollup.objects.filter(
+        hotel_id=hotel_id, granularity=granularity, bucket_start__gte=since,
+    ).order_by('bucket_start').values(
+        'bucket_start', 'currency', 'min_price', 'avg_price', 'max_price', 'sample_count', 'source',
+    )
+    return list(rollups)
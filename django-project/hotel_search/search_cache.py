@@ -0,0 +1,125 @@
+# django-project/hotel_search/search_cache.py
+"""
+Search-result cache and single-flight coalescing for identical searches.
+
+A normalized query (city, price, rating, checkin) maps to the task ID of the
+search that crawls it. The mapping lives in the Redis cache for
+SEARCH_RESULT_CACHE_TTL seconds and is claimed atomically with `cache.add`
+(Redis SET NX), so:
+
+- concurrent identical searches attach to the one running task group instead
+  of starting duplicate crawls, and
+- repeated searches within the TTL are served from the results already
+  scraped for that task ID.
+
+A cached search is dropped instead of served once it is known to be dead: its
+task failed, every spider reported FAILURE, or all spiders finished without
+recording a single hotel. run_spiders_for_query succeeds as soon as it has
+dispatched the spiders, so their outcome comes from the per-spider statuses
+that individual_spider_task publishes (search_events.py).
+
+Because the caller simply gets the shared task ID back, the results page and
+the poll endpoint serve a coalesced search without any special casing.
+"""
+import hashlib
+import uuid
+from decimal import Decimal, InvalidOperation
+
+from celery.result import AsyncResult
+from django.conf import settings
+from django.core.cache import cache
+from loguru import logger as LOGGER
+
+from .models import Offer
+from .search_events import get_spider_statuses
+
+CACHE_KEY_PREFIX = 'hotel_search:query:v1:'
+
+
+def _normalize_number(value):
+    """
+    '150', ' 150.00 ' and 150 all normalize to '150'; blanks and junk to ''.
+    """
+    if value is None:
+        return ''
+    try:
+        number = Decimal(str(value).strip())
+    except InvalidOperation:
+        return ''
+    return format(number.normalize(), 'f')
+
+
+def normalize_query(city, price=None, rating=None, checkin=None):
+    """
+    Returns the canonical form of a search, used as the cache identity.
+    """
+    return (
+        ' '.join(str(city or '').split()).casefold(),
+        _normalize_number(price),
+        _normalize_number(rating),
+        str(checkin or ''),
+    )
+
+
+def search_cache_key(city, price=None, rating=None, checkin=None):
+    digest = hashlib.sha256('|'.join(normalize_query(city, price, rating, checkin)).encode()).hexdigest()
+    return f'{CACHE_KEY_PREFIX}{digest}'
+
+
+def search_is_dead(task_id):
+    """
+    True if the search can't produce results: its task failed, or all of its spiders
+    have finished and either every one failed or none recorded a hotel.
+    """
+    if AsyncResult(task_id).status == 'FAILURE':
+        return True
+    statuses = get_spider_statuses(task_id)
+    if statuses is None:
+        return False # Redis unavailable: keep serving rather than start duplicate crawls
+    expected, finished = statuses
+    if expected is None or len(finished) < expected:
+        return False # still running
+    if all(status['status'] == 'FAILURE' for status in finished.values()):
+        return True
+    return not Offer.objects.filter(run__task_id=task_id).exists()
+
+
+def get_or_start_search(city, price=None, rating=None, checkin=None, start_search=None):
+    """
+    Returns `(task_id, coalesced)` for the search.
+
+    `start_search(task_id)` is called to launch a crawl under the given task ID, only
+    when no live or cached search exists for the same normalized query.
+    """
+    key = search_cache_key(city, price, rating, checkin)
+    ttl = settings.SEARCH_RESULT_CACHE_TTL
+
+    for _ in range(2):
+        task_id = str(uuid.uuid4())
+        # Atomic claim: only one of N concurrent identical searches wins the key.
+        if cache.add(key, task_id, timeout=ttl):
+            try:
+                start_search(task_id)
+            except Exception:
+                cache.delete(key) # don't leave other searches waiting on a task that never started
+                raise
+            LOGGER.info(f"Started search {task_id} for {normalize_query(city, price, rating, checkin)}")
+            return task_id, False
+
+        existing_task_id = cache.get(key)
+        if existing_task_id is None:
+            continue # expired between add() and get(); try to claim it again
+
+        if search_is_dead(existing_task_id):
+            # Never keep serving a failed or empty crawl; drop it and start a fresh one.
+            LOGGER.warning(f"Cached search {existing_task_id} failed or found nothing; starting a new one.")
+            cache.delete(key)
+            continue
+
+        LOGGER.info(f"Coalesced search for {normalize_query(city, price, rating, checkin)} onto {existing_task_id}")
+        return existing_task_id, True
+
+    # Lost every race (pathological churn on the key): run uncached rather than fail the user.
+    task_id = str(uuid.uuid4())
+    start_search(task_id)
+    return task_id, False
@@ -0,0 +1,264 @@
+# django-project/hotel_search/search_events.py
+"""
+Server-pushed search progress over Redis pub/sub.
+
+Producers (sync, run in Celery workers and crawler processes):
+    publish_search_started - run_spiders_for_query announces which spiders will run
+    publish_offers         - the pipeline publishes offers right after persisting them
+    publish_spider_status  - individual_spider_task publishes one final status per spider
+    publish_spider_progress - individual_spider_task relays a running crawl's progress
+
+Every publish except progress also bumps a per-search version counter, which the
+poll endpoint uses as its ETag so an unchanged poll is answered from Redis alone
+(progress doesn't change what a poll returns).
+
+Consumer:
+    search_event_stream / async_search_event_stream - Server-Sent Events for one search,
+    used by the `stream_search_results` view (async under ASGI, sync under WSGI).
+
+Events published before a browser connects are not lost: the stream subscribes
+first, then replays the hotels already in the DB and the per-spider statuses
+kept in a Redis hash, and only then follows the live channel.
+"""
+import json
+import time
+
+import redis
+from django.conf import settings
+from loguru import logger as LOGGER
+
+HOTEL_EVENT_FIELDS = ('name', 'location', 'stars', 'distance_km', 'image_url', 'hotel_url', 'source')
+OFFER_EVENT_FIELDS = ('price', 'price_amount', 'currency', 'rating')
+
+_redis_client = None
+
+
+def channel_name(task_id):
+    return f"hotel_search:events:{task_id}"
+
+
+def status_key(task_id):
+    """
+    Redis hash of spider name -> final status JSON, plus the '__expected__' spider count.
+    """
+    return f"hotel_search:status:{task_id}"
+
+
+def version_key(task_id):
+    """
+    Counter bumped whenever anything visible about the search changes (cheap ETag source).
+    """
+    return f"hotel_search:version:{task_id}"
+
+
+def get_redis():
+    global _redis_client
+    if _redis_client is None:
+        _redis_client = redis.Redis.from_url(settings.SEARCH_EVENTS_REDIS_URL)
+    return _redis_client
+
+
+def offer_to_event(offer):
+    """
+    One hotel card: the hotel's details with this run's price. `id` stays the hotel ID (used for bookmarks).
+    """
+    event = {'id': offer.hotel_id, 'offer_id': offer.id, 'property_id': offer.hotel.property_id}
+    event.update({field: getattr(offer.hotel, field) for field in HOTEL_EVENT_FIELDS})
+    event.update({field: getattr(offer, field) for field in OFFER_EVENT_FIELDS})
+    return event
+
+
+def get_search_version(task_id):
+    """
+    Returns the search's change counter (0 before the first change), or None if Redis is unavailable.
+    """
+    try:
+        return int(get_redis().get(version_key(task_id)) or 0)
+    except redis.RedisError as e:
+        LOGGER.warning(f"Could not read version of search {task_id}: {e}")
+        return None
+
+
+def _publish(task_id, event_type, data):
+    try:
+        pipe = get_redis().pipeline()
+        pipe.incr(version_key(task_id))
+        pipe.expire(version_key(task_id), settings.SEARCH_EVENTS_TTL)
+        pipe.publish(channel_name(task_id), json.dumps({'event': event_type, 'data': data}, default=str))
+        pipe.execute()
+    except redis.RedisError as e:
+        # Streaming is best-effort: the DB stays the source of truth for polling clients.
+        LOGGER.warning(f"Could not publish {event_type} event for search {task_id}: {e}")
+
+
+def publish_search_started(task_id, spider_names):
+    try:
+        pipe = get_redis().pipeline()
+        pipe.hset(status_key(task_id), '__expected__', len(spider_names))
+        pipe.expire(status_key(task_id), settings.SEARCH_EVENTS_TTL)
+        pipe.execute()
+    except redis.RedisError as e:
+        LOGGER.warning(f"Could not record spiders for search {task_id}: {e}")
+
+
+def publish_offers(offers):
+    """
+    Publishes persisted Offer rows (with `run` and `hotel` attached), one pub/sub message per search.
+    """
+    by_task = {}
+    for offer in offers:
+        by_task.setdefault(offer.run.task_id, []).append(offer_to_event(offer))
+    for task_id, events in by_task.items():
+        _publish(task_id, 'hotels', events)
+
+
+def publish_spider_status(task_id, spider_name, status, error=None):
+    data = {'spider': spider_name, 'status': status, 'error': error}
+    try:
+        pipe = get_redis().pipeline()
+        pipe.hset(status_key(task_id), spider_name, json.dumps(data))
+        pipe.expire(status_key(task_id), settings.SEARCH_EVENTS_TTL)
+        pipe.execute()
+    except redis.RedisError as e:
+        LOGGER.warning(f"Could not record {spider_name} status for search {task_id}: {e}")
+    _publish(task_id, 'spider_status', data)
+
+
+def publish_spider_progress(task_id, spider_name, progress):
+    """
+    Relays a progress event of a running crawl (pages, items, current page). Live-only:
+    not kept for replay and not counted as a change of the search.
+    """
+    data = dict(progress, spider=spider_name)
+    try:
+        get_redis().publish(channel_name(task_id), json.dumps({'event': 'spider_progress', 'data': data}, default=str))
+    except redis.RedisError as e:
+        LOGGER.warning(f"Could not publish {spider_name} progress for search {task_id}: {e}")
+
+
+def get_spider_statuses(task_id):
+    """
+    Returns (expected spider count or None, {spider name: final status}) of a search,
+    or None if Redis is unavailable.
+    """
+    try:
+        raw = _decode_hash(get_redis().hgetall(status_key(task_id)))
+    except redis.RedisError as e:
+        LOGGER.warning(f"Could not read spider statuses of search {task_id}: {e}")
+        return None
+    expected = raw.pop('__expected__', None)
+    return (int(expected) if expected is not None else None), {name: json.loads(payload) for name, payload in raw.items()}
+
+
+def format_sse(event_type, data):
+    return f"event: {event_type}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+class SearchStreamState:
+    """
+    What one stream has sent so far; shared by the sync and async generators.
+    """
+
+    def __init__(self, bookmarked_hotel_ids):
+        self.bookmarked_hotel_ids = set(bookmarked_hotel_ids)
+        self.expected_spiders = None
+        self.finished_spiders = {}
+
+    def hotel_events(self, hotels):
+        for hotel in hotels:
+            yield format_sse('hotel', dict(hotel, is_bookmarked=hotel['id'] in self.bookmarked_hotel_ids))
+
+    def status_events(self, raw_statuses):
+        """
+        Takes the decoded status hash and yields events for spiders not reported yet.
+        """
+        if '__expected__' in raw_statuses:
+            self.expected_spiders = int(raw_statuses['__expected__'])
+        for spider_name, payload in raw_statuses.items():
+            if spider_name == '__expected__' or spider_name in self.finished_spiders:
+                continue
+            status = json.loads(payload)
+            self.finished_spiders[spider_name] = status
+            yield format_sse('spider_status', status)
+
+    def handle_message(self, message):
+        payload = json.loads(message)
+        if payload['event'] == 'hotels':
+            yield from self.hotel_events(payload['data'])
+        elif payload['event'] == 'spider_status' and payload['data']['spider'] not in self.finished_spiders:
+            self.finished_spiders[payload['data']['spider']] = payload['data']
+            yield format_sse('spider_status', payload['data'])
+        elif payload['event'] == 'spider_progress' and payload['data']['spider'] not in self.finished_spiders:
+            yield format_sse('spider_progress', payload['data'])
+
+    @property
+    def done(self):
+        return self.expected_spiders is not None and len(self.finished_spiders) >= self.expected_spiders
+
+    def done_event(self):
+        failed = [s for s in self.finished_spiders.values() if s['status'] != 'SUCCESS']
+        status = 'FAILURE' if failed and len(failed) == len(self.finished_spiders) else 'SUCCESS'
+        error = "Some spiders failed: " + "; ".join(str(s['error']) for s in failed) if failed else None
+        return format_sse('done', {'status': status, 'error': error})
+
+
+def _decode_hash(raw):
+    return {key.decode(): value.decode() for key, value in raw.items()}
+
+
+def search_event_stream(task_id, snapshot_hotels, bookmarked_hotel_ids):
+    """
+    Blocking SSE generator (WSGI). `snapshot_hotels` returns the hotels already stored.
+    """
+    state = SearchStreamState(bookmarked_hotel_ids)
+    client = get_redis()
+    pubsub = client.pubsub(ignore_subscribe_messages=True)
+    pubsub.subscribe(channel_name(task_id))
+    try:
+        yield from state.hotel_events(snapshot_hotels())
+        yield from state.status_events(_decode_hash(client.hgetall(status_key(task_id))))
+
+        started = last_sent = time.monotonic()
+        while not state.done and time.monotonic() - started < settings.SEARCH_EVENTS_STREAM_TIMEOUT:
+            message = pubsub.get_message(timeout=1.0)
+            if message and message['type'] == 'message':
+                yield from state.handle_message(message['data'])
+                last_sent = time.monotonic()
+            elif time.monotonic() - last_sent > settings.SEARCH_EVENTS_HEARTBEAT:
+                yield ": keep-alive\n\n"
+                last_sent = time.monotonic()
+        yield state.done_event()
+    finally:
+        pubsub.close()
+
+
+async def async_search_event_stream(task_id, snapshot_hotels, bookmarked_hotel_ids):
+    """
+    Non-blocking SSE generator (ASGI). `snapshot_hotels` is awaited for the stored hotels.
+    """
+    import redis.asyncio as aioredis
+
+    state = SearchStreamState(bookmarked_hotel_ids)
+    client = aioredis.Redis.from_url(settings.SEARCH_EVENTS_REDIS_URL)
+    pubsub = client.pubsub(ignore_subscribe_messages=True)
+    await pubsub.subscribe(channel_name(task_id))
+    try:
+        for event in state.hotel_events(await snapshot_hotels()):
+            yield event
+        for event in state.status_events(_decode_hash(await client.hgetall(status_key(task_id)))):
+            yield event
+
+        started = last_sent = time.monotonic()
+        while not state.done and time.monotonic() - started < settings.SEARCH_EVENTS_STREAM_TIMEOUT:
+            message = await pubsub.get_message(timeout=1.0)
+            if message and message['type'] == 'message':
+                for event in state.handle_message(message['data']):
+                    yield event
+                last_sent = time.monotonic()
+            elif time.monotonic() - last_sent > settings.SEARCH_EVENTS_HEARTBEAT:
+                yield ": keep-alive\n\n"
+                last_sent = time.monotonic()
+        yield state.done_event()
+    finally:
+        await pubsub.close()
+        await client.close()
@@ -27,31 +27,41 @@ const errorMessage = document.getElementById('error-message');
 const errorDetails = document.getElementById('error-details');
 const hotelCardTemplate = document.getElementById('hotel-card-template');
 
+// Polls for hotels added or changed since the last cursor. The server answers 304 (no body)
+// while nothing changed, so idle polls cost almost nothing.
 function startPolling(pollUrl, hotelsGrid, loadingSpinner, noResultsMessage, cardTemplate, csrfToken) {
-    const interval = setInterval(() => {
-        fetch(pollUrl)
+    const bestHotels = new Map(); // property (same hotel across sources) -> {hotel, card}
+    let cursor = '';
+    let etag = null;
+
+    const poll = () => {
+        fetch(`${pollUrl}?cursor=${encodeURIComponent(cursor)}`, {headers: etag ? {'If-None-Match': etag} : {}})
             .then(response => {
+                if (response.status === 304) {
+                    return null; // Nothing changed since the last poll.
+                }
                 if (!response.ok) {
                     throw new Error(`HTTP error! status: ${response.status}`);
                 }
+                etag = response.headers.get('ETag');
                 return response.json();
             })
             .then(data => {
-                // Always update the UI with the latest data on each poll.
-                if (data.hotels && data.hotels.length > 0) {
-                    loadingIndicator.classList.add('hidden');
-                    noResultsMessage.classList.add('hidden');
-                    updateHotelsGrid(data.hotels, hotelsGrid, cardTemplate, csrfToken);
-                    hotelsGrid.classList.remove('hidden');
+                if (!data) {
+                    setTimeout(poll, 5000);
+                    return;
                 }
+                cursor = data.cursor;
+
+                // Merge the delta into what is already shown.
+                data.hotels.forEach(hotel => showHotel(bestHotels, hotel, hotelsGrid, cardTemplate, csrfToken));
 
-                // Stop polling only when the task is fully complete (SUCCESS or FAILURE).
-                if (data.status === 'SUCCESS' || data.status === 'FAILURE') {
-                    clearInterval(interval);
+                // Stop polling only when the task is fully complete (SUCCESS or FAILURE) and fully read.
+                if ((data.status === 'SUCCESS' || data.status === 'FAILURE') && !data.has_more) {
                     loadingIndicator.classList.add('hidden'); // Ensure it's hidden at the end.
 
                     // If the task finished but we have no hotels, show the "no results" message.
-                    if (data.hotels.length === 0) {
+                    if (bestHotels.size === 0) {
                         noResultsMessage.classList.remove('hidden');
                     }
 
@@ -60,50 +70,123 @@ function startPolling(pollUrl, hotelsGrid, loadingSpinner, noResultsMessage, car
                         errorMessage.classList.remove('hidden');
                         errorDetails.textContent = data.error;
                     }
+                    return;
                 }
+                setTimeout(poll, data.has_more ? 0 : 5000); // Poll every 5 seconds, or drain the next page now
             })
             .catch(error => {
-                clearInterval(interval);
                 console.error('Error polling for results:', error);
                 loadingIndicator.classList.add('hidden');
                 errorMessage.classList.remove('hidden');
                 errorDetails.textContent = `Could not fetch results: ${error.message}. Please try again later.`;
             });
-    }, 5000); // Poll every 5 seconds
+    };
+    poll();
 }
 
-function updateHotelsGrid(hotels, hotelsGrid, cardTemplate, csrfToken) {
-    hotelsGrid.innerHTML = ''; // Clear previous results
-    hotels.forEach(hotel => {
-        const card = cardTemplate.content.cloneNode(true);
-        
-        card.querySelector('.hotel-image').src = hotel.image_url || 'https://placehold.co/600x400/E0F2F7/000000?text=No+Image';
-        card.querySelector('.hotel-name').textContent = hotel.name || 'N/A';
-        card.querySelector('.hotel-source').textContent = `Source: ${hotel.source || 'N/A'}`;
-        card.querySelector('.hotel-location').textContent = hotel.location || 'N/A';
-        card.querySelector('.hotel-price').textContent = hotel.price || 'N/A';
-        card.querySelector('.hotel-rating').textContent = hotel.rating || 'N/A';
-        card.querySelector('.hotel-url').href = hotel.hotel_url || '#';
-
-        const bookmarkBtn = card.querySelector('.bookmark-btn');
-        const bookmarkIcon = bookmarkBtn.querySelector('svg');
-        
-        if (hotel.is_bookmarked) {
-            bookmarkIcon.classList.add('text-red-500');
-            bookmarkIcon.setAttribute('fill', 'currentColor');
-        } else {
-            bookmarkIcon.classList.remove('text-red-500');
-            bookmarkIcon.setAttribute('fill', 'none');
-        }
+function buildHotelCard(hotel, cardTemplate, csrfToken) {
+    const card = cardTemplate.content.firstElementChild.cloneNode(true);
 
-        if (csrfToken) {
-            bookmarkBtn.addEventListener('click', () => toggleBookmark(hotel.id, bookmarkIcon, csrfToken));
-        } else {
-            bookmarkBtn.style.display = 'none';
-        }
+    card.querySelector('.hotel-image').src = hotel.image_url || 'https://placehold.co/600x400/E0F2F7/000000?text=No+Image';
+    card.querySelector('.hotel-name').textContent = hotel.name || 'N/A';
+    card.querySelector('.hotel-source').textContent = `Source: ${hotel.source || 'N/A'}`;
+    card.querySelector('.hotel-location').textContent = hotel.location || 'N/A';
+    card.querySelector('.hotel-price').textContent = hotel.price || 'N/A';
+    card.querySelector('.hotel-rating').textContent = hotel.rating || 'N/A';
+    card.querySelector('.hotel-url').href = hotel.hotel_url || '#';
+
+    const bookmarkBtn = card.querySelector('.bookmark-btn');
+    const bookmarkIcon = bookmarkBtn.querySelector('svg');
+    
+    if (hotel.is_bookmarked) {
+        bookmarkIcon.classList.add('text-red-500');
+        bookmarkIcon.setAttribute('fill', 'currentColor');
+    } else {
+        bookmarkIcon.classList.remove('text-red-500');
+        bookmarkIcon.setAttribute('fill', 'none');
+    }
+
+    if (csrfToken) {
+        bookmarkBtn.addEventListener('click', () => toggleBookmark(hotel.id, bookmarkIcon, csrfToken));
+    } else {
+        bookmarkBtn.style.display = 'none';
+    }
+
+    return card;
+}
+
+// The server sends price_amount already parsed (a decimal string); unpriced offers sort last.
+function offerPrice(hotel) {
+    const value = parseFloat(hotel.price_amount ?? '');
+    return Number.isNaN(value) ? Infinity : value;
+}
+
+// Keeps one card per property (the same hotel across sources): the best-priced offer seen so far.
+function showHotel(bestHotels, hotel, hotelsGrid, cardTemplate, csrfToken) {
+    const key = hotel.property_id ? `property:${hotel.property_id}` : `hotel:${hotel.id}`;
+    const current = bestHotels.get(key);
+    if (current && offerPrice(current.hotel) <= offerPrice(hotel) && current.hotel.id !== hotel.id) {
+        return; // we already show a cheaper offer for this hotel
+    }
+
+    const card = buildHotelCard(hotel, cardTemplate, csrfToken);
+    if (current) {
+        current.card.replaceWith(card);
+    } else {
+        hotelsGrid.prepend(card);
+    }
+    bestHotels.set(key, {hotel, card});
+
+    loadingIndicator.classList.add('hidden');
+    noResultsMessage.classList.add('hidden');
+    hotelsGrid.classList.remove('hidden');
+}
+
+// Receives hotels pushed by the server (Server-Sent Events).
+function startStreaming(streamUrl, pollUrl, hotelsGrid, loadingSpinner, noResultsMessage, cardTemplate, csrfToken) {
+    const source = new EventSource(streamUrl);
+    const bestHotels = new Map(); // property (same hotel across sources) -> {hotel, card}
+    let finished = false;
+
+    source.addEventListener('hotel', event => {
+        showHotel(bestHotels, JSON.parse(event.data), hotelsGrid, cardTemplate, csrfToken);
+    });
+
+    source.addEventListener('spider_status', event => {
+        const status = JSON.parse(event.data);
+        console.info(`Spider ${status.spider} finished: ${status.status}`);
+    });
 
-        hotelsGrid.appendChild(card);
+    source.addEventListener('spider_progress', event => {
+        const progress = JSON.parse(event.data);
+        console.debug(`Spider ${progress.spider}: ${progress.pages} pages, ${progress.items} hotels`);
     });
+
+    source.addEventListener('done', event => {
+        const data = JSON.parse(event.data);
+        finished = true;
+        source.close();
+        loadingIndicator.classList.add('hidden');
+
+        if (bestHotels.size === 0) {
+            noResultsMessage.classList.remove('hidden');
+        }
+        if (data.error) {
+            errorMessage.classList.remove('hidden');
+            errorDetails.textContent = data.error;
+        }
+    });
+
+    source.onerror = () => {
+        if (finished) {
+            return;
+        }
+        // The stream is unavailable (e.g. a server that cannot stream): fall back to polling.
+        console.warn('Result stream unavailable, falling back to polling.');
+        source.close();
+        hotelsGrid.innerHTML = ''; // polling starts from scratch
+        startPolling(pollUrl, hotelsGrid, loadingSpinner, noResultsMessage, cardTemplate, csrfToken);
+    };
 }
 
 function toggleBookmark(hotelId, iconElement, csrfToken) {
@@ -146,7 +229,17 @@ document.addEventListener('DOMContentLoaded', () => {
     const scriptTag = document.querySelector('script[src*="poll.js"]');
     const pageTaskId = scriptTag ? scriptTag.dataset.taskId : "{{ task_id }}";
 
-    if (pageTaskId && pageTaskId !== 'None') {
+    if (pageTaskId && pageTaskId !== 'None' && window.EventSource) {
+        startStreaming(
+            `/hotels/stream/${pageTaskId}/`,
+            `/hotels/status/${pageTaskId}/`,
+            resultsContainer,
+            loadingIndicator,
+            noResultsMessage,
+            hotelCardTemplate,
+            csrfToken
+        );
+    } else if (pageTaskId && pageTaskId !== 'None') {
         startPolling(
             `/hotels/status/${pageTaskId}/`,
             resultsContainer,
@@ -1,117 +1,332 @@
 # django-project/hotel_search/tasks.py
 from celery import shared_task, group
+from celery.signals import before_task_publish, task_postrun, task_prerun, worker_process_init
 import subprocess
 import os
+import time
 from django.conf import settings
 from pathlib import Path
 from datetime import datetime
+from .city_id_resolver import resolve_agoda_city_id
+from .crawler_runtime import CrawlerRuntimeUnavailable, get_runtime
+from .models import SearchRun
+from . import crawl_output, metrics, price_history, tracing
+from .search_events import publish_search_started, publish_spider_progress, publish_spider_status
 
 
-@shared_task(bind=True)
-def individual_spider_task(self, spider_name, city, price=None, rating=None, checkin=None, agoda_city_id=None):
+def build_spider_kwargs(
+    city, search_task_id, individual_task_id, price=None, rating=None, checkin=None, agoda_city_id=None,
+    traceparent=None, trace_launched_at=None,
+):
     """
-    A Celery task to run a single Scrapy spider with arguments.
-    It now passes the GROUP task ID (self.request.root_id) to the spider.
+    Builds the spider arguments shared by both execution modes.
+    Optional arguments are only passed when they are set.
+    `traceparent` / `trace_launched_at` carry the search's trace into the crawl (see tracing.py).
     """
+    spider_kwargs = {
+        'city': city,
+        'search_task_id': search_task_id, # The search's task ID; offers are recorded against its SearchRun
+        'individual_task_id': individual_task_id,
+    }
+    optional_kwargs = {
+        'price': price, 'rating': rating, 'checkin': checkin, 'agoda_city_id': agoda_city_id,
+        'traceparent': traceparent, 'trace_launched_at': trace_launched_at,
+    }
+    spider_kwargs.update({key: value for key, value in optional_kwargs.items() if value})
+    return spider_kwargs
 
-    individual_task_id = self.request.id # Get the ID of the individual task (for subprocess command)
-    group_task_id = self.request.root_id # Get the ID of the group task (root task)
 
+def run_spider_in_process(spider_name, spider_kwargs, individual_task_id, on_progress=None):
+    """
+    Schedules the crawl into this worker's long-lived Scrapy runtime.
+    Raises `CrawlerRuntimeUnavailable` if the runtime cannot be used in this process.
+    `on_progress` gets the crawl's progress events (called from the reactor thread).
+    """
+    runtime = get_runtime()
+    print(f"Scheduling {spider_name} in the in-process Scrapy runtime with {spider_kwargs}")
+
+    try:
+        callback_kwargs = {'progress_callback': on_progress} if on_progress else {}
+        stats = runtime.crawl(spider_name, timeout=settings.SPIDER_CRAWL_TIMEOUT, **spider_kwargs, **callback_kwargs)
+    except CrawlerRuntimeUnavailable:
+        raise
+    except Exception as e:
+        error_msg = f"Error running {spider_name} in-process for task {individual_task_id}: {e}"
+        print(f"ERROR: {error_msg}")
+        return {'task_id': individual_task_id, 'status': 'FAILURE', 'error': error_msg}
+
+    print(f"Spider {spider_name} finished in-process: "
+          f"items={stats.get('item_scraped_count', 0)}, finish_reason={stats.get('finish_reason')}")
+    return {
+        'task_id': individual_task_id,
+        'status': 'SUCCESS',
+        'spider_name': spider_name,
+        'items_scraped': stats.get('item_scraped_count', 0),
+        'pages': stats.get('response_received_count', 0),
+    }
+
+
+def run_spider_subprocess(spider_name, spider_kwargs, individual_task_id, on_progress=None):
+    """
+    Runs the crawl as a separate `scrapy crawl` process (the original execution mode).
+    Its output is streamed to the task's log file rather than held in memory (see
+    crawl_output.py); `on_progress` gets the progress events found in it. The result
+    only carries a summary, plus the last lines of output on failure.
+    """
     scraper_project_path = Path(settings.BASE_DIR).parent / 'scraper'
 
     print(f"DEBUG: Attempting to use Scrapy project path: {scraper_project_path}")
     if not scraper_project_path.exists():
         error_msg = f"ERROR: Scrapy project path DOES NOT EXIST: {scraper_project_path}"
         print(error_msg)
-        self.update_state(state='FAILURE', meta={'error': error_msg})
         return {'task_id': individual_task_id, 'status': 'FAILURE', 'error': error_msg}
     if not scraper_project_path.is_dir():
         error_msg = f"ERROR: Scrapy project path is not a directory: {scraper_project_path}"
         print(error_msg)
-        self.update_state(state='FAILURE', meta={'error': error_msg})
         return {'task_id': individual_task_id, 'status': 'FAILURE', 'error': error_msg}
 
-    command = [
-        'scrapy', 'crawl', spider_name,
-        '-a', f'city={city}',
-        '-a', f'search_task_id={group_task_id}', # Pass the GROUP task ID to the spider as 'search_task_id'
-        '-a', f'individual_task_id={individual_task_id}' 
-    ]
+    command = ['scrapy', 'crawl', spider_name]
+    for key, value in spider_kwargs.items():
+        command.extend(['-a', f'{key}={value}'])
 
-    if price:
-        command.extend(['-a', f'price={price}'])
-    if rating:
-        command.extend(['-a', f'rating={rating}'])
-    if checkin:
-        command.extend(['-a', f'checkin={checkin}'])
-    if agoda_city_id:
-        command.extend(['-a', f'agoda_city_id={agoda_city_id}'])
-
-    print(f"Executing command for {spider_name}: {' '.join(command)} in {scraper_project_path}")
+    log_path = crawl_output.task_log_path(individual_task_id)
+    print(f"Executing command for {spider_name}: {' '.join(command)} in {scraper_project_path} (log: {log_path})")
 
     env = os.environ.copy()
     env['DJANGO_SETTINGS_MODULE'] = 'django_project.settings'
+    env['PYTHONUNBUFFERED'] = '1' # progress lines arrive as they are written
     django_project_root = Path(settings.BASE_DIR).parent
     env['PYTHONPATH'] = str(django_project_root) + os.pathsep + env.get('PYTHONPATH', '')
     venv_bin_path = Path(settings.BASE_DIR).parent / '.venv' / 'bin'
     env['PATH'] = str(venv_bin_path) + os.pathsep + env.get('PATH', '')
 
     try:
-        result = subprocess.run(
+        process = subprocess.Popen(
             command,
             cwd=scraper_project_path,
             env=env,
-            check=True,
-            capture_output=True,
-            text=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT, # one stream: nothing can block on a full, unread pipe
+            encoding='utf-8',
+            errors='replace',
             shell=False
         )
-        print(f"Spider {spider_name} stdout:\n{result.stdout}")
-        if result.stderr:
-            print(f"Spider {spider_name} stderr:\n{result.stderr}")
-        
-        self.update_state(state='SUCCESS', meta={'task_id': individual_task_id, 'spider_name': spider_name})
-        return {'task_id': individual_task_id, 'status': 'SUCCESS', 'spider_name': spider_name}
-    except subprocess.CalledProcessError as e:
-        scrapy_output_error = (
-            f"Scrapy Command: {' '.join(e.cmd)}\n"
-            f"Scrapy Exit Status: {e.returncode}\n"
-            f"Scrapy STDOUT:\n{e.stdout}\n"
-            f"Scrapy STDERR:\n{e.stderr}"
-        )
-        error_msg = f"Error running {spider_name} for task {individual_task_id}:\n{scrapy_output_error}"
-        print(f"ERROR: {error_msg}")
-        self.update_state(state='FAILURE', meta={'error': error_msg})
-        return {'task_id': individual_task_id, 'status': 'FAILURE', 'error': error_msg}
     except FileNotFoundError as e:
         error_msg = f"Command 'scrapy' not found. Is Scrapy installed and in PATH? Error: {e}"
         print(f"ERROR: {error_msg}")
-        self.update_state(state='FAILURE', meta={'error': error_msg})
         return {'task_id': individual_task_id, 'status': 'FAILURE', 'error': error_msg}
+
+    try:
+        with process:
+            progress, tail = crawl_output.stream_output(process.stdout, log_path, on_progress)
+            returncode = process.wait()
     except Exception as e:
+        process.kill()
         error_msg = f"An unexpected error occurred for {spider_name} task {individual_task_id}: {e}"
         print(f"ERROR: {error_msg}")
-        self.update_state(state='FAILURE', meta={'error': error_msg})
-        return {'task_id': individual_task_id, 'status': 'FAILURE', 'error': error_msg}
+        return {'task_id': individual_task_id, 'status': 'FAILURE', 'error': error_msg, 'log_file': str(log_path)}
 
+    if returncode != 0:
+        last_lines = '\n'.join(tail)
+        error_msg = (
+            f"Error running {spider_name} for task {individual_task_id}: "
+            f"scrapy exited with status {returncode} (full log: {log_path}). Last lines:\n{last_lines}"
+        )
+        print(f"ERROR: {error_msg}")
+        return {'task_id': individual_task_id, 'status': 'FAILURE', 'error': error_msg, 'log_file': str(log_path)}
 
-@shared_task
-def run_spiders_for_query(city,  price=None, rating=None, agoda_city_id=None):
+    print(f"Spider {spider_name} finished: items={progress.get('items', 0)}, pages={progress.get('pages', 0)}, "
+          f"finish_reason={progress.get('finish_reason')} (log: {log_path})")
+    return {
+        'task_id': individual_task_id,
+        'status': 'SUCCESS',
+        'spider_name': spider_name,
+        'items_scraped': progress.get('items', 0),
+        'pages': progress.get('pages', 0),
+        'log_file': str(log_path),
+    }
+
+
+def run_spider(spider_name, spider_kwargs, individual_task_id, mode=None, on_progress=None):
+    """
+    Runs a spider in the configured execution mode ('in_process' or 'subprocess').
+    Falls back to the subprocess path when the in-process runtime is unavailable.
+    """
+    mode = mode or settings.SPIDER_EXECUTION_MODE
+    if mode == 'in_process':
+        try:
+            return run_spider_in_process(spider_name, spider_kwargs, individual_task_id, on_progress)
+        except CrawlerRuntimeUnavailable as e:
+            print(f"WARNING: In-process Scrapy runtime unavailable ({e}). Falling back to 'scrapy crawl' subprocess.")
+    return run_spider_subprocess(spider_name, spider_kwargs, individual_task_id, on_progress)
+
+
+@worker_process_init.connect
+def start_crawler_runtime(**kwargs):
+    """
+    Warms up the Scrapy runtime as soon as a worker process is forked,
+    so that even the first search of a process skips the cold start.
+    """
+    if settings.SPIDER_EXECUTION_MODE != 'in_process':
+        return
+    try:
+        get_runtime().start()
+    except CrawlerRuntimeUnavailable as e:
+        print(f"WARNING: Could not warm up the in-process Scrapy runtime: {e}")
+
+
+@before_task_publish.connect
+def stamp_publish_time(headers=None, **kwargs):
+    """
+    Stamps every task message with its publish time, for the queue wait metric,
+    and with the active trace span, so the task's spans join the search's trace.
+    """
+    if headers is not None:
+        headers['published_at'] = time.time()
+        traceparent = tracing.current_traceparent()
+        if traceparent:
+            headers['traceparent'] = traceparent
+
+
+_task_started = {} # task ID -> perf_counter() at task_prerun, per worker process
+_task_spans = {} # task ID -> (celery.task span, context token) of a traced task
+
+
+@task_prerun.connect
+def observe_queue_wait(task_id=None, task=None, **kwargs):
+    published_at = getattr(task.request, 'published_at', None)
+    if published_at is not None:
+        metrics.TASK_QUEUE_WAIT_SECONDS.labels(task=task.name).observe(max(0.0, time.time() - published_at))
+    _task_started[task_id] = time.perf_counter()
+
+    parent = tracing.parse_traceparent(getattr(task.request, 'traceparent', None))
+    if parent is not None:
+        if published_at is not None:
+            tracing.record('celery.queue', parent, published_at, time.time(), task=task.name)
+        _task_spans[task_id] = tracing.start_span('celery.task', parent, task=task.name, task_id=task_id)
+
+
+@task_postrun.connect
+def observe_run_time(task_id=None, task=None, state=None, **kwargs):
+    started = _task_started.pop(task_id, None)
+    if started is not None:
+        metrics.TASK_RUN_SECONDS.labels(task=task.name, state=state or 'UNKNOWN').observe(time.perf_counter() - started)
+    if task_id in _task_spans:
+        span, token = _task_spans.pop(task_id)
+        if span is not None:
+            span.set(state=state)
+        tracing.finish_span(span, token, error=state if state == 'FAILURE' else None)
+
+
+@shared_task(bind=True)
+def individual_spider_task(self, spider_name, city, price=None, rating=None, checkin=None, agoda_city_id=None):
+    """
+    A Celery task to run a single Scrapy spider with arguments.
+    It now passes the GROUP task ID (self.request.root_id) to the spider.
+    """
+
+    individual_task_id = self.request.id # Get the ID of the individual task
+    group_task_id = self.request.root_id # Get the ID of the group task (root task)
+
+    def report_progress(event):
+        # Called while the crawl runs (from the reactor thread in-process): self.request isn't set there.
+        try:
+            self.update_state(task_id=individual_task_id, state='PROGRESS', meta=dict(event, spider_name=spider_name))
+        except Exception as e:
+            print(f"WARNING: Could not record progress of {spider_name} task {individual_task_id}: {e}")
+        publish_spider_progress(group_task_id, spider_name, event)
+
+    with tracing.span('spider.run', spider=spider_name) as span:
+        spider_kwargs = build_spider_kwargs(
+            city, group_task_id, individual_task_id,
+            price=price, rating=rating, checkin=checkin, agoda_city_id=agoda_city_id,
+            traceparent=span.traceparent if span else None,
+            trace_launched_at=f"{time.time():.6f}" if span else None,
+        )
+        result = run_spider(spider_name, spider_kwargs, individual_task_id, on_progress=report_progress)
+        if span:
+            span.set(status=result['status'], items=result.get('items_scraped'))
+    publish_spider_status(group_task_id, spider_name, result['status'], result.get('error'))
+
+    if result['status'] == 'SUCCESS':
+        self.update_state(state='SUCCESS', meta={'task_id': individual_task_id, 'spider_name': spider_name})
+    else:
+        self.update_state(state='FAILURE', meta={'error': result['error']})
+    return result
+
+
+@shared_task(bind=True)
+def run_spiders_for_query(self, city,  price=None, rating=None, agoda_city_id=None, checkin=None):
     """
     Creates a group of Celery tasks to run all spiders for a given search query.
     """
     print(f"Initiating spider group for city: {city}")
-    current_datetime = datetime.now()
-    # Format the date as YYYY-MM-DD
-    formatted_date = current_datetime.strftime("%Y-%m-%d")
+    if not agoda_city_id:
+        # Cold cities fall through to this worker's shared browser; the result is cached for everyone.
+        try:
+            agoda_city_id = resolve_agoda_city_id(city)
+        except Exception as e:
+            print(f"WARNING: Could not resolve Agoda city ID for {city}: {e}")
+    # Format the date as YYYY-MM-DD (defaults to today)
+    formatted_date = checkin or datetime.now().strftime("%Y-%m-%d")
+
+    # Every offer the spiders scrape is recorded against this run (search_task_id == this task's ID).
+    SearchRun.objects.get_or_create(
+        task_id=self.request.id,
+        defaults={'city': city, 'price': price, 'rating': rating, 'checkin': formatted_date},
+    )
     
     booking_signature = individual_spider_task.s('booking_spider', city, price=price, rating=rating, checkin=formatted_date)
     agoda_signature = individual_spider_task.s('agoda_spider', city, price=price, rating=rating, checkin=formatted_date, agoda_city_id=agoda_city_id)
 
     task_group = group(booking_signature, agoda_signature)
+    # Lets the streaming endpoint know how many final spider statuses to wait for.
+    publish_search_started(self.request.id, [task.args[0] for task in task_group.tasks])
     # task_group = group(agoda_signature, )
     
     result = task_group.apply_async()
     
     print(f"Group task initiated with ID: {result.id}")
     return result.id
+
+
+@shared_task
+def rollup_price_history():
+    """
+    Refreshes the hourly and daily price rollups for recently ingested observations.
+    """
+    hourly, daily = price_history.rollup_recent()
+    print(f"Price rollups refreshed: {hourly} hourly, {daily} daily buckets")
+    return {'hourly': hourly, 'daily': daily}
+
+
+@shared_task
+def maintain_price_history():
+    """
+    Creates upcoming day partitions and applies retention (drops expired partitions whole).
+    """
+    price_history.ensure_partitions()
+    dropped = price_history.drop_expired_partitions()
+    deleted_hourly = price_history.drop_expired_hourly_rollups()
+    print(f"Price history maintenance: dropped {len(dropped)} partition(s), {deleted_hourly} hourly rollup(s)")
+    return {'dropped_partitions': dropped, 'deleted_hourly_rollups': deleted_hourly}
+
+
+@shared_task
+def prune_traces():
+    """
+    Deletes the trace files of searches older than TRACING_RETENTION_DAYS.
+    """
+    pruned = tracing.prune(settings.TRACING_RETENTION_DAYS)
+    print(f"Pruned {pruned} search trace(s)")
+    return {'pruned': pruned}
+
+
+@shared_task
+def prune_spider_logs():
+    """
+    Deletes the crawl logs of spider tasks older than SPIDER_LOG_RETENTION_DAYS.
+    """
+    pruned = crawl_output.prune_logs(settings.SPIDER_LOG_RETENTION_DAYS)
+    print(f"Pruned {pruned} spider log file(s)")
+    return {'pruned': pruned}
@@ -1,3 +1,293 @@
-from django.test import TestCase
+import json
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .entity_resolution import Listing, link_properties, normalize_location, normalize_name, resolve_listings
+from .models import Hotel, Offer, Property, SearchRun
+from .search_cache import search_is_dead
+
+TASK_ID = '6f1c1a52-3c1e-4c3a-9f5e-0b7f7d6a9e11'
+
+
+@mock.patch('hotel_search.search_cache.AsyncResult', **{'return_value.status': 'SUCCESS'})
+class SearchIsDeadTests(TestCase):
+    """
+    run_spiders_for_query succeeds once it has dispatched the spiders, so a cached
+    search is judged by its spiders' statuses and the offers it recorded.
+    """
+
+    def setUp(self):
+        self.run = SearchRun.objects.create(task_id=TASK_ID, city='London')
+
+    def add_offer(self):
+        hotel = Hotel.objects.create(search_task_id=TASK_ID, name='The Savoy', location='London', source='Booking.com')
+        Offer.objects.create(run=self.run, hotel=hotel, price='US$300')
+
+    def statuses(self, *states, expected=2):
+        return expected, {f'spider_{i}': {'status': state, 'error': None} for i, state in enumerate(states)}
+
+    def test_failed_task_is_dead(self, async_result):
+        async_result.return_value.status = 'FAILURE'
+        self.assertTrue(search_is_dead(TASK_ID))
+
+    def test_running_search_is_kept(self, async_result):
+        with mock.patch('hotel_search.search_cache.get_spider_statuses', return_value=self.statuses('FAILURE')):
+            self.assertFalse(search_is_dead(TASK_ID))
+        with mock.patch('hotel_search.search_cache.get_spider_statuses', return_value=(None, {})):
+            self.assertFalse(search_is_dead(TASK_ID))
+
+    def test_all_spiders_failed_is_dead(self, async_result):
+        self.add_offer()
+        with mock.patch('hotel_search.search_cache.get_spider_statuses', return_value=self.statuses('FAILURE', 'FAILURE')):
+            self.assertTrue(search_is_dead(TASK_ID))
+
+    def test_finished_without_hotels_is_dead(self, async_result):
+        with mock.patch('hotel_search.search_cache.get_spider_statuses', return_value=self.statuses('SUCCESS', 'FAILURE')):
+            self.assertTrue(search_is_dead(TASK_ID))
+
+    def test_finished_with_hotels_is_kept(self, async_result):
+        self.add_offer()
+        with mock.patch('hotel_search.search_cache.get_spider_statuses', return_value=self.statuses('SUCCESS', 'FAILURE')):
+            self.assertFalse(search_is_dead(TASK_ID))
+
+    def test_redis_unavailable_is_kept(self, async_result):
+        with mock.patch('hotel_search.search_cache.get_spider_statuses', return_value=None):
+            self.assertFalse(search_is_dead(TASK_ID))
+
+
+@override_settings(TRACING_ENABLED=False, POLL_PAGE_SIZE=2, POLL_CURSOR_SETTLE_SECONDS=5)
+@mock.patch('hotel_search.views.AsyncResult', **{'return_value.status': 'PENDING'})
+@mock.patch('hotel_search.views.get_search_version', return_value=1)
+class PollSearchResultsTests(TestCase):
+    """
+    poll_search_results: deltas after a `scraped_at|id` cursor and ETags.
+    """
+
+    def setUp(self):
+        self.run = SearchRun.objects.create(task_id=TASK_ID, city='London')
+        self.url = reverse('poll_search_results', args=[TASK_ID])
+        self.settled = timezone.now() - timedelta(minutes=1) # older than the settle window
+
+    def add_offer(self, name, scraped_at):
+        hotel = Hotel.objects.create(search_task_id=TASK_ID, name=name, location='London', source='Booking.com')
+        return Offer.objects.create(run=self.run, hotel=hotel, price='US$100', scraped_at=scraped_at)
+
+    def poll(self, cursor=None, **headers):
+        return self.client.get(self.url, {'cursor': cursor} if cursor else {}, **headers)
+
+    def names(self, response):
+        return [hotel['name'] for hotel in response.json()['hotels']]
+
+    def test_returns_only_offers_after_the_cursor(self, get_search_version, async_result):
+        self.add_offer('A', self.settled)
+        first = self.poll().json()
+        self.assertEqual([hotel['name'] for hotel in first['hotels']], ['A'])
+        self.assertFalse(first['has_more'])
+
+        self.add_offer('B', self.settled + timedelta(seconds=1))
+        delta = self.poll(first['cursor'])
+        self.assertEqual(self.names(delta), ['B'])
+        self.assertEqual(self.names(self.poll(delta.json()['cursor'])), [])
+
+    def test_cursor_stays_before_unsettled_offers(self, get_search_version, async_result):
+        self.add_offer('A', self.settled)
+        self.add_offer('B', timezone.now())
+        first = self.poll().json()
+        self.assertEqual([hotel['name'] for hotel in first['hotels']], ['A', 'B'])
+        # B may still be joined by older rows committing late, so it is sent again.
+        self.assertEqual(self.names(self.poll(first['cursor'])), ['B'])
+
+    def test_rows_sharing_scraped_at_across_a_page_boundary(self, get_search_version, async_result):
+        for name in ('A', 'B', 'C', 'D', 'E'):
+            self.add_offer(name, self.settled)
+        seen, cursor, has_more = [], None, True
+        while has_more:
+            body = self.poll(cursor).json()
+            self.assertLessEqual(len(body['hotels']), 2)
+            seen += [hotel['name'] for hotel in body['hotels']]
+            cursor, has_more = body['cursor'], body['has_more']
+        self.assertEqual(seen, ['A', 'B', 'C', 'D', 'E'])
+        self.assertEqual(self.names(self.poll(cursor)), [])
+
+    def test_unchanged_etag_gets_304(self, get_search_version, async_result):
+        self.add_offer('A', self.settled)
+        first = self.poll()
+        etag = first['ETag']
+        self.assertTrue(etag)
+
+        with self.assertNumQueries(0):
+            unchanged = self.poll(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(unchanged.status_code, 304)
+        self.assertEqual(unchanged['ETag'], etag)
+
+        get_search_version.return_value = 2 # the search changed
+        changed = self.poll(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], etag)
+
+    def test_invalid_cursor_is_rejected(self, get_search_version, async_result):
+        self.assertEqual(self.poll('not-a-cursor').status_code, 400)
+
+    def test_only_the_best_offer_of_a_property_is_sent(self, get_search_version, async_result):
+        prop = Property.objects.create(name='Z Soho', normalized_name='z soho')
+        cheap = self.add_offer('Z Soho', self.settled)
+        cheap.price_amount = Decimal('90')
+        cheap.save()
+        first = self.poll().json()
+
+        agoda = Hotel.objects.create(search_task_id=TASK_ID, name='Z Hotel Soho', location='London', source='Agoda', property=prop)
+        Hotel.objects.filter(id=cheap.hotel_id).update(property=prop)
+        Offer.objects.create(run=self.run, hotel=agoda, price_amount=Decimal('120'), scraped_at=self.settled + timedelta(seconds=1))
+        pricier = self.poll(first['cursor']).json()
+        self.assertEqual(pricier['hotels'], []) # not the best of its property
+        self.assertNotEqual(pricier['cursor'], first['cursor']) # but read past
+
+        Offer.objects.create(run=self.run, hotel=agoda, price_amount=Decimal('80'), scraped_at=self.settled + timedelta(seconds=2))
+        self.assertEqual(self.names(self.poll(pricier['cursor'])), ['Z Hotel Soho'])
+
+    def test_cursor_poll_does_not_read_older_offers(self, get_search_version, async_result):
+        for i in range(40):
+            self.add_offer(f'Old {i}', self.settled - timedelta(seconds=i))
+        cursor = None
+        with override_settings(POLL_PAGE_SIZE=100):
+            cursor = self.poll().json()['cursor']
+        self.add_offer('New', self.settled + timedelta(seconds=1))
+
+        with CaptureQueriesContext(connection) as queries, override_settings(POLL_PAGE_SIZE=100):
+            self.assertEqual(self.names(self.poll(cursor)), ['New'])
+        # The cursor's row and the new offer, not the run's 41 offers.
+        self.assertLessEqual(offer_rows_read(queries), 5)
+
+
+def offer_rows_read(queries):
+    """
+    Offer rows Postgres reads (returned or filtered out) to run the captured queries,
+    measured with EXPLAIN ANALYZE and planned as on a large table (statistics, no
+    sequential scans).
+    """
+    read = 0
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE hotel_search_offer, hotel_search_hotel')
+        cursor.execute('SET LOCAL enable_seqscan = off')
+        for query in queries.captured_queries:
+            if not query['sql'].startswith('SELECT') or 'hotel_search_offer' not in query['sql']:
+                continue
+            cursor.execute(f"EXPLAIN (ANALYZE, FORMAT JSON) {query['sql']}")
+            plan = cursor.fetchone()[0]
+            nodes = [(plan if isinstance(plan, list) else json.loads(plan))[0]['Plan']]
+            while nodes:
+                node = nodes.pop()
+                nodes.extend(node.get('Plans', []))
+                if node.get('Relation Name') == 'hotel_search_offer':
+                    read += node['Actual Loops'] * (node['Actual Rows'] + node.get('Rows Removed by Filter', 0))
+        cursor.execute('SET LOCAL enable_seqscan = on')
+    return read
+
+
+class NormalizationTests(SimpleTestCase):
+
+    def test_normalize_name(self):
+        self.assertEqual(normalize_name('The Z Hotel, Soho & Co.'), 'z soho co')
+        self.assertEqual(normalize_name('Hôtel Château Frontenac'), 'chateau frontenac')
+        self.assertEqual(normalize_name('Crowne Plaza London Kensington, an IHG Hotel'), 'crowne plaza london kensington')
+        self.assertEqual(normalize_name('Grand Intl Apts'), 'grand international apartments')
+        self.assertEqual(normalize_name('The Hotel'), 'the hotel') # all stop words: kept rather than emptied
+
+    def test_normalize_location(self):
+        self.assertEqual(normalize_location('Chelsea, London - 68 m to center'), 'chelsea london')
+        self.assertEqual(normalize_location('Soho, London (0.3 miles)'), 'soho london')
+        self.assertEqual(normalize_location('Kensington and Chelsea, London'), 'kensington chelsea london')
+        self.assertEqual(normalize_location(None), '')
+
+
+class ResolveListingsTests(SimpleTestCase):
+
+    def test_links_the_same_hotel_across_sources(self):
+        groups = resolve_listings([
+            Listing(1, 'Booking.com', 'The Z Hotel Soho', 'Soho, London'),
+            Listing(2, 'Agoda', 'Z Hotel Soho', 'Soho, London - 100 m to center'),
+            Listing(3, 'Booking.com', 'The Savoy', 'Strand, London'),
+        ])
+        self.assertEqual(groups[1], groups[2])
+        self.assertNotEqual(groups[1], groups[3])
+
+    def test_at_most_one_listing_per_source_in_a_group(self):
+        groups = resolve_listings([
+            Listing(1, 'Booking.com', 'Z Hotel Soho', 'Soho, London'),
+            Listing(2, 'Agoda', 'Z Hotel Soho', 'Soho, London'),
+            Listing(3, 'Agoda', 'Z Hotel Soho', 'Soho, London'),
+        ])
+        self.assertEqual(len({groups[1], groups[2], groups[3]}), 2)
+        self.assertIn(groups[1], (groups[2], groups[3]))
+
+    def test_numbers_in_names_must_agree(self):
+        groups = resolve_listings([
+            Listing(1, 'Booking.com', 'Room 2 Hammersmith', 'Hammersmith, London'),
+            Listing(2, 'Agoda', 'Room 3 Hammersmith', 'Hammersmith, London'),
+        ])
+        self.assertNotEqual(groups[1], groups[2])
+
+    def test_same_source_listings_are_never_linked(self):
+        groups = resolve_listings([
+            Listing(1, 'Booking.com', 'Z Hotel Soho', 'Soho, London'),
+            Listing(2, 'Booking.com', 'Z Hotel Soho', 'Soho, London'),
+        ])
+        self.assertNotEqual(groups[1], groups[2])
+
+
+class LinkPropertiesTests(TestCase):
+
+    def hotel(self, name, source, location='Soho, London'):
+        return Hotel.objects.create(search_task_id=TASK_ID, name=name, location=location, source=source)
+
+    def test_links_a_batch_across_sources(self):
+        booking = self.hotel('The Z Hotel Soho', 'Booking.com')
+        agoda = self.hotel('Z Hotel Soho', 'Agoda', 'Soho, London - 100 m to center')
+        savoy = self.hotel('The Savoy', 'Booking.com', 'Strand, London')
+        self.assertEqual(link_properties([booking, agoda, savoy]), 3)
+
+        self.assertEqual(booking.property_id, agoda.property_id)
+        self.assertNotEqual(booking.property_id, savoy.property_id)
+        self.assertEqual(Property.objects.count(), 2)
+        self.assertEqual(Hotel.objects.get(id=agoda.id).property_id, booking.property_id)
+
+    def test_reuses_a_property_from_an_earlier_flush(self):
+        booking = self.hotel('The Z Hotel Soho', 'Booking.com')
+        link_properties([booking])
+        agoda = self.hotel('Z Hotel Soho', 'Agoda')
+        link_properties([agoda])
+
+        self.assertEqual(agoda.property_id, booking.property_id)
+        self.assertEqual(Property.objects.count(), 1)
+
+    def test_at_most_one_hotel_per_source_per_property(self):
+        first = self.hotel('Z Hotel Soho', 'Booking.com')
+        link_properties([first])
+        second = self.hotel('Z Hotel Soho', 'Booking.com', 'Soho, London W1')
+        link_properties([second])
+
+        self.assertNotEqual(first.property_id, second.property_id)
+
+    def test_numbers_in_names_must_agree(self):
+        room_2 = self.hotel('Room 2 Hammersmith', 'Booking.com', 'Hammersmith, London')
+        room_3 = self.hotel('Room 3 Hammersmith', 'Agoda', 'Hammersmith, London')
+        link_properties([room_2, room_3])
+
+        self.assertNotEqual(room_2.property_id, room_3.property_id)
+
+    def test_already_linked_hotels_are_left_alone(self):
+        booking = self.hotel('The Z Hotel Soho', 'Booking.com')
+        link_properties([booking])
+        again = Hotel.objects.get(id=booking.id)
+        again.property_id = None # as a pipeline's in-memory copy would be
+
+        self.assertEqual(link_properties([again]), 0)
+        self.assertEqual(again.property_id, booking.property_id)
+        self.assertEqual(Property.objects.count(), 1)
@@ -0,0 +1,315 @@
+# django-project/hotel_search/tracing.py
+"""
+Per-search latency tracing.
+
+Every search is one trace, whose ID is the search's task ID (the UUID's hex). Its
+spans form a waterfall of where the time went:
+
+    search.request        search_hotels_view, up to the task being queued (the root span)
+    celery.queue          a task waiting for a worker
+    celery.task           a task running (run_spiders_for_query, individual_spider_task)
+    spider.run            individual_spider_task handing a spider to its execution mode
+    spider.startup        from the hand-off to the spider opening (subprocess start-up, Django setup)
+    request.wait          a request from being scheduled to reaching the downloader (delays, rate limit)
+    download.http         the plain HTTP download of a page
+    download.playwright   a page rendered by Playwright
+    parse                 the spider callback on one page
+    pipeline.flush        one BulkHotelScraperPipeline flush (pipeline.save per item for HotelScraperPipeline)
+    poll.delay            from hotels being saved to a poll returning them
+
+The context travels along with the work: a context variable within a process,
+a `traceparent` header (W3C Trace Context) on Celery messages, and the
+`traceparent` / `trace_launched_at` spider arguments into the crawl, in both
+execution modes. Anything that only knows the search ID (the poll endpoint) hangs
+its spans off the root span, whose ID is derived from the trace ID.
+
+Spans are appended as JSON lines, one file per search under TRACING_DIR, using
+OpenTelemetry's span field names (trace_id, span_id, parent_span_id,
+start_time_unix_nano, ...). The SearchRun admin renders them: the slowest stages
+across recent searches, and one search's waterfall.
+"""
+import contextvars
+import json
+import os
+import secrets
+import statistics
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+from loguru import logger as LOGGER
+
+_current = contextvars.ContextVar('trace_context', default=None) # (trace_id, span_id) of the active span
+
+
+def trace_id_for(task_id):
+    """
+    '5b0e4b62-...' (a search's task ID) -> its 32 hex digit trace ID.
+    """
+    return uuid.UUID(str(task_id)).hex
+
+
+def root_span_id(trace_id):
+    return trace_id[16:]
+
+
+def format_traceparent(trace_id, span_id):
+    return f"00-{trace_id}-{span_id}-01"
+
+
+def parse_traceparent(value):
+    """
+    '00-<trace_id>-<span_id>-01' -> (trace_id, span_id); None for anything else.
+    """
+    parts = str(value or '').split('-')
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    return parts[1], parts[2]
+
+
+def current_traceparent():
+    context = _current.get()
+    return format_traceparent(*context) if context else None
+
+
+def trace_path(trace_id):
+    return Path(settings.TRACING_DIR) / f"{trace_id}.jsonl"
+
+
+def export(name, trace_id, parent_span_id, start, end, attributes=None, span_id=None, status='OK'):
+    """
+    Appends one finished span to its search's trace file. `start` and `end` are epoch seconds.
+    """
+    span = {
+        'trace_id': trace_id,
+        'span_id': span_id or secrets.token_hex(8),
+        'parent_span_id': parent_span_id,
+        'name': name,
+        'start_time_unix_nano': int(start * 1e9),
+        'end_time_unix_nano': int(max(start, end) * 1e9),
+        'status': 'ERROR' if (attributes or {}).get('error') else status,
+        'attributes': {key: value for key, value in (attributes or {}).items() if value is not None},
+        'resource': {'pid': os.getpid()},
+    }
+    try:
+        path = trace_path(trace_id)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(span, default=str) + '\n') # one write per line: concurrent writers don't interleave
+    except OSError as e:
+        LOGGER.warning(f"Could not export span {name} of trace {trace_id}: {e}")
+
+
+class Span:
+    """
+    A span in progress; `span()` exports it when its block ends.
+    """
+
+    __slots__ = ('name', 'trace_id', 'span_id', 'parent_span_id', 'start', 'attributes', 'status')
+
+    def __init__(self, name, trace_id, parent_span_id, span_id=None, start=None, **attributes):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = span_id or secrets.token_hex(8)
+        self.parent_span_id = parent_span_id
+        self.start = start or time.time()
+        self.attributes = attributes
+        self.status = 'OK'
+
+    @property
+    def traceparent(self):
+        return format_traceparent(self.trace_id, self.span_id)
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def end(self, end=None):
+        export(self.name, self.trace_id, self.parent_span_id, self.start, end or time.time(),
+               self.attributes, span_id=self.span_id, status=self.status)
+
+
+def start_span(name, parent=None, **attributes):
+    """
+    Starts a span under `parent` ((trace_id, span_id); the active span by default) and
+    makes it the active one. Returns (span, token) for `finish_span`, or (None, None)
+    when there is nothing to trace.
+    """
+    parent = parent or _current.get()
+    if not settings.TRACING_ENABLED or parent is None:
+        return None, None
+    trace_id, parent_span_id = parent
+    span = Span(name, trace_id, parent_span_id, **attributes)
+    return span, _current.set((trace_id, span.span_id))
+
+
+def finish_span(span, token, error=None):
+    if span is None:
+        return
+    try:
+        _current.reset(token)
+    except ValueError: # started in another context (a Celery signal handler run elsewhere)
+        _current.set(None)
+    if error is not None:
+        span.status = 'ERROR'
+        span.set(error=str(error)[:200])
+    span.end()
+
+
+@contextmanager
+def span(name, parent=None, **attributes):
+    """
+    `with span('spider.run', spider='booking_spider') as s:` - the block as a child span of
+    `parent` or of the active span; `s` is None when the work isn't being traced.
+    """
+    started, token = start_span(name, parent, **attributes)
+    try:
+        yield started
+    except BaseException as e:
+        finish_span(started, token, error=e)
+        raise
+    finish_span(started, token)
+
+
+def trace(task_id, name, start=None, **attributes):
+    """
+    `with trace(task_id, 'search.request'):` - the root span of a search's trace.
+    """
+    trace_id = trace_id_for(task_id)
+    return span(name, (trace_id, None), span_id=root_span_id(trace_id), start=start, **attributes)
+
+
+def root_context(task_id):
+    """
+    (trace_id, root span ID) of a search, for spans recorded knowing only its task ID.
+    """
+    trace_id = trace_id_for(task_id)
+    return trace_id, root_span_id(trace_id)
+
+
+def record(name, parent, start, end, **attributes):
+    """
+    Exports a span whose times are already known, under `parent` ((trace_id, span_id)).
+    """
+    if settings.TRACING_ENABLED and parent is not None:
+        export(name, parent[0], parent[1], start, end, attributes)
+
+
+# --- Reading traces (the SearchRun admin) ---
+
+def load_trace(trace_id):
+    """
+    The spans of one search, oldest first, with their times as epoch seconds.
+    """
+    spans = []
+    try:
+        with open(trace_path(trace_id), encoding='utf-8') as f:
+            for line in f:
+                try:
+                    span = json.loads(line)
+                except ValueError: # a line cut short by a crash
+                    continue
+                span['start'] = span['start_time_unix_nano'] / 1e9
+                span['duration'] = (span['end_time_unix_nano'] - span['start_time_unix_nano']) / 1e9
+                spans.append(span)
+    except FileNotFoundError:
+        pass
+    return sorted(spans, key=lambda span: span['start'])
+
+
+def recent_trace_ids(limit):
+    """
+    The trace IDs of the `limit` most recently updated traces.
+    """
+    paths = sorted(Path(settings.TRACING_DIR).glob('*.jsonl'), key=lambda path: path.stat().st_mtime, reverse=True)
+    return [path.stem for path in paths[:limit]]
+
+
+def waterfall(spans):
+    """
+    The spans in tree order (each after its parent), with their depth, their attributes
+    as text and their offset and width as percentages of the whole trace, for rendering.
+    """
+    if not spans:
+        return []
+    trace_start = min(span['start'] for span in spans)
+    trace_length = max(span['start'] + span['duration'] for span in spans) - trace_start or 1e-9
+    children = {}
+    ids = {span['span_id'] for span in spans}
+    for span in spans:
+        parent = span['parent_span_id'] if span['parent_span_id'] in ids else None
+        children.setdefault(parent, []).append(span)
+
+    rows = []
+    stack = [(span, 0) for span in reversed(children.get(None, []))]
+    while stack:
+        span, depth = stack.pop()
+        rows.append(dict(
+            span, depth=depth,
+            details=' '.join(f"{key}={value}" for key, value in span['attributes'].items()),
+            offset=(span['start'] - trace_start) * 100 / trace_length,
+            width=max(span['duration'] * 100 / trace_length, 0.2),
+        ))
+        stack.extend((child, depth + 1) for child in reversed(children.get(span['span_id'], [])))
+    return rows
+
+
+def slowest_stages(traces):
+    """
+    Per span name across `traces` (lists of spans): how often it ran and how long it took,
+    slowest (by p95) first.
+    """
+    durations = {}
+    searches = {}
+    for spans in traces:
+        for span in spans:
+            durations.setdefault(span['name'], []).append(span['duration'])
+            searches.setdefault(span['name'], set()).add(span['trace_id'])
+    stages = []
+    for name, values in durations.items():
+        values.sort()
+        stages.append({
+            'name': name,
+            'count': len(values),
+            'searches': len(searches[name]),
+            'p50': statistics.median(values),
+            'p95': values[min(len(values) - 1, int(len(values) * 0.95))],
+            'max': values[-1],
+            'total': sum(values),
+        })
+    return sorted(stages, key=lambda stage: stage['p95'], reverse=True)
+
+
+def summarize(spans):
+    """
+    One search's total duration and its slowest span.
+    """
+    if not spans:
+        return None
+    start = min(span['start'] for span in spans)
+    slowest = max(spans, key=lambda span: span['duration'])
+    root = next((span for span in spans if span['parent_span_id'] is None), None)
+    return {
+        'trace_id': spans[0]['trace_id'],
+        'task_id': str(uuid.UUID(spans[0]['trace_id'])),
+        'city': (root or {}).get('attributes', {}).get('city', ''),
+        'started_at': start,
+        'duration': max(span['start'] + span['duration'] for span in spans) - start,
+        'spans': len(spans),
+        'slowest': slowest['name'],
+        'slowest_duration': slowest['duration'],
+    }
+
+
+def prune(retention_days):
+    """
+    Deletes trace files untouched for `retention_days`; returns how many.
+    """
+    cutoff = time.time() - retention_days * 24 * 60 * 60
+    pruned = 0
+    for path in Path(settings.TRACING_DIR).glob('*.jsonl'):
+        if path.stat().st_mtime < cutoff:
+            path.unlink(missing_ok=True)
+            pruned += 1
+    return pruned
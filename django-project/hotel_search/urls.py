@@ -11,6 +11,8 @@ urlpatterns = [
     path('results/', views.hotel_results_view, name='hotel_results_all'), # NEW: For viewing all results
     path('results/<uuid:task_id>/', views.hotel_results_view, name='hotel_results'),
     path('status/<uuid:task_id>/', views.poll_search_results, name='poll_search_results'), # Polling endpoint
+    path('stream/<uuid:task_id>/', views.stream_search_results, name='stream_search_results'), # Server-Sent Events
+    path('<int:hotel_id>/price-trend/', views.hotel_price_trend, name='hotel_price_trend'), # Price history from rollups
     
     
     path('login/', CustomLoginView.as_view(), name='login'),
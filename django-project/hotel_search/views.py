@@ -48,10 +48,21 @@ def logout_any(request):
 ### ------------------------------------------  ###
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse
+import hashlib
+import time
+from datetime import timedelta
+from django.db.models import F, Q, Window
+from django.db.models.functions import Coalesce, RowNumber
+from django.http import HttpResponse, HttpResponseNotModified, JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.core.handlers.asgi import ASGIRequest
+from asgiref.sync import sync_to_async
 from .forms import HotelSearchForm
 from .tasks import run_spiders_for_query
-from .models import Hotel, Bookmark
+from .models import Hotel, Bookmark, Offer, PriceRollup, SearchRun
+from .price_history import price_trend
+from . import metrics, tracing
 from celery.result import AsyncResult
 
 
@@ -99,7 +110,10 @@ def bookmark_list_view(request):
 
 
 import asyncio
-from .city_id_resolver import get_agoda_city_id
+from datetime import datetime
+from .city_id_resolver import resolve_agoda_city_id
+from .search_cache import get_or_start_search
+from .search_events import async_search_event_stream, get_search_version, offer_to_event, search_event_stream
 
 @login_required
 def search_hotels_view(request):
@@ -108,25 +122,43 @@ def search_hotels_view(request):
     and redirects to the results page with the task ID.
     """
     if request.method == 'POST':
+        started = time.time()
         city = request.POST.get('city')
         price = request.POST.get('price')
         rating = request.POST.get('rating')
 
         if city:
-            # Resolve Agoda city ID asynchronously
+            # Resolve Agoda city ID from the cache tiers only (sub-millisecond once warm).
+            # A city never seen before is resolved by run_spiders_for_query in the worker,
+            # so this request never waits for a browser.
             agoda_city_id = None
-            # try:
-            #     agoda_city_id = asyncio.run(get_agoda_city_id(city))
-            #     if not agoda_city_id:
-            #         LOGGER.warning(f"Could not resolve Agoda city ID for {city}. Proceeding without Agoda search.")
-            # except Exception as e:
-            #     LOGGER.error(f"Error resolving Agoda city ID for {city}: {e}")
-
-            # Call the Celery task asynchronously, passing the resolved Agoda city ID
-            task_result = run_spiders_for_query.delay(city, price=price, rating=rating, agoda_city_id=agoda_city_id)
+            try:
+                agoda_city_id = resolve_agoda_city_id(city, allow_browser=False)
+            except Exception as e:
+                LOGGER.error(f"Error resolving Agoda city ID for {city}: {e}")
+
+            checkin = datetime.now().strftime("%Y-%m-%d")
+
+            # Call the Celery task asynchronously, passing the resolved Agoda city ID.
+            # Identical searches (same normalized city/price/rating/checkin) share one crawl:
+            # a running or recently finished search is reused instead of starting a new one.
+            def start_search(new_task_id):
+                # The search's trace starts here; the task message carries it on (see tracing.py).
+                with tracing.trace(new_task_id, 'search.request', start=started, city=city, price=price, rating=rating):
+                    return run_spiders_for_query.apply_async(
+                        args=(city,),
+                        kwargs={'price': price, 'rating': rating, 'agoda_city_id': agoda_city_id, 'checkin': checkin},
+                        task_id=new_task_id,
+                    )
+
+            task_id, coalesced = get_or_start_search(
+                city, price=price, rating=rating, checkin=checkin, start_search=start_search,
+            )
+            if coalesced:
+                LOGGER.info(f"Search for {city} attached to existing task {task_id}")
             
             # Redirect to the results page, passing the group task_id
-            return redirect('hotel_results', task_id=task_result.id)
+            return redirect('hotel_results', task_id=task_id)
         else:
             return JsonResponse({'status': 'Missing parameters'}, status=400)
     return render(request, 'hotels/search.html') # Render your search form
@@ -140,14 +172,8 @@ def hotel_results_view(request, task_id=None): # <--- Make task_id optional
     hotels = Hotel.objects.all().order_by('-id') # Start with all hotels
 
     if task_id: # If a task_id is provided, filter by it
-        # In your polling view, you get subtask_ids. Here, we're just filtering by the main group task_id
-        # This means the `search_task_id` in your Hotel model should store the GROUP task_id,
-        # not the individual spider task_id if you want to filter this way.
-        # If `search_task_id` in Hotel model stores individual spider task IDs, you'd need a different approach here.
-        # For simplicity, let's assume you want to filter by the main group task_id for this view.
-        # If your Hotel model stores individual spider task IDs, you'd need to adjust this filter.
-        # For now, let's assume `search_task_id` in Hotel model stores the GROUP task_id.
-        hotels = hotels.filter(search_task_id=task_id)
+        # Hotels are linked to searches through their offers (one per search run that found them).
+        hotels = hotels.filter(offers__run__task_id=task_id).distinct()
 
     context = {
         'hotels': hotels,
@@ -156,42 +182,126 @@ def hotel_results_view(request, task_id=None): # <--- Make task_id optional
     return render(request, 'hotels/results.html', context)
 
 
-def poll_search_results(request, task_id):
+def _format_cursor(offer):
+    return f"{offer.scraped_at.isoformat()}|{offer.id}"
+
+
+def _parse_cursor(cursor):
     """
-    API endpoint to be polled by JavaScript.
-    Returns the task status and the best-priced hotels found so far.
+    Parses an opaque '<scraped_at ISO>|<id>' cursor; returns (scraped_at, id) or None if invalid.
     """
-    LOGGER.info(f"Polling for task_id: {task_id}")
-    task = AsyncResult(str(task_id))
+    scraped_at, _, offer_id = cursor.rpartition('|')
+    parsed = parse_datetime(scraped_at)
+    if parsed is None or not offer_id.isdigit():
+        return None
+    return parsed, int(offer_id)
 
-    # Always query for hotels found so far for this task.
-    hotels_queryset = Hotel.objects.filter(search_task_id=str(task_id)).distinct()
 
-    # Group hotels by name and location to find the best price
-    best_priced_hotels = {}
-    for hotel in hotels_queryset:
-        # Create a unique key for each hotel based on its name and location
-        hotel_key = (hotel.name, hotel.location)
-        
-        # If we haven't seen this hotel before, or if the current hotel has a lower price,
-        # update the dictionary with the current hotel's data.
-        if hotel_key not in best_priced_hotels or hotel.price < best_priced_hotels[hotel_key].price:
-            best_priced_hotels[hotel_key] = hotel
+def _get_run_id(task_id):
+    """
+    The SearchRun ID for a search task, or None if the search has not started yet.
+    """
+    return SearchRun.objects.filter(task_id=task_id).values_list('id', flat=True).first()
 
-    # Sort the best-priced hotels by their scraped time
-    sorted_hotels = sorted(best_priced_hotels.values(), key=lambda h: h.scraped_at, reverse=True)
 
-    bookmarked_hotel_ids = []
-    if request.user.is_authenticated:
-        bookmarked_hotel_ids = list(Bookmark.objects.filter(user=request.user).values_list('hotel_id', flat=True))
-
-    hotels_data = [{
-        'id': h.id, 'name': h.name, 'location': h.location, 'price': h.price,
-        'rating': h.rating, 'image_url': h.image_url, 'hotel_url': h.hotel_url,
-        'source': h.source, 'is_bookmarked': h.id in bookmarked_hotel_ids
-    } for h in sorted_hotels]
+def best_offers(run_id, offers=None):
+    """
+    The cheapest offer per Property (the same hotel across sources) of a search run,
+    picked in Postgres with ROW_NUMBER(). Hotels not linked to a Property yet are their
+    own group. Unpriced offers only win when nothing else is priced.
+
+    Given `offers` (a poll's new offers), only the groups those offers belong to are
+    ranked, so the cost follows the new offers rather than the size of the run.
+    """
+    candidates = Offer.objects.filter(run_id=run_id)
+    if offers is not None:
+        property_ids = {offer.hotel.property_id for offer in offers if offer.hotel.property_id}
+        unlinked_hotel_ids = {offer.hotel_id for offer in offers if not offer.hotel.property_id}
+        candidates = candidates.filter(hotel_id__in=Hotel.objects.filter(
+            Q(property_id__in=property_ids) | Q(id__in=unlinked_hotel_ids)
+        ).values('id'))
+    best_offer_ids = candidates.annotate(
+        rank=Window(
+            RowNumber(),
+            # Negative hotel IDs can't collide with property IDs.
+            partition_by=[Coalesce('hotel__property_id', -F('hotel_id'))],
+            order_by=[F('price_amount').asc(nulls_last=True), 'id'],
+        ),
+    ).filter(rank=1).values('id')
+    return Offer.objects.filter(id__in=best_offer_ids).select_related('hotel')
+
+
+@metrics.time_view(metrics.POLL_SECONDS)
+def poll_search_results(request, task_id):
+    """
+    API endpoint to be polled by JavaScript.
+    Returns the task status and the hotels added or changed since `?cursor=`
+    (all hotels when no cursor is given), at most POLL_PAGE_SIZE per call.
+
+    The response carries an ETag built from the search's change counter in Redis,
+    so a poll with a matching If-None-Match gets a 304 without touching the DB.
+    """
+    task_id = str(task_id)
+    LOGGER.info(f"Polling for task_id: {task_id}")
+    task = AsyncResult(task_id)
+    cursor = request.GET.get('cursor', '')
+
+    version = get_search_version(task_id)
+    etag = None
+    if version is not None:
+        etag = '"{}"'.format(hashlib.md5(f"{version}|{task.status}|{cursor}".encode()).hexdigest())
+        if request.headers.get('If-None-Match') == etag:
+            response = HttpResponseNotModified()
+            response['ETag'] = etag
+            return response
+
+    parsed_cursor = _parse_cursor(cursor) if cursor else None
+    if cursor and parsed_cursor is None:
+        return JsonResponse({'status': 'error', 'message': 'Invalid cursor'}, status=400)
+
+    new_offers = []
+    run_id = _get_run_id(task_id)
+    if run_id is not None:
+        # Keyset scan of offer_run_scraped_idx: only the offers after the cursor are read.
+        new_offers_queryset = Offer.objects.filter(run_id=run_id).select_related('hotel')
+        if parsed_cursor:
+            cursor_scraped_at, cursor_id = parsed_cursor
+            new_offers_queryset = new_offers_queryset.filter(
+                # The >= bound is the index range; the OR only breaks ties on scraped_at.
+                Q(scraped_at__gte=cursor_scraped_at),
+                Q(scraped_at__gt=cursor_scraped_at) | Q(id__gt=cursor_id),
+            )
+        new_offers = list(new_offers_queryset.order_by('scraped_at', 'id')[:settings.POLL_PAGE_SIZE + 1])
+    has_more = len(new_offers) > settings.POLL_PAGE_SIZE
+    new_offers = new_offers[:settings.POLL_PAGE_SIZE]
+
+    # A new offer is sent if it is now the best of its group; the rest don't change what the client shows.
+    best_ids = set(best_offers(run_id, new_offers).values_list('id', flat=True)) if new_offers else set()
+    page = [offer for offer in new_offers if offer.id in best_ids]
+
+    # Rows written concurrently by another spider can commit with a slightly older
+    # scraped_at than rows we already returned. Unless the page is full, only advance
+    # the cursor past rows older than the settle window, so late commits are re-read
+    # on the next poll (the client merges hotels by id, so repeats are harmless).
+    next_cursor = cursor
+    settled_before = timezone.now() - timedelta(seconds=settings.POLL_CURSOR_SETTLE_SECONDS)
+    for offer in new_offers:
+        if has_more or offer.scraped_at <= settled_before:
+            next_cursor = _format_cursor(offer)
+
+    bookmarked_hotel_ids = set()
+    if request.user.is_authenticated and page:
+        bookmarked_hotel_ids = set(Bookmark.objects.filter(
+            user=request.user, hotel_id__in=[offer.hotel_id for offer in page]
+        ).values_list('hotel_id', flat=True))
+
+    hotels_data = [dict(offer_to_event(o), is_bookmarked=o.hotel_id in bookmarked_hotel_ids) for o in page]
+    if page:
+        # How long the oldest of these hotels sat in the DB before a poll picked it up.
+        saved_at = min(offer.scraped_at for offer in page).timestamp()
+        tracing.record('poll.delay', tracing.root_context(task_id), saved_at, time.time(), hotels=len(page))
     
-    LOGGER.info(f"Found {len(hotels_data)} best-priced hotels in DB for task {task_id}. Task status: {task.status}")
+    LOGGER.info(f"Found {len(hotels_data)} new or changed hotels in DB for task {task_id}. Task status: {task.status}")
 
     error_message = None
     # Check for failures specifically.
@@ -218,13 +328,81 @@ def poll_search_results(request, task_id):
         else:
             error_message = f"Task failed: {task.result}"
 
-    return JsonResponse({
+    response = JsonResponse({
         'status': task.status,
         'hotels': hotels_data,
         'error': error_message,
+        'cursor': next_cursor,
+        'has_more': has_more,
+    })
+    if etag:
+        response['ETag'] = etag
+    return response
+
+
+async def stream_search_results(request, task_id):
+    """
+    Server-Sent Events endpoint for a search.
+    Pushes each hotel as soon as the pipeline persists it, one final status event
+    per spider and a closing 'done' event. Runs without blocking a worker under ASGI.
+    """
+    task_id = str(task_id)
+
+    bookmarked_hotel_ids = []
+    user = await request.auser()
+    if user.is_authenticated:
+        bookmarked_hotel_ids = [
+            hotel_id async for hotel_id in Bookmark.objects.filter(user=user).values_list('hotel_id', flat=True)
+        ]
+
+    def snapshot_hotels():
+        run_id = _get_run_id(task_id)
+        if run_id is None:
+            return []
+        return [offer_to_event(offer) for offer in best_offers(run_id).order_by('id')]
+
+    if isinstance(request, ASGIRequest):
+        events = async_search_event_stream(task_id, sync_to_async(snapshot_hotels), bookmarked_hotel_ids)
+    else:
+        events = search_event_stream(task_id, snapshot_hotels, bookmarked_hotel_ids)
+
+    response = StreamingHttpResponse(events, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no' # don't let a reverse proxy buffer the stream
+    return response
+
+
+def hotel_price_trend(request, hotel_id):
+    """
+    API endpoint: a hotel's price trend (min/avg/max per bucket) over `?days=` (default 90),
+    by `?granularity=day|hour`. Served from the rollups only.
+    """
+    granularity = request.GET.get('granularity', PriceRollup.DAY)
+    if granularity not in (PriceRollup.DAY, PriceRollup.HOUR):
+        return JsonResponse({'status': 'error', 'message': 'granularity must be day or hour'}, status=400)
+    try:
+        days = min(max(int(request.GET.get('days', 90)), 1), 366)
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'days must be an integer'}, status=400)
+
+    hotel = get_object_or_404(Hotel, id=hotel_id)
+    return JsonResponse({
+        'hotel_id': hotel.id,
+        'name': hotel.name,
+        'granularity': granularity,
+        'days': days,
+        'points': price_trend(hotel.id, days=days, granularity=granularity),
     })
 
 
+def metrics_view(request):
+    """
+    Prometheus scrape endpoint: the metrics of every web, Celery and crawler process.
+    """
+    body, content_type = metrics.render()
+    return HttpResponse(body, content_type=content_type)
+
+
 @login_required
 def toggle_bookmark(request, hotel_id):
     """
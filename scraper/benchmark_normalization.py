@@ -0,0 +1,104 @@
+"""
+Micro-benchmark of the spiders' normalization step and of the item they emit.
+
+Every card of the recorded pages in benchmark_data/pages/ (see benchmark_parsers.py)
+is extracted once; the raw values are then run through
+`normalization.normalize_hotel` and turned into HotelItems. It reports:
+
+    us/item      - normalize_hotel plus HotelItem construction, per item
+    per function - the parsers normalize_hotel is made of, per call
+    bytes/item   - memory of N items held at once (tracemalloc), HotelItem next to
+                   a dict-backed scrapy.Item with the same fields
+
+Run it from the scraper directory:
+
+    uv run python benchmark_normalization.py --items 20000
+"""
+import argparse
+import dataclasses
+import statistics
+import time
+import tracemalloc
+
+import scrapy
+from loguru import logger as LOGGER
+
+from benchmark_parsers import load_pages, make_response
+from scraper import normalization
+from scraper.items import HotelItem
+from scraper.spiders.agoda_spider import AgodaSpider
+from scraper.spiders.booking_spider import BookingSpider
+
+SPIDERS = {spider.name: spider for spider in (BookingSpider, AgodaSpider)}
+PARSERS = {
+    'parse_price': 'price',
+    'parse_rating': 'rating',
+    'parse_stars': 'stars',
+    'split_location': 'location',
+    'canonical_hotel_url': 'hotel_url',
+}
+
+
+# The dict-backed item shape HotelItem replaced, for the memory comparison.
+DictItem = type('DictItem', (scrapy.Item,), {field.name: scrapy.Field() for field in dataclasses.fields(HotelItem)})
+
+
+def raw_values(pages):
+    """
+    normalize_hotel keyword arguments for every card on the DOM-parsed pages.
+    """
+    values = []
+    for page in pages:
+        extractor = SPIDERS[page['spider']].extractor
+        for card in extractor.extract(make_response(page)):
+            if page['spider'] == AgodaSpider.name:
+                card['price'] = card.pop('final_price')
+                card['currency'] = normalization.parse_currency(card.pop('price_currency')) or AgodaSpider.currency_code
+            values.append(card)
+    return values
+
+
+def time_per_call(function, arguments, repeat):
+    rounds = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for argument in arguments:
+            function(argument)
+        rounds.append((time.perf_counter() - started) / len(arguments))
+    return statistics.median(rounds) * 1e6
+
+
+def bytes_per_item(make_item, fields, count):
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    items = [make_item(fields[index % len(fields)]) for index in range(count)]
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del items
+    return (after - before) / count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=10, help='Timed rounds (the median is reported).')
+    parser.add_argument('--items', type=int, default=10000, help='Items held at once for the memory comparison.')
+    args = parser.parse_args()
+
+    LOGGER.remove() # the Agoda spider logs through loguru; keep the report readable
+    values = raw_values(load_pages())
+    print(f"{len(values)} cards from the recorded DOM pages\n")
+
+    normalize = lambda card: HotelItem(search_task_id='benchmark', source='benchmark', **normalization.normalize_hotel(**card))
+    print(f"{'normalize_hotel + HotelItem':<28} {time_per_call(normalize, values, args.repeat):>7.2f} us/item")
+    for name, field in PARSERS.items():
+        arguments = [card[field] for card in values if card.get(field) is not None]
+        print(f"  {name:<26} {time_per_call(getattr(normalization, name), arguments, args.repeat):>7.2f} us/call")
+
+    fields = [dataclasses.asdict(normalize(card)) for card in values]
+    print()
+    print(f"{'HotelItem (slotted)':<28} {bytes_per_item(lambda f: HotelItem(**f), fields, args.items):>7.0f} bytes/item")
+    print(f"{'scrapy.Item (dict-backed)':<28} {bytes_per_item(lambda f: DictItem(**f), fields, args.items):>7.0f} bytes/item")
+
+
+if __name__ == '__main__':
+    main()
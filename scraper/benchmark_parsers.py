@@ -0,0 +1,227 @@
+"""
+Offline micro-benchmark of the spiders' parse callbacks on recorded result pages.
+
+Every page in benchmark_data/pages/<source>/ is a gzipped HTML snapshot with a
+`.expected.json` next to it (the items and next-page URLs the parser must produce).
+Each page is wrapped in an HtmlResponse and fed to the spider's `parse`, so nothing
+touches the network, Playwright, Redis or the database. Per page it reports:
+
+    items/s   - items yielded per second, HTML tree build included
+    us/card   - extraction time per card, tree already built
+    dom ms    - time lxml takes to build the tree
+    peak KiB  - peak Python memory while parsing (tracemalloc; lxml's own C
+                allocations are not traced)
+
+Any field that differs from the expectations fails the run (exit status 1), so a
+faster parser can't quietly become a wrong one. Run it from the scraper directory:
+
+    uv run python benchmark_parsers.py --repeat 20
+    uv run python benchmark_parsers.py --save before.json
+    uv run python benchmark_parsers.py --compare before.json
+
+Add a page by saving a live results page from the browser and recording it; the
+expectations come from the current parser, so check them by hand before committing:
+
+    uv run python benchmark_parsers.py record saved.html --spider agoda_spider \\
+        --url 'https://www.agoda.com/en-gb/search?city=233' --name agoda/london_p2
+"""
+import argparse
+import dataclasses
+import gzip
+import json
+import statistics
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+import scrapy
+from loguru import logger as LOGGER
+from scrapy.http import HtmlResponse
+
+from scraper.items import HotelItem
+from scraper.spiders.agoda_spider import AgodaSpider
+from scraper.spiders.booking_spider import BookingSpider
+
+PAGES_DIR = Path(__file__).resolve().parent / 'benchmark_data' / 'pages'
+SPIDERS = {spider.name: spider for spider in (BookingSpider, AgodaSpider)}
+ITEM_FIELDS = tuple(field.name for field in dataclasses.fields(HotelItem))
+SEARCH_TASK_ID = 'benchmark'
+
+
+def load_pages(spider_filter=None):
+    pages = []
+    for expected_path in sorted(PAGES_DIR.glob('*/*.expected.json')):
+        expected = json.loads(expected_path.read_text(encoding='utf-8'))
+        if spider_filter and expected['spider'] != spider_filter:
+            continue
+        html_path = expected_path.with_name(expected_path.name.replace('.expected.json', '.html.gz'))
+        expected['name'] = str(html_path.relative_to(PAGES_DIR)).replace('.html.gz', '')
+        expected['body'] = gzip.decompress(html_path.read_bytes())
+        pages.append(expected)
+    return pages
+
+
+def make_spider(spider_name, city):
+    return SPIDERS[spider_name](city=city, search_task_id=SEARCH_TASK_ID)
+
+
+def make_response(page):
+    return HtmlResponse(url=page['url'], body=page['body'], encoding='utf-8')
+
+
+def serialize_item(item):
+    """
+    Item -> plain JSON values, so expectations can be stored and diffed.
+    """
+    return {field: (str(getattr(item, field)) if getattr(item, field) is not None else None) for field in ITEM_FIELDS}
+
+
+def run_parse(spider, response):
+    items, next_pages = [], []
+    for result in spider.parse(response):
+        if isinstance(result, scrapy.Request):
+            next_pages.append(result.url)
+        else:
+            items.append(result)
+    return items, next_pages
+
+
+def check_page(page, items, next_pages):
+    """
+    Returns a list of human-readable differences from the page's expectations.
+    """
+    errors = []
+    expected_items = page['items']
+    if len(items) != len(expected_items):
+        errors.append(f"expected {len(expected_items)} items, got {len(items)}")
+    for index, (item, expected) in enumerate(zip(items, expected_items)):
+        actual = serialize_item(item)
+        for field in ITEM_FIELDS:
+            if actual[field] != expected.get(field):
+                errors.append(f"item {index} {field}: expected {expected.get(field)!r}, got {actual[field]!r}")
+    if next_pages != page['next_pages']:
+        errors.append(f"next pages: expected {page['next_pages']}, got {next_pages}")
+    return errors
+
+
+def benchmark_page(page, repeat):
+    spider = make_spider(page['spider'], page['city'])
+
+    items, next_pages = run_parse(spider, make_response(page))
+    errors = check_page(page, items, next_pages)
+
+    totals, doms, extracts = [], [], []
+    for _ in range(repeat):
+        # A fresh response per round: Scrapy caches the parsed tree on the response.
+        response = make_response(page)
+        started = time.perf_counter()
+        response.selector
+        built = time.perf_counter()
+        run_parse(spider, response)
+        finished = time.perf_counter()
+        totals.append(finished - started)
+        doms.append(built - started)
+        extracts.append(finished - built)
+
+    tracemalloc.start()
+    response = make_response(page)
+    tracemalloc.reset_peak()
+    run_parse(spider, response)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    cards = max(len(items), 1)
+    return {
+        'page': page['name'],
+        'items': len(items),
+        'items_per_sec': len(items) / statistics.median(totals),
+        'us_per_card': statistics.median(extracts) / cards * 1e6,
+        'dom_ms': statistics.median(doms) * 1e3,
+        'peak_kib': peak / 1024,
+        'errors': errors,
+    }
+
+
+def print_results(results, baseline=None):
+    header = f"{'page':<34} {'items':>5} {'items/s':>9} {'us/card':>8} {'dom ms':>7} {'peak KiB':>9}"
+    print(header + ('  speedup (items/s, us/card)' if baseline else ''))
+    for result in results:
+        line = (f"{result['page']:<34} {result['items']:>5} {result['items_per_sec']:>9.0f} "
+                f"{result['us_per_card']:>8.1f} {result['dom_ms']:>7.1f} {result['peak_kib']:>9.0f}")
+        before = (baseline or {}).get(result['page'])
+        if before:
+            line += (f"  {result['items_per_sec'] / before['items_per_sec']:.2f}x, "
+                     f"{before['us_per_card'] / result['us_per_card']:.2f}x")
+        print(line)
+        for error in result['errors'][:10]:
+            print(f"    MISMATCH {error}")
+        if len(result['errors']) > 10:
+            print(f"    ... and {len(result['errors']) - 10} more")
+
+
+def record(args):
+    """
+    Adds a saved page to the corpus, with the current parser's output as its expectations.
+    """
+    body = Path(args.html).read_bytes()
+    html_path = PAGES_DIR / f"{args.name}.html.gz"
+    html_path.parent.mkdir(parents=True, exist_ok=True)
+    page = {'spider': args.spider, 'city': args.city, 'url': args.url, 'body': body}
+    items, next_pages = run_parse(make_spider(args.spider, args.city), make_response(page))
+    if not items:
+        sys.exit(f"{args.spider} found no items in {args.html}; not recording it.")
+
+    with open(html_path, 'wb') as raw, gzip.GzipFile(fileobj=raw, mode='wb', mtime=0) as compressed:
+        compressed.write(body)
+    expected = {
+        'spider': args.spider,
+        'city': args.city,
+        'url': args.url,
+        'next_pages': next_pages,
+        'items': [serialize_item(item) for item in items],
+    }
+    expected_path = html_path.with_name(html_path.name.replace('.html.gz', '.expected.json'))
+    expected_path.write_text(json.dumps(expected, indent=2, ensure_ascii=False) + '\n', encoding='utf-8')
+    print(f"Recorded {len(items)} items to {expected_path.relative_to(PAGES_DIR.parent.parent)}; review them before committing.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--spider', choices=sorted(SPIDERS), help='Only benchmark pages of this spider.')
+    parser.add_argument('--repeat', type=int, default=10, help='Timed rounds per page (the median is reported).')
+    parser.add_argument('--save', help='Write the results to this JSON file.')
+    parser.add_argument('--compare', help='Show the speedup over results saved with --save.')
+    subparsers = parser.add_subparsers(dest='command')
+    record_parser = subparsers.add_parser('record', help='Add a saved results page to the corpus.')
+    record_parser.add_argument('html', help='Path of the saved page.')
+    record_parser.add_argument('--spider', required=True, choices=sorted(SPIDERS))
+    record_parser.add_argument('--url', required=True, help='URL the page was saved from (relative links resolve against it).')
+    record_parser.add_argument('--name', required=True, help='Corpus name, e.g. agoda/london_p2.')
+    record_parser.add_argument('--city', default='London')
+    args = parser.parse_args()
+
+    LOGGER.remove() # the Agoda spider logs through loguru; keep the report readable
+    if args.command == 'record':
+        record(args)
+        return
+
+    pages = load_pages(args.spider)
+    if not pages:
+        sys.exit(f"No recorded pages found in {PAGES_DIR}")
+    results = [benchmark_page(page, args.repeat) for page in pages]
+
+    baseline = None
+    if args.compare:
+        baseline = {result['page']: result for result in json.loads(Path(args.compare).read_text())}
+    print_results(results, baseline)
+    if args.save:
+        Path(args.save).write_text(json.dumps([{k: v for k, v in r.items() if k != 'errors'} for r in results], indent=2))
+
+    failed = [result['page'] for result in results if result['errors']]
+    if failed:
+        sys.exit(f"Parser output differs from the recorded expectations on: {', '.join(failed)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+# scraper/scraper/embedded_json.py
+"""
+Search results shipped as JSON inside the page.
+
+Both sites hydrate their result lists from a JSON blob in a <script> (Booking's
+Apollo store, Agoda's citySearch payload), present in the plain HTTP response
+before any JavaScript runs. Reading it needs neither a browser nor an lxml tree:
+the blob is found with a substring search and decoded in place with
+`JSONDecoder.raw_decode`, which stops at the end of the value, so the rest of
+the page is never copied or parsed.
+
+    embedded_json = EmbeddedJson('data-capla-store-data="apollo">', locate=find_search_query)
+    search = embedded_json.find(response) # None -> parse the DOM instead
+"""
+import json
+
+_decoder = json.JSONDecoder()
+
+
+class EmbeddedJson:
+    """
+    A JSON value that starts right after `marker` in a page. `locate(data)` returns
+    the part of the decoded value holding the results, or None when it has none.
+    """
+
+    def __init__(self, marker, locate):
+        self.marker = marker
+        self.locate = locate
+
+    def present(self, response):
+        return self.marker in response.text
+
+    def decode(self, response):
+        text = response.text
+        position = text.find(self.marker)
+        if position == -1:
+            return None
+        position += len(self.marker)
+        starts = [index for index in (text.find('{', position), text.find('[', position)) if index != -1]
+        if not starts:
+            return None
+        try:
+            value, _ = _decoder.raw_decode(text, min(starts))
+        except ValueError:
+            return None
+        return value
+
+    def find(self, response):
+        data = self.decode(response)
+        if data is None:
+            return None
+        try:
+            return self.locate(data)
+        except (AttributeError, KeyError, IndexError, TypeError):
+            return None # the site changed the shape; the caller falls back to the DOM
+
+
+def dig(data, *keys, default=None):
+    """
+    dig(result, 'displayName', 'text') -> result['displayName']['text'], or `default`
+    as soon as a key (or list index) is missing.
+    """
+    for key in keys:
+        try:
+            data = data[key]
+        except (KeyError, IndexError, TypeError):
+            return default
+        if data is None:
+            return default
+    return data
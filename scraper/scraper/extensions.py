@@ -0,0 +1,324 @@
+# scraper/scraper/extensions.py
+"""
+Scrapy extensions of the scraper project.
+"""
+import re
+import time
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from scrapy.http import TextResponse
+
+from hotel_search import metrics, tracing
+from hotel_search.crawl_output import format_progress
+from .search_filters import qualifies
+
+
+class AdaptiveConcurrency:
+    """
+    Per-domain concurrency and delay that follow what each site tolerates.
+
+    Every response is classified by the downloader slot (domain) it came from:
+
+    - backoff  - a status in ADAPTIVE_CONCURRENCY_BACKOFF_STATUSES (429, 403, 5xx),
+                 a captcha/challenge page (ADAPTIVE_CONCURRENCY_CAPTCHA_MARKERS) or a
+                 download that failed without a response: concurrency is halved and
+                 the delay doubled (at least ADAPTIVE_CONCURRENCY_BACKOFF_DELAY, and at
+                 least Retry-After), up to ADAPTIVE_CONCURRENCY_MAX_DELAY;
+    - slow     - latency above ADAPTIVE_CONCURRENCY_TARGET_LATENCY: one request fewer
+                 in flight;
+    - healthy  - anything else. After ADAPTIVE_CONCURRENCY_RAMP_UP_AFTER healthy
+                 responses in a row, one more request in flight (up to
+                 ADAPTIVE_CONCURRENCY_MAX) and half the delay (down to
+                 ADAPTIVE_CONCURRENCY_MIN_DELAY).
+
+    Slots start from CONCURRENT_REQUESTS_PER_DOMAIN and DOWNLOAD_DELAY. Every decision
+    is counted in stats under `adaptive_concurrency/<domain>/`, next to the slot's
+    current `concurrency` and `delay_ms`.
+    """
+
+    def __init__(self, crawler):
+        settings = crawler.settings
+        if not settings.getbool('ADAPTIVE_CONCURRENCY_ENABLED'):
+            raise NotConfigured
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.max_concurrency = settings.getint('ADAPTIVE_CONCURRENCY_MAX', 8)
+        self.min_delay = settings.getfloat('ADAPTIVE_CONCURRENCY_MIN_DELAY', 0.25)
+        self.max_delay = settings.getfloat('ADAPTIVE_CONCURRENCY_MAX_DELAY', 60.0)
+        self.backoff_delay = settings.getfloat('ADAPTIVE_CONCURRENCY_BACKOFF_DELAY', 2.0)
+        self.target_latency = settings.getfloat('ADAPTIVE_CONCURRENCY_TARGET_LATENCY', 5.0)
+        self.ramp_up_after = settings.getint('ADAPTIVE_CONCURRENCY_RAMP_UP_AFTER', 5)
+        self.backoff_statuses = {int(status) for status in settings.getlist(
+            'ADAPTIVE_CONCURRENCY_BACKOFF_STATUSES', [429, 403, 500, 502, 503, 504],
+        )}
+        markers = settings.getlist('ADAPTIVE_CONCURRENCY_CAPTCHA_MARKERS')
+        self.captcha_re = re.compile('|'.join(re.escape(marker) for marker in markers), re.IGNORECASE) if markers else None
+        self.healthy_streaks = {}
+
+        crawler.signals.connect(self.request_reached_downloader, signal=signals.request_reached_downloader)
+        crawler.signals.connect(self.request_left_downloader, signal=signals.request_left_downloader)
+        crawler.signals.connect(self.response_downloaded, signal=signals.response_downloaded)
+        crawler.signals.connect(self.response_received, signal=signals.response_received)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def _slot(self, request):
+        key = request.meta.get('download_slot')
+        return key, self.crawler.engine.downloader.slots.get(key)
+
+    def request_reached_downloader(self, request, spider):
+        # Retries and Playwright escalations copy meta; only this attempt's latency counts.
+        request.meta.pop('download_latency', None)
+
+    def request_left_downloader(self, request, spider):
+        if 'download_latency' not in request.meta: # the download failed before any response
+            key, slot = self._slot(request)
+            if slot is not None:
+                self._back_off(key, slot, 'error', spider)
+
+    def response_downloaded(self, response, request, spider):
+        # Fired before the downloader middlewares, so retried 429/5xx responses are seen too.
+        key, slot = self._slot(request)
+        if slot is None:
+            return
+        if response.status in self.backoff_statuses:
+            self._back_off(key, slot, str(response.status), spider, retry_after=response.headers.get('Retry-After'))
+        elif request.meta.get('download_latency', 0) > self.target_latency:
+            self.healthy_streaks[key] = 0
+            self._set(key, slot, max(1, slot.concurrency - 1), slot.delay, 'slow')
+        else:
+            self.healthy_streaks[key] = self.healthy_streaks.get(key, 0) + 1
+            if self.healthy_streaks[key] >= self.ramp_up_after:
+                self.healthy_streaks[key] = 0
+                self._set(key, slot, min(self.max_concurrency, slot.concurrency + 1), max(self.min_delay, slot.delay / 2), 'ramp_up')
+
+    def response_received(self, response, request, spider):
+        # Bodies are only decompressed by now. A plain-HTTP challenge page is escalated to
+        # Playwright by HybridRenderingMiddleware before this; the rendered one is caught here.
+        if self.captcha_re and isinstance(response, TextResponse) and self.captcha_re.search(response.text):
+            key, slot = self._slot(request)
+            if slot is not None:
+                self._back_off(key, slot, 'captcha', spider)
+
+    def _back_off(self, key, slot, reason, spider, retry_after=None):
+        self.healthy_streaks[key] = 0
+        delay = max(slot.delay * 2, self.backoff_delay)
+        if retry_after:
+            try:
+                delay = max(delay, float(retry_after))
+            except ValueError: # an HTTP date; the doubled delay will do
+                pass
+        self._set(key, slot, max(1, slot.concurrency // 2), min(self.max_delay, delay), f'back_off/{reason}')
+        spider.logger.info(
+            f"Backing off {key} ({reason}): concurrency {slot.concurrency}, delay {slot.delay:.2f}s"
+        )
+
+    def _set(self, key, slot, concurrency, delay, decision):
+        slot.concurrency = concurrency
+        slot.delay = delay
+        self.stats.inc_value(f'adaptive_concurrency/{key}/{decision}')
+        self.stats.set_value(f'adaptive_concurrency/{key}/concurrency', concurrency)
+        self.stats.set_value(f'adaptive_concurrency/{key}/delay_ms', int(delay * 1000))
+
+
+class TopKEarlyStop:
+    """
+    Closes a spider once it has scraped SEARCH_TOP_K qualifying results.
+
+    Only spiders with `sorted_by_price = True` are stopped: they ask the site for the
+    cheapest results first, so the first K results within the spider's `max_price` and
+    `min_stars` are (up to the site's own ordering) the K cheapest, and the remaining
+    pages can only add pricier ones. Pages already requested are dropped with the
+    spider, which closes with finish_reason 'top_k_reached'. SEARCH_TOP_K = 0 disables it.
+    """
+
+    def __init__(self, crawler, top_k):
+        self.crawler = crawler
+        self.top_k = top_k
+        self.qualifying = 0
+        self.stopping = False
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        top_k = crawler.settings.getint('SEARCH_TOP_K')
+        if top_k <= 0:
+            raise NotConfigured
+        extension = cls(crawler, top_k)
+        crawler.signals.connect(extension.item_scraped, signal=signals.item_scraped)
+        return extension
+
+    def item_scraped(self, item, spider):
+        if self.stopping or not getattr(spider, 'sorted_by_price', False):
+            return
+        if not qualifies(item, getattr(spider, 'max_price', None), getattr(spider, 'min_stars', None)):
+            return
+        self.qualifying += 1
+        self.crawler.stats.set_value('top_k/qualifying', self.qualifying)
+        if self.qualifying >= self.top_k:
+            self.stopping = True
+            spider.logger.info(f"Collected the top {self.top_k} results by price; stopping {spider.name}.")
+            self.crawler.engine.close_spider(spider, 'top_k_reached')
+
+
+class PrometheusMetrics:
+    """
+    Feeds the crawl's signals and final stats into the Prometheus metrics of
+    hotel_search/metrics.py (served at the Django app's /metrics):
+
+    - every download: pages by status and renderer (http / playwright), bytes as
+      received and download latency. Cache hits aren't downloads and aren't counted;
+    - every item scraped or dropped;
+    - when the spider closes, from the stats collector: the finish reason, the
+      crawl's item_scraped_count and its duration.
+
+    Parse time is recorded by ParseTimeMiddleware and flush latency by
+    BulkHotelScraperPipeline. METRICS_ENABLED = False disables it.
+    """
+
+    def __init__(self, crawler):
+        self.stats = crawler.stats
+        crawler.signals.connect(self.response_downloaded, signal=signals.response_downloaded)
+        crawler.signals.connect(self.item_scraped, signal=signals.item_scraped)
+        crawler.signals.connect(self.item_dropped, signal=signals.item_dropped)
+        crawler.signals.connect(self.spider_closed, signal=signals.spider_closed)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool('METRICS_ENABLED'):
+            raise NotConfigured
+        return cls(crawler)
+
+    def response_downloaded(self, response, request, spider):
+        renderer = 'playwright' if request.meta.get('playwright') else 'http'
+        metrics.PAGES_FETCHED.labels(spider=spider.name, status=response.status, renderer=renderer).inc()
+        metrics.RESPONSE_BYTES.labels(spider=spider.name).inc(len(response.body))
+        if 'download_latency' in request.meta:
+            metrics.DOWNLOAD_SECONDS.labels(spider=spider.name, renderer=renderer).observe(request.meta['download_latency'])
+
+    def item_scraped(self, item, spider):
+        metrics.ITEMS.labels(spider=spider.name, outcome='scraped').inc()
+
+    def item_dropped(self, item, spider, exception):
+        metrics.ITEMS.labels(spider=spider.name, outcome='dropped').inc()
+
+    def spider_closed(self, spider, reason):
+        metrics.CRAWLS.labels(spider=spider.name, finish_reason=reason).inc()
+        metrics.CRAWL_ITEMS.labels(spider=spider.name).observe(self.stats.get_value('item_scraped_count', 0))
+        elapsed = self.stats.get_value('elapsed_time_seconds') # set by CoreStats on spider_closed, before this
+        if elapsed is not None:
+            metrics.CRAWL_SECONDS.labels(spider=spider.name).observe(elapsed)
+
+
+class SearchTracing:
+    """
+    Adds the crawl to its search's trace (see hotel_search/tracing.py). Spiders get
+    the context as the `traceparent` and `trace_launched_at` arguments; untraced
+    crawls are left alone. Spans, all children of the task's spider.run span:
+
+    - spider.startup: from the task launching the crawl to the spider opening;
+    - request.wait: from a request being scheduled to reaching the downloader
+      (scheduler, rate limit and other downloader middlewares);
+    - download.http / download.playwright: from reaching the downloader (the slot's
+      delay included) to the response, or to the failure.
+
+    Parse spans come from ParseTimeMiddleware and flush spans from the pipeline.
+    """
+
+    def __init__(self, crawler):
+        self.parent = None
+        crawler.signals.connect(self.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(self.request_scheduled, signal=signals.request_scheduled)
+        crawler.signals.connect(self.request_reached_downloader, signal=signals.request_reached_downloader)
+        crawler.signals.connect(self.response_downloaded, signal=signals.response_downloaded)
+        crawler.signals.connect(self.request_left_downloader, signal=signals.request_left_downloader)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def spider_opened(self, spider):
+        self.parent = tracing.parse_traceparent(getattr(spider, 'traceparent', None))
+        launched_at = getattr(spider, 'trace_launched_at', None)
+        if self.parent and launched_at:
+            tracing.record('spider.startup', self.parent, float(launched_at), time.time(), spider=spider.name)
+
+    def request_scheduled(self, request, spider):
+        if self.parent:
+            request.meta['trace_scheduled_at'] = time.time()
+
+    def request_reached_downloader(self, request, spider):
+        if not self.parent:
+            return
+        now = time.time()
+        request.meta['trace_download_started_at'] = now
+        if 'trace_scheduled_at' in request.meta:
+            tracing.record('request.wait', self.parent, request.meta.pop('trace_scheduled_at'), now, url=request.url)
+
+    def response_downloaded(self, response, request, spider):
+        self._record_download(request, status=response.status, latency=request.meta.get('download_latency'))
+
+    def request_left_downloader(self, request, spider):
+        self._record_download(request, error='no response') # only if response_downloaded didn't already
+
+    def _record_download(self, request, **attributes):
+        started = request.meta.pop('trace_download_started_at', None)
+        if started is not None:
+            name = 'download.playwright' if request.meta.get('playwright') else 'download.http'
+            tracing.record(name, self.parent, started, time.time(), url=request.url, **attributes)
+
+
+class CrawlProgress:
+    """
+    Reports how far the crawl has got: pages done (cache hits included), items scraped
+    and the current page, at most every CRAWL_PROGRESS_INTERVAL seconds, plus a final
+    event with the finish reason when the spider closes.
+
+    In-process crawls get a `progress_callback` spider argument and the events go to
+    it; `scrapy crawl` subprocesses log them as CRAWL_PROGRESS lines, which the Celery
+    task picks out of the streamed output (see hotel_search/crawl_output.py).
+    CRAWL_PROGRESS_INTERVAL = 0 disables it.
+    """
+
+    def __init__(self, crawler, interval):
+        self.interval = interval
+        self.pages = 0
+        self.items = 0
+        self.page = None
+        self.last_reported = 0.0
+        crawler.signals.connect(self.response_received, signal=signals.response_received)
+        crawler.signals.connect(self.item_scraped, signal=signals.item_scraped)
+        crawler.signals.connect(self.spider_closed, signal=signals.spider_closed)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        interval = crawler.settings.getfloat('CRAWL_PROGRESS_INTERVAL')
+        if interval <= 0:
+            raise NotConfigured
+        return cls(crawler, interval)
+
+    def response_received(self, response, request, spider):
+        self.pages += 1
+        self.page = response.url
+        self._report(spider)
+
+    def item_scraped(self, item, spider):
+        self.items += 1
+        self._report(spider)
+
+    def spider_closed(self, spider, reason):
+        self._report(spider, finish_reason=reason)
+
+    def _report(self, spider, **extra):
+        now = time.monotonic()
+        if not extra and now - self.last_reported < self.interval:
+            return
+        self.last_reported = now
+        event = {'pages': self.pages, 'items': self.items, 'page': self.page, **extra}
+        callback = getattr(spider, 'progress_callback', None)
+        if callable(callback):
+            callback(event)
+        else:
+            spider.logger.info(format_progress(event))
@@ -0,0 +1,75 @@
+# scraper/scraper/extraction.py
+"""
+Precompiled extraction of result cards.
+
+`card.css(...)` on a Scrapy Selector translates CSS to XPath, compiles it, walks
+the card and wraps every match in a new Selector, once per field per card. A
+CardExtractor does the translation and compilation once, when the spider class
+is defined, and then runs the compiled expressions straight on the lxml
+elements of the already-parsed page:
+
+    extractor = CardExtractor('li.card', {
+        'name': Field('h3::text'),
+        'hotel_url': Field('a::attr(href)', url=True),
+        'stars': Field('.stars svg', count=True),
+    })
+    for values in extractor.extract(response):
+        values['name'], values['hotel_url'], values['stars']
+
+Text and attribute values come back stripped (None when there is no match or only
+whitespace), URLs absolute, counts as ints.
+"""
+from urllib.parse import urljoin
+
+from lxml import etree
+from parsel.csstranslator import css2xpath
+
+
+def _compile(query):
+    return etree.XPath(css2xpath(query), smart_strings=False)
+
+
+class Field:
+    """
+    One value of a card: the first non-blank match of `queries` (CSS, tried in order),
+    or the number of elements the first query matches when `count` is set.
+    """
+    __slots__ = ('queries', 'xpaths', 'url', 'count')
+
+    def __init__(self, *queries, url=False, count=False):
+        self.queries = queries
+        self.xpaths = [_compile(query) for query in queries]
+        self.url = url
+        self.count = count
+
+    def extract(self, element, base_url):
+        if self.count:
+            return len(self.xpaths[0](element))
+        for xpath in self.xpaths:
+            for match in xpath(element):
+                value = match.strip() if isinstance(match, str) else (match.text or '').strip()
+                if value:
+                    if self.url and not value.startswith(('https://', 'http://')):
+                        return urljoin(base_url, value)
+                    return value
+        return None
+
+
+class CardExtractor:
+    """
+    Pulls every field of every card matching `card_selector` out of a response.
+    """
+
+    def __init__(self, card_selector, fields):
+        self.card_selector = card_selector
+        self.card_xpath = _compile(card_selector)
+        self.fields = fields
+
+    def cards(self, response):
+        return self.card_xpath(response.selector.root)
+
+    def extract(self, response):
+        base_url = response.url
+        fields = list(self.fields.items())
+        for card in self.cards(response):
+            yield {name: field.extract(card, base_url) for name, field in fields}
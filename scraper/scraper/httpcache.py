@@ -0,0 +1,130 @@
+# scraper/scraper/httpcache.py
+"""
+HTTP cache storage for search result pages.
+
+Repeated searches for the same city and dates fetch the same pages within minutes
+of each other. `SqliteZstdCacheStorage` plugs into Scrapy's HttpCacheMiddleware
+(HTTPCACHE_STORAGE) and keeps those pages in one SQLite file per spider under
+HTTPCACHE_DIR:
+
+- the key is the canonical search URL: query parameters sorted and the volatile
+  ones in HTTPCACHE_IGNORE_QUERY_PARAMS (srpvid, searchrequestid, label, ...)
+  dropped, so two searches differing only in tracking ids share an entry;
+- bodies are zstd-compressed (HTTPCACHE_ZSTD_LEVEL), a results page shrinks ~10x;
+- entries live HTTPCACHE_TTL_MINUTES[spider name] minutes (HTTPCACHE_EXPIRATION_SECS
+  for other spiders) and are purged when a spider opens;
+- the database is in WAL mode, so any number of crawler processes read it while
+  one writes.
+
+HttpCacheMiddleware counts `httpcache/hit` and `httpcache/miss`; the storage adds
+`httpcache/hit_rate` when the spider closes.
+"""
+import hashlib
+import sqlite3
+import time
+from pathlib import Path
+
+import zstandard
+from scrapy.http import Headers
+from scrapy.responsetypes import responsetypes
+from scrapy.utils.project import data_path
+from w3lib.http import headers_dict_to_raw, headers_raw_to_dict
+from w3lib.url import canonicalize_url, url_query_cleaner
+
+DEFAULT_IGNORE_QUERY_PARAMS = ['srpvid', 'searchrequestid', 'label']
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    status INTEGER NOT NULL,
+    headers BLOB NOT NULL,
+    body BLOB NOT NULL,
+    stored_at REAL NOT NULL
+)
+"""
+
+
+def canonical_url(url, ignore_params=DEFAULT_IGNORE_QUERY_PARAMS):
+    """
+    'https://www.booking.com/searchresults.html?ss=London&srpvid=ab12&checkin=2025-08-01'
+    -> 'https://www.booking.com/searchresults.html?checkin=2025-08-01&ss=London'
+    """
+    return canonicalize_url(url_query_cleaner(url, ignore_params, remove=True, keep_fragments=False))
+
+
+class SqliteZstdCacheStorage:
+
+    def __init__(self, settings):
+        self.cachedir = Path(data_path(settings['HTTPCACHE_DIR'], createdir=True))
+        self.expiration_secs = settings.getint('HTTPCACHE_EXPIRATION_SECS')
+        self.ttl_minutes = settings.getdict('HTTPCACHE_TTL_MINUTES')
+        self.ignore_params = settings.getlist('HTTPCACHE_IGNORE_QUERY_PARAMS', DEFAULT_IGNORE_QUERY_PARAMS)
+        self.busy_timeout = settings.getfloat('HTTPCACHE_SQLITE_TIMEOUT', 5.0)
+        self.compressor = zstandard.ZstdCompressor(level=settings.getint('HTTPCACHE_ZSTD_LEVEL', 3))
+        self.decompressor = zstandard.ZstdDecompressor()
+        self.db = None
+        self.ttl_secs = 0
+
+    def open_spider(self, spider):
+        minutes = self.ttl_minutes.get(spider.name)
+        self.ttl_secs = float(minutes) * 60 if minutes is not None else self.expiration_secs
+
+        path = self.cachedir / f"{spider.name}.sqlite3"
+        self.db = sqlite3.connect(path, timeout=self.busy_timeout, isolation_level=None)
+        self.db.execute('PRAGMA journal_mode=WAL') # readers never wait for the writer
+        self.db.execute('PRAGMA synchronous=NORMAL') # a lost last write only costs a refetch
+        self.db.execute(_SCHEMA)
+        if self.ttl_secs > 0:
+            try:
+                purged = self.db.execute('DELETE FROM responses WHERE stored_at < ?', (time.time() - self.ttl_secs,)).rowcount
+            except sqlite3.OperationalError: # another process holds the write lock; it'll purge
+                purged = 0
+            spider.logger.debug(f"HTTP cache {path}: purged {purged} expired pages")
+
+    def close_spider(self, spider):
+        stats = spider.crawler.stats
+        hits = stats.get_value('httpcache/hit', 0)
+        lookups = hits + stats.get_value('httpcache/miss', 0)
+        if lookups:
+            stats.set_value('httpcache/hit_rate', round(hits / lookups, 3))
+        self.db.close()
+
+    def request_key(self, request):
+        canonical = f"{request.method} {canonical_url(request.url, self.ignore_params)}"
+        digest = hashlib.sha1(canonical.encode())
+        digest.update(request.body)
+        return digest.hexdigest()
+
+    def retrieve_response(self, spider, request):
+        try:
+            row = self.db.execute(
+                'SELECT url, status, headers, body, stored_at FROM responses WHERE key = ?', (self.request_key(request),),
+            ).fetchone()
+        except sqlite3.OperationalError as e:
+            spider.logger.warning(f"HTTP cache read failed for {request.url}: {e}")
+            return None
+        if row is None:
+            return None
+        url, status, raw_headers, compressed_body, stored_at = row
+        if 0 < self.ttl_secs < time.time() - stored_at:
+            return None # expired
+
+        headers = Headers(headers_raw_to_dict(raw_headers))
+        body = self.decompressor.decompress(compressed_body)
+        respcls = responsetypes.from_args(headers=headers, url=url, body=body)
+        return respcls(url=url, headers=headers, status=status, body=body)
+
+    def store_response(self, spider, request, response):
+        row = (
+            self.request_key(request),
+            response.url,
+            response.status,
+            headers_dict_to_raw(response.headers),
+            self.compressor.compress(response.body),
+            time.time(),
+        )
+        try:
+            self.db.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)', row)
+        except sqlite3.OperationalError as e: # e.g. still locked after the busy timeout
+            spider.logger.warning(f"HTTP cache write failed for {request.url}: {e}")
@@ -3,15 +3,24 @@
 # See documentation in:
 # https://docs.scrapy.org/en/latest/topics/items.html
 
+from dataclasses import dataclass
 
-import scrapy
 
-class ScraperItem(scrapy.Item):
-    search_task_id = scrapy.Field()
-    name = scrapy.Field()
-    location = scrapy.Field()
-    price = scrapy.Field()
-    rating = scrapy.Field()
-    image_url = scrapy.Field()
-    hotel_url = scrapy.Field()
-    source = scrapy.Field()
+@dataclass(slots=True)
+class HotelItem:
+    """
+    One search result, typed once by the spider (see normalization.normalize_hotel).
+    A slotted dataclass: no per-item dict, and ItemAdapter reads it like any item.
+    """
+    search_task_id: str | None = None
+    source: str | None = None # spider name
+    name: str | None = None
+    location: str | None = None # without the distance, e.g. 'Tower Hamlets, London'
+    price: str | None = None # as displayed, e.g. 'US$1,234.50'
+    price_minor: int | None = None # in minor units of `currency`: 123450
+    currency: str | None = None # ISO 4217 code
+    rating: float | None = None # guest review score out of 10, e.g. 8.4
+    stars: int | None = None # star class, 1-5
+    distance_km: float | None = None # to the city centre
+    image_url: str | None = None
+    hotel_url: str | None = None # without session / tracking parameters
@@ -0,0 +1,216 @@
+# scraper/scraper/normalization.py
+"""
+Parsing of the free-text values found on result pages into typed values.
+Everything here is pure (no Scrapy / Django imports) so it can be used by the
+spiders, the pipelines and Django migrations alike.
+
+The spiders run every result through `normalize_hotel` once, at the edge, and
+emit typed HotelItems; nothing downstream parses these values again.
+`benchmark_normalization.py` measures it.
+"""
+import math
+import re
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+
+# Longest symbols first so 'US$' wins over '$'.
+CURRENCY_SYMBOLS = {
+    'US$': 'USD', 'AU$': 'AUD', 'CA$': 'CAD', 'NZ$': 'NZD', 'HK$': 'HKD', 'S$': 'SGD', 'R$': 'BRL',
+    '$': 'USD', '€': 'EUR', '£': 'GBP', '¥': 'JPY', '₹': 'INR', '৳': 'BDT', '฿': 'THB', '₩': 'KRW',
+    '₫': 'VND', '₱': 'PHP', 'RM': 'MYR', 'Rp': 'IDR',
+}
+# ISO 4217 currencies without minor units; every other one the sites show has two.
+ZERO_DECIMAL_CURRENCIES = frozenset({'JPY', 'KRW', 'VND', 'CLP', 'ISK', 'PYG', 'UGX', 'XAF', 'XOF'})
+# Session and tracking parameters of hotel links: not part of what the link points to.
+TRACKING_QUERY_PARAMS = frozenset({
+    'aid', 'label', 'sid', 'srpvid', 'srepoch', 'ucfs', 'hapos', 'hpos', 'sr_order', 'searchrequestid', 'cid',
+})
+MILES_IN_KM = 1.609344
+RATING_SCALE = 10 # review scores are kept out of 10, as both sites show them
+
+_ISO_CODE_RE = re.compile(r'\b([A-Z]{3})\b')
+_AMOUNT_RE = re.compile(r'\d[\d,.\s]*')
+_NUMBER_RE = re.compile(r'\d+(?:[.,]\d+)?')
+_RATING_SCALE_RE = re.compile(r'(?:/|\bout of)\s*(\d+)\b', re.IGNORECASE)
+_DISTANCE_RE = re.compile(r'(\d+(?:[.,]\d+)?)\s*(km|mi|miles?|m)\b', re.IGNORECASE)
+# 'Tower Hamlets, London - 1.1 km to center': the distance suffix Agoda appends to locations.
+_LOCATION_DISTANCE_RE = re.compile(r'\s*[-–,(]\s*\d+(?:[.,]\d+)?\s*(?:km|mi|miles?|m)\b.*$', re.IGNORECASE)
+
+
+def _to_decimal(raw):
+    """
+    '1,234.50' / '1.234,50' / '1 234' -> Decimal; the right-most separator followed
+    by 1-2 digits is the decimal point, every other separator groups thousands.
+    """
+    digits = re.sub(r'\s', '', raw).rstrip('.,')
+    last_separator = max(digits.rfind(','), digits.rfind('.'))
+    if last_separator != -1 and len(digits) - last_separator - 1 in (1, 2):
+        integer_part = re.sub(r'[,.]', '', digits[:last_separator])
+        number = f"{integer_part}.{digits[last_separator + 1:]}"
+    else:
+        number = re.sub(r'[,.]', '', digits)
+    try:
+        return Decimal(number)
+    except InvalidOperation:
+        return None
+
+
+def parse_currency(text):
+    """
+    Returns the ISO 4217 code mentioned in `text` ('BDT 5,000', 'US$120'), or None.
+    """
+    if not text:
+        return None
+    match = _ISO_CODE_RE.search(text)
+    if match:
+        return match.group(1)
+    for symbol, code in CURRENCY_SYMBOLS.items():
+        if symbol in text:
+            return code
+    return None
+
+
+def parse_price(text, default_currency=None):
+    """
+    'US$1,234.50' -> (Decimal('1234.50'), 'USD'); '53' -> (Decimal('53'), default_currency).
+    Returns (None, default_currency) when there is no amount.
+    """
+    if text is None:
+        return None, default_currency
+    text = str(text).strip()
+    match = _AMOUNT_RE.search(text)
+    amount = _to_decimal(match.group()) if match else None
+    return amount, parse_currency(text) or default_currency
+
+
+def currency_exponent(currency):
+    return 0 if currency in ZERO_DECIMAL_CURRENCIES else 2
+
+
+def to_minor_units(amount, currency):
+    """
+    (Decimal('1234.50'), 'USD') -> 123450; (Decimal('1500'), 'JPY') -> 1500; None stays None.
+    """
+    if amount is None:
+        return None
+    return int(amount.scaleb(currency_exponent(currency)).to_integral_value(ROUND_HALF_UP))
+
+
+def from_minor_units(minor, currency):
+    """
+    (123450, 'USD') -> Decimal('1234.50'), the inverse of to_minor_units.
+    """
+    if minor is None:
+        return None
+    return Decimal(minor).scaleb(-currency_exponent(currency))
+
+
+def clean_text(value):
+    """
+    Collapses whitespace; None for None and blank values.
+    """
+    if value is None:
+        return None
+    return ' '.join(str(value).split()) or None
+
+
+def parse_rating(value, scale=RATING_SCALE):
+    """
+    'Scored 8.4' / '8,4' / 8.4 -> 8.4; '4.2 out of 5' / '4.2/5' -> 8.4. Scores come back
+    out of RATING_SCALE: from the scale the text names, else from `scale`. None when
+    there is no number.
+    """
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        score = float(value)
+    else:
+        match = _NUMBER_RE.search(value)
+        if not match:
+            return None
+        score = float(match.group().replace(',', '.'))
+        scale_match = _RATING_SCALE_RE.search(value, match.end())
+        if scale_match:
+            scale = int(scale_match.group(1))
+    return round(score * RATING_SCALE / scale, 1) if scale and scale != RATING_SCALE else score
+
+
+def parse_stars(value):
+    """
+    4 / '4 out of 5' / '4-star hotel' / '★★★★' -> 4; None outside 1-5.
+    """
+    if isinstance(value, str):
+        match = _NUMBER_RE.search(value)
+        value = float(match.group().replace(',', '.')) if match else value.count('★')
+    if value is None:
+        return None
+    stars = math.floor(value)
+    return stars if 1 <= stars <= 5 else None
+
+
+def parse_distance_km(text):
+    """
+    '1.1 km to center' -> 1.1; '68 m from centre' -> 0.068; '2 miles' -> 3.219.
+    """
+    match = _DISTANCE_RE.search(text or '')
+    if not match:
+        return None
+    number = float(match.group(1).replace(',', '.'))
+    unit = match.group(2).lower()
+    if unit == 'm':
+        number /= 1000
+    elif unit.startswith('mi'):
+        number *= MILES_IN_KM
+    return round(number, 3)
+
+
+def split_location(text):
+    """
+    'Tower Hamlets, London - 1.1 km to center' -> ('Tower Hamlets, London', 1.1);
+    a location without a distance comes back as is, with None.
+    """
+    text = clean_text(text)
+    if text is None:
+        return None, None
+    match = _LOCATION_DISTANCE_RE.search(text)
+    if not match:
+        return text, None
+    return text[:match.start()] or None, parse_distance_km(match.group())
+
+
+def canonical_hotel_url(url):
+    """
+    A hotel link without its fragment and session / tracking parameters; the
+    remaining parameters (dates, occupancy) keep their order and encoding.
+    """
+    if not url:
+        return None
+    url = url.partition('#')[0]
+    base, _, query = url.partition('?')
+    if not query:
+        return base
+    # Filtered as raw 'key=value' pairs: decoding and re-encoding them would cost 10x more.
+    kept = [pair for pair in query.split('&') if pair and pair.partition('=')[0] not in TRACKING_QUERY_PARAMS]
+    return f"{base}?{'&'.join(kept)}" if kept else base
+
+
+def normalize_hotel(name=None, location=None, price=None, currency=None, rating=None, stars=None,
+                    distance=None, image_url=None, hotel_url=None):
+    """
+    One result's raw values (page text or embedded JSON) -> HotelItem's typed fields.
+    `currency` is the fallback when the price text names none; `distance` is the
+    distance text when the site shows it apart from the location.
+    """
+    amount, currency = parse_price(price, default_currency=currency)
+    location, location_distance = split_location(location)
+    return {
+        'name': clean_text(name),
+        'location': location,
+        'price': str(price).strip() or None if price is not None else None, # as displayed, spacing included
+        'price_minor': to_minor_units(amount, currency),
+        'currency': currency,
+        'rating': parse_rating(rating),
+        'stars': parse_stars(stars),
+        'distance_km': parse_distance_km(distance) if distance else location_distance,
+        'image_url': image_url or None,
+        'hotel_url': canonical_hotel_url(hotel_url),
+    }
@@ -0,0 +1,78 @@
+# scraper/scraper/pagination.py
+"""
+Fan-out of search result pages.
+
+Following the "next" link costs one round trip per page, in sequence. When the
+first page says how many results there are, every remaining page URL is known
+up front (Booking pages by `offset`, Agoda by `page`), so the spiders request
+them all at once and let the downloader fetch them concurrently, up to
+CONCURRENT_REQUESTS_PER_DOMAIN at a time and SEARCH_MAX_PAGES pages per search
+(fewer when SEARCH_TOP_K results fill fewer pages of a price-sorted search).
+Pages reached this way are marked in `meta` and don't paginate again; when the
+count is unknown the spiders keep following the next link. Fanned-out pages are
+in the 'pagination' rate limit class (see DistributedRateLimitMiddleware), so they
+don't use up a site's shared budget ahead of other searches' first pages.
+"""
+import math
+import re
+
+import scrapy
+from w3lib.url import add_or_replace_parameter
+
+FANNED_OUT_META_KEY = 'search_page'
+DEFAULT_MAX_PAGES = 10
+
+_COUNT_RE = re.compile(r'(\d[\d,.\s]*)\s*(?:properties|hotels|results)', re.IGNORECASE)
+
+
+def parse_result_count(text):
+    """
+    'London: 1,234 properties found' -> 1234; None when there is no count.
+    """
+    match = _COUNT_RE.search(text or '')
+    if not match:
+        return None
+    return int(re.sub(r'\D', '', match.group(1)))
+
+
+def max_pages(spider, page_size):
+    settings = getattr(spider, 'settings', None) # unset outside a crawl, e.g. in benchmark_parsers.py
+    if not settings:
+        return DEFAULT_MAX_PAGES
+    pages = settings.getint('SEARCH_MAX_PAGES', DEFAULT_MAX_PAGES)
+    top_k = settings.getint('SEARCH_TOP_K')
+    if top_k > 0 and getattr(spider, 'sorted_by_price', False):
+        # Cheapest first and filtered by the site: the first top_k results are all we keep.
+        pages = min(pages, math.ceil(top_k / page_size))
+    return pages
+
+
+def is_fanned_out(response):
+    try:
+        return FANNED_OUT_META_KEY in response.meta
+    except AttributeError: # a response built without a request
+        return False
+
+
+def fan_out(spider, response, remaining_results, page_size, param, current_value, step, callback):
+    """
+    Requests for every page after `response`, which has `remaining_results` results from
+    itself on, `page_size` per page: `param` takes the values current_value + step,
+    current_value + 2 * step, ... Earlier pages get higher priority, so results arrive
+    roughly in order.
+    """
+    if not page_size or remaining_results <= 0:
+        return []
+    pages = min(math.ceil(remaining_results / page_size), max_pages(spider, page_size))
+    requests = []
+    for index in range(1, pages):
+        url = add_or_replace_parameter(response.url, param, str(current_value + index * step))
+        requests.append(scrapy.Request(
+            url,
+            callback=callback,
+            priority=-index,
+            meta={FANNED_OUT_META_KEY: index + 1, 'rate_limit_class': 'pagination'},
+        ))
+    if requests:
+        spider.logger.info(f"Fanning out {len(requests)} more pages ({remaining_results} results) from {response.url}")
+    return requests
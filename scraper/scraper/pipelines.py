@@ -1,6 +1,40 @@
-from hotel_search.models import Hotel 
+import time
+from hotel_search import metrics, tracing
+from hotel_search.models import Hotel, Offer, SearchRun
+from hotel_search.entity_resolution import link_properties
+from hotel_search.price_history import record_observations
+from hotel_search.search_events import publish_offers
 from itemadapter import ItemAdapter # Recommended for accessing item fields
 from asgiref.sync import sync_to_async # Import sync_to_async
+from django.db import transaction
+from django.utils import timezone
+from .normalization import from_minor_units
+from scrapy.utils.defer import deferred_from_coro, maybe_deferred_to_future
+
+
+def get_search_run(task_id):
+    """
+    The SearchRun offers of `task_id` are recorded against. run_spiders_for_query
+    creates it; crawls started by hand (`scrapy crawl`) get a bare one.
+    """
+    run, _ = SearchRun.objects.get_or_create(task_id=task_id, defaults={'city': ''})
+    return run
+
+
+def item_price_amount(adapter):
+    """
+    The item's price as a Decimal for the price_amount columns; the spider parsed it already.
+    """
+    return from_minor_units(adapter.get('price_minor'), adapter.get('currency'))
+
+
+def item_rating(adapter):
+    """
+    The review score as stored in the rating columns: '8.4', or None.
+    """
+    rating = adapter.get('rating')
+    return f"{rating:.1f}" if rating is not None else None
+
 
 class HotelScraperPipeline:
     # Scrapy pipelines can be synchronous, but if they interact with Django's ORM
@@ -27,6 +61,9 @@ class HotelScraperPipeline:
             spider.logger.warning(f"Skipping item due to missing essential fields: {item}")
             return item # Return item so it can be processed by other pipelines if any
 
+        price_amount, currency, rating = item_price_amount(adapter), adapter.get('currency'), item_rating(adapter)
+        started_at = time.time()
+
         # Use update_or_create to handle hotels found by different searches
         # or to update details if found again.
         # The 'defaults' dictionary contains fields that should be updated
@@ -42,11 +79,23 @@ class HotelScraperPipeline:
                     # Fields to set/update
                     'search_task_id': search_task_id,
                     'price': adapter.get('price'),
-                    'rating': adapter.get('rating'),
+                    'price_amount': price_amount,
+                    'currency': currency,
+                    'rating': rating,
+                    'stars': adapter.get('stars'),
+                    'distance_km': adapter.get('distance_km'),
                     'image_url': adapter.get('image_url'),
                     'hotel_url': adapter.get('hotel_url'),
                 }
             )
+            # The hotel row holds the latest details; this search's price is its own Offer.
+            run = await sync_to_async(get_search_run)(search_task_id)
+            offer = await sync_to_async(Offer.objects.create)(
+                run=run, hotel=hotel, price=adapter.get('price'), price_amount=price_amount,
+                currency=currency, rating=rating,
+            )
+            await sync_to_async(record_observations)([offer])
+            await sync_to_async(link_properties)([hotel])
             if created:
                 spider.logger.info(f"Created new hotel entry: {hotel.name} from {hotel.source}")
             else:
@@ -55,5 +104,176 @@ class HotelScraperPipeline:
             spider.logger.error(f"Error saving hotel item to Django DB: {e} for item: {item}")
             # Depending on your needs, you might want to re-raise the exception
             # or simply log it and continue. For now, we log and return the item.
-        
+        tracing.record('pipeline.save', tracing.parse_traceparent(getattr(spider, 'traceparent', None)), started_at, time.time())
+
         return item # Always return the item to pass it to the next pipeline (if any)
+
+
+class BulkHotelScraperPipeline:
+    """
+    Batched variant of HotelScraperPipeline.
+
+    Items are buffered and upserted with ONE `bulk_create(update_conflicts=True)`
+    round trip per flush instead of a SELECT plus an INSERT/UPDATE per hotel card,
+    followed by one plain bulk INSERT of the search run's Offers and of their
+    price observations (both append-only), in one transaction. New hotels are then
+    linked to their cross-source Property.
+    A flush happens when HOTEL_PIPELINE_BATCH_SIZE items are buffered, when the oldest
+    buffered item is HOTEL_PIPELINE_MAX_LATENCY seconds old, and on close_spider.
+    Per-item created/updated logs are replaced by aggregate counters in the crawl stats.
+    """
+
+    unique_fields = ['name', 'location', 'source']
+    update_fields = [
+        'search_task_id', 'price', 'price_amount', 'currency', 'rating', 'stars', 'distance_km', 'image_url', 'hotel_url',
+        'updated_at',
+    ]
+
+    def __init__(self, stats, batch_size=50, max_latency=2.0):
+        self.stats = stats
+        self.batch_size = batch_size
+        self.max_latency = max_latency
+        # Keyed on the unique fields: Postgres refuses to upsert the same row twice
+        # in one statement, so a hotel seen twice before a flush keeps its latest data.
+        self.buffer = {}
+        self.flush_timer = None
+        self.timer_flush = None # Deferred of the last flush started by the timer
+        self.runs = {} # search_task_id -> SearchRun
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(
+            crawler.stats,
+            batch_size=crawler.settings.getint('HOTEL_PIPELINE_BATCH_SIZE', 50),
+            max_latency=crawler.settings.getfloat('HOTEL_PIPELINE_MAX_LATENCY', 2.0),
+        )
+
+    async def process_item(self, item, spider):
+        """
+        Buffers the item and flushes the buffer once it is full.
+        """
+        adapter = ItemAdapter(item)
+
+        name = adapter.get('name')
+        location = adapter.get('location')
+        source = adapter.get('source')
+
+        if not name or not location or not source:
+            spider.logger.warning(f"Skipping item due to missing essential fields: {item}")
+            self.stats.inc_value('hotel_pipeline/items_skipped')
+            return item
+
+        self.buffer[(name, location, source)] = Hotel(
+            name=name,
+            location=location,
+            source=source,
+            search_task_id=adapter.get('search_task_id'),
+            price=adapter.get('price'),
+            price_amount=item_price_amount(adapter),
+            currency=adapter.get('currency'),
+            rating=item_rating(adapter),
+            stars=adapter.get('stars'),
+            distance_km=adapter.get('distance_km'),
+            image_url=adapter.get('image_url'),
+            hotel_url=adapter.get('hotel_url'),
+        )
+        self.stats.inc_value('hotel_pipeline/items_buffered')
+
+        if len(self.buffer) >= self.batch_size:
+            await self.flush(spider)
+        elif self.flush_timer is None:
+            from twisted.internet import reactor
+            self.flush_timer = reactor.callLater(self.max_latency, self._flush_on_timer, spider)
+
+        return item
+
+    def _flush_on_timer(self, spider):
+        self.flush_timer = None
+        self.timer_flush = deferred_from_coro(self.flush(spider))
+
+    def _save_and_publish(self, hotels, spider):
+        for task_id in {hotel.search_task_id for hotel in hotels} - self.runs.keys():
+            self.runs[task_id] = get_search_run(task_id)
+
+        scraped_at = timezone.now()
+        with transaction.atomic():
+            # bulk_create sets primary keys on the upserted objects (PostgreSQL), which
+            # the offers need, and the streaming endpoint pushes offers right away.
+            Hotel.objects.bulk_create(
+                hotels,
+                update_conflicts=True,
+                unique_fields=self.unique_fields,
+                update_fields=self.update_fields,
+            )
+            offers = Offer.objects.bulk_create([
+                Offer(
+                    run=self.runs[hotel.search_task_id], hotel=hotel, price=hotel.price,
+                    price_amount=hotel.price_amount, currency=hotel.currency, rating=hotel.rating,
+                    scraped_at=scraped_at,
+                )
+                for hotel in hotels
+            ])
+            record_observations(offers)
+        try:
+            link_properties(hotels)
+        except Exception as e:
+            # The offers are saved; they are grouped by property once the hotel is seen again.
+            spider.logger.error(f"Error linking {len(hotels)} hotels to properties: {e}")
+            self.stats.inc_value('hotel_pipeline/link_errors')
+        publish_offers(offers)
+
+    async def flush(self, spider):
+        """
+        Upserts everything buffered so far in a single statement.
+        """
+        if self.flush_timer is not None and self.flush_timer.active():
+            self.flush_timer.cancel()
+        self.flush_timer = None
+
+        if not self.buffer:
+            return
+
+        # Swap the buffer out first so items arriving during the DB round trip
+        # start the next batch instead of being lost.
+        hotels, self.buffer = list(self.buffer.values()), {}
+
+        started_at, started = time.time(), time.perf_counter()
+        error = None
+        try:
+            await sync_to_async(self._save_and_publish)(hotels, spider)
+        except Exception as e:
+            error = e
+            spider.logger.error(f"Error bulk-saving {len(hotels)} hotel items to Django DB: {e}")
+            self.stats.inc_value('hotel_pipeline/flush_errors')
+            self.stats.inc_value('hotel_pipeline/items_failed', len(hotels))
+            metrics.PIPELINE_ITEMS.labels(spider=spider.name, outcome='failed').inc(len(hotels))
+            return
+        finally:
+            metrics.PIPELINE_FLUSH_SECONDS.labels(spider=spider.name).observe(time.perf_counter() - started)
+            tracing.record(
+                'pipeline.flush', tracing.parse_traceparent(getattr(spider, 'traceparent', None)),
+                started_at, time.time(), hotels=len(hotels), error=str(error)[:200] if error else None,
+            )
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        metrics.PIPELINE_ITEMS.labels(spider=spider.name, outcome='upserted').inc(len(hotels))
+        self.stats.inc_value('hotel_pipeline/flushes')
+        self.stats.inc_value('hotel_pipeline/items_upserted', len(hotels))
+        self.stats.max_value('hotel_pipeline/max_flush_ms', round(elapsed_ms, 1))
+        spider.logger.info(f"Upserted {len(hotels)} hotels in one batch ({elapsed_ms:.1f} ms).")
+
+    def close_spider(self, spider):
+        # Scrapy only waits on a Deferred returned from close_spider (not on a coroutine).
+        return deferred_from_coro(self._flush_and_report(spider))
+
+    async def _flush_and_report(self, spider):
+        if self.timer_flush is not None and not self.timer_flush.called:
+            await maybe_deferred_to_future(self.timer_flush)
+        await self.flush(spider)
+        spider.logger.info(
+            f"Hotel pipeline summary: "
+            f"upserted={self.stats.get_value('hotel_pipeline/items_upserted', 0)}, "
+            f"flushes={self.stats.get_value('hotel_pipeline/flushes', 0)}, "
+            f"skipped={self.stats.get_value('hotel_pipeline/items_skipped', 0)}, "
+            f"failed={self.stats.get_value('hotel_pipeline/items_failed', 0)}"
+        )
@@ -0,0 +1,53 @@
+# scraper/scraper/search_filters.py
+"""
+The search form's filters, as the spiders send them to the sites.
+
+The form has a max price and a minimum star rating. Both sites filter and sort
+server-side, so the spiders put these into the search URL (Booking's `nflt`,
+Agoda's `priceTo` / `hotelStarRating`) and ask for the cheapest results first,
+instead of crawling every page of the city. The TopKEarlyStop extension relies
+on that order to stop a crawl once it has enough qualifying results.
+"""
+from .normalization import from_minor_units, parse_price
+
+STAR_CLASSES = range(1, 6)
+
+
+def parse_max_price(value):
+    """
+    '150' / '$150' / '' -> Decimal('150') / Decimal('150') / None; zero and below mean no limit.
+    """
+    if str(value).strip().startswith('-'): # parse_price reads prices, which have no sign
+        return None
+    amount, _ = parse_price(value)
+    return amount if amount is not None and amount > 0 else None
+
+
+def parse_min_stars(value):
+    """
+    '4' -> 4; None for '', 'Any' and anything outside 1-5.
+    """
+    try:
+        stars = int(float(value))
+    except (TypeError, ValueError):
+        return None
+    return stars if stars in STAR_CLASSES else None
+
+
+def star_classes(min_stars):
+    """
+    4 -> [4, 5]: the star classes a "minimum stars" filter selects.
+    """
+    return [stars for stars in STAR_CLASSES if stars >= min_stars] if min_stars else []
+
+
+def qualifies(item, max_price=None, min_stars=None):
+    """
+    Whether a scraped HotelItem meets the filters. An item without a known star class
+    passes the star filter; the site applied it already.
+    """
+    if item.price_minor is None:
+        return False
+    if max_price is not None and from_minor_units(item.price_minor, item.currency) > max_price:
+        return False
+    return min_stars is None or item.stars is None or item.stars >= min_stars
@@ -1,8 +1,16 @@
 # scraper/scraper/spiders/agoda_spider.py
 
+import math
 import scrapy
-from urllib.parse import urlencode, urljoin
-from ..items import ScraperItem
+from decimal import Decimal
+from urllib.parse import urlencode
+from w3lib.url import url_query_parameter
+from ..embedded_json import EmbeddedJson, dig
+from ..extraction import CardExtractor, Field
+from ..items import HotelItem
+from ..normalization import normalize_hotel, parse_currency
+from ..pagination import fan_out, is_fanned_out
+from ..search_filters import parse_max_price, parse_min_stars, star_classes
 from loguru import logger as LOGGER
 from scrapy_crawlbase.request import CrawlbaseRequest
 from scrapy_playwright.page import PageMethod
@@ -19,6 +27,24 @@ class AgodaSpider(scrapy.Spider):
     # }
     
     base_search_url = 'https://www.agoda.com/en-gb/search'
+    currency_code = 'USD' # requested via currencyCode; prices without a currency label are in it
+    sorted_by_price = True # results are requested cheapest first (see TopKEarlyStop)
+    # Present once the results are rendered; without it (and without embedded JSON results)
+    # HybridRenderingMiddleware escalates to Playwright.
+    card_selector = 'li[data-selenium="hotel-item"]'
+    extractor = CardExtractor(card_selector, {
+        'name': Field('h3[data-selenium="hotel-name"]::text'),
+        'hotel_url': Field('a.PropertyCard__Link::attr(href)', url=True),
+        'image_url': Field('img.Imagestyled__ImageStyled-sc-zu5jhi-0::attr(src)'),
+        # A bare span on some layouts, a span inside a div on others.
+        'location': Field('span[data-selenium="area-city"]::text', 'div[data-selenium="area-city"] > span::text'),
+        'rating': Field('p[aria-hidden="true"] span::text'),
+        'stars': Field('div[data-testid="rating-container"] svg', count=True),
+        'price_currency': Field('div[data-element-name="price-before-cashback"] span.PropertyCardPrice__Currency::text'),
+        'final_price': Field('div[data-element-name="final-price"] span.PropertyCardPrice__Value::text'),
+    })
+    # The citySearch GraphQL result the page is hydrated from, wherever the page embeds it.
+    embedded_json = EmbeddedJson('"citySearch":', locate=lambda city_search: city_search if 'properties' in city_search else None)
 
     def __init__(self, city=None, price=None, rating=None, checkin=None, agoda_city_id=None, search_task_id=None, *args, **kwargs):
         super(AgodaSpider, self).__init__(*args, **kwargs)
@@ -32,16 +58,19 @@ class AgodaSpider(scrapy.Spider):
         if not self.city:
             raise ValueError("City argument is required for agoda_spider.")
 
+        self.max_price = parse_max_price(price)
+        self.min_stars = parse_min_stars(rating)
         params = {
             'city': self.agoda_city_id,
-            'priceFrom': self.price,
-            'priceTo': self.price,
-            'hotelStarRating': rating,
+            'priceFrom': 0 if self.max_price else None,
+            'priceTo': math.ceil(self.max_price) if self.max_price else None, # the sites take whole amounts
+            'hotelStarRating': ','.join(map(str, star_classes(self.min_stars))) or None,
+            'sort': 'priceLowToHigh',
             'textToSearch': self.city,
             'checkIn': self.checkin,
             # 'rooms': 1,
             # 'children': 0,
-            'currencyCode': 'USD',
+            'currencyCode': self.currency_code,
         }
 
         self.start_urls = [f'{self.base_search_url}?{urlencode({k: v for k, v in params.items() if v is not None})}']
@@ -102,70 +131,35 @@ class AgodaSpider(scrapy.Spider):
         LOGGER.info(f"Found {len(hotels)} hotels on page: {response.url}")
         
         for hotel in hotels:
-            item = ScraperItem()
-            item['search_task_id'] = self.search_task_id
-            item['source'] = self.name
-
-            item['name'] = hotel['name']
-            item['location'] = hotel['location']
-            item['price'] = hotel['price']
-            item['rating'] = hotel['rating']
-            item['image_url'] = hotel['image_url']
-            item['hotel_url'] = hotel['hotel_url']
-            
-            yield item
+            yield HotelItem(
+                search_task_id=self.search_task_id, source=self.name,
+                **normalize_hotel(currency=self.currency_code, **hotel),
+            )
        
     def parse(self, response):
-        hotels = response.css('li[data-selenium="hotel-item"]')
-        LOGGER.info(f"Found {len(hotels)} hotels on page: {response.url}")
-        LOGGER.debug(f"Hotel data: {[hotel.get() for hotel in hotels]}")
-        
-        for hotel in hotels:
-            item = ScraperItem()
-            item['search_task_id'] = self.search_task_id
-            item['source'] = self.name
-
+        city_search = self.embedded_json.find(response)
+        if city_search is not None:
+            yield from self.parse_embedded_json(response, city_search)
+            return
 
-            hotel_id = hotel.attrib.get('data-hotelid', '').strip()
-            hotel_name = hotel.css('h3[data-selenium="hotel-name"]::text').get(default='').strip()
-            
-            # Hotel link
-            relative_link = hotel.css('a.PropertyCard__Link::attr(href)').get()
-            hotel_link = urljoin(response.url, relative_link) if relative_link else ''
-
-            # Hotel image
-            image_url = hotel.css('img.Imagestyled__ImageStyled-sc-zu5jhi-0::attr(src)').get(default='').strip()
-
-            # Location
-            location = hotel.css('span[data-selenium="area-city"]::text').get()
-            if not location:
-                # Fallback to aria-label or full text extraction
-                location = hotel.xpath('.//div[@data-selenium="area-city"]/span/text()').get(default='').strip()
-
-            # Star rating (count the icons)
-            stars_count = len(hotel.css('[data-testid="rating-container"] svg'))
-
-            # Rating & reviews
-            rating_score = hotel.css('p[aria-hidden="true"] span::text').get(default='').strip()
-            reviews = hotel.xpath('.//p[contains(text(), "reviews")]/text()').get(default='').strip()
-
-            # Price info
-            price_currency = hotel.css('div[data-element-name="price-before-cashback"] span.PropertyCardPrice__Currency::text').get(default='').strip()
-            price_value = hotel.css('div[data-element-name="price-before-cashback"] span.PropertyCardPrice__Value::text').get(default='').strip()
-            final_price = hotel.css('div[data-element-name="final-price"] span.PropertyCardPrice__Value::text').get(default='').strip()
-
-
-            item['name'] = hotel_name
-            item['location'] = location
-            item['price'] = final_price
-            item['rating'] = rating_score
-            item['image_url'] = image_url
-            item['hotel_url'] = hotel_link
-            
-            yield item
+        hotels = list(self.extractor.extract(response))
+        LOGGER.info(f"Found {len(hotels)} hotels on page: {response.url}")
 
-        # Pagination (if exists)
-        next_page = response.css('a[data-selenium="pagination-next"]::attr(href)').get()
+        for values in hotels:
+            # The location carries the distance: 'Tower Hamlets, London - 1.1 km to center'.
+            yield HotelItem(search_task_id=self.search_task_id, source=self.name, **normalize_hotel(
+                name=values['name'],
+                location=values['location'],
+                price=values['final_price'],
+                currency=parse_currency(values['price_currency']) or self.currency_code,
+                rating=values['rating'],
+                stars=values['stars'],
+                image_url=values['image_url'],
+                hotel_url=values['hotel_url'],
+            ))
+
+        # Pagination (if exists); the page count isn't shown on the cards layout, so page by page.
+        next_page = None if is_fanned_out(response) else response.css('a[data-selenium="pagination-next"]::attr(href)').get()
         if next_page:
             yield scrapy.Request(
                 next_page,
@@ -176,4 +170,42 @@ class AgodaSpider(scrapy.Spider):
                 #     ],
                 # },
                 callback=self.parse,
-            )
\ No newline at end of file
+            )
+
+    def parse_embedded_json(self, response, city_search):
+        properties = city_search['properties']
+        LOGGER.info(f"Found {len(properties)} hotels in embedded JSON on page: {response.url}")
+
+        for prop in properties:
+            summary = dig(prop, 'content', 'informationSummary', default={})
+            room_pricing = dig(prop, 'pricing', 'offers', 0, 'roomOffers', 0, 'room', 'pricing', 0, default={})
+            display = dig(room_pricing, 'price', 'perRoomPerNight', 'exclusive', 'display')
+            area = dig(summary, 'address', 'area', 'name')
+            city = dig(summary, 'address', 'city', 'name')
+            image_url = dig(prop, 'content', 'images', 'hotelImages', 0, 'urls', 0, 'value')
+            hotel_url = dig(summary, 'propertyLinks', 'propertyPage')
+            score = dig(prop, 'content', 'reviews', 'cumulative', 'score')
+
+            # Shown like the cards show it: '1,234', or '1,234.5' when not a whole amount.
+            final_price = None
+            if display is not None:
+                amount = Decimal(str(display))
+                final_price = f"{amount.quantize(1) if amount == amount.to_integral_value() else amount:,}"
+
+            yield HotelItem(search_task_id=self.search_task_id, source=self.name, **normalize_hotel(
+                name=summary.get('localeName') or summary.get('defaultName'),
+                location=', '.join(part for part in (area, city) if part) or None,
+                price=final_price,
+                currency=room_pricing.get('currency') or self.currency_code,
+                rating=score,
+                stars=summary.get('rating'),
+                image_url=response.urljoin(image_url) if image_url else None,
+                hotel_url=response.urljoin(hotel_url) if hotel_url else None,
+            ))
+
+        # No pagination link without the DOM: pages are numbered, sized by what this one returned.
+        if not is_fanned_out(response):
+            page = int(url_query_parameter(response.url, 'page') or 1)
+            total = dig(city_search, 'searchResult', 'searchInfo', 'totalFilteredHotels', default=0)
+            remaining = total - (page - 1) * len(properties)
+            yield from fan_out(self, response, remaining, len(properties), 'page', page, 1, self.parse)
@@ -1,14 +1,50 @@
-import re
+import math
 import scrapy
 from urllib.parse import urlencode, urljoin
-from ..items import ScraperItem
+from w3lib.url import url_query_parameter
+from ..embedded_json import EmbeddedJson, dig
+from ..extraction import CardExtractor, Field
+from ..items import HotelItem
+from ..normalization import normalize_hotel
+from ..pagination import fan_out, is_fanned_out, parse_result_count
+from ..search_filters import parse_max_price, parse_min_stars, star_classes
 from scrapy.selector import Selector
 from scrapy_playwright.page import PageMethod
 
+
+def search_query(apollo_state):
+    """
+    The cached `searchQueries.search({...})` entry of the Apollo store, or None.
+    """
+    for key, query in apollo_state['ROOT_QUERY']['searchQueries'].items():
+        if key.startswith('search(') and isinstance(query, dict) and 'results' in query:
+            return query
+    return None
+
+
 class BookingSpider(scrapy.Spider):
     name = 'booking_spider'
     
     base_search_url = 'https://www.booking.com/searchresults.html'
+    # Present once the results are rendered; without it (and without embedded JSON results)
+    # HybridRenderingMiddleware escalates to Playwright.
+    card_selector = 'div[data-testid="property-card"]'
+    extractor = CardExtractor(card_selector, {
+        'price': Field('span[data-testid="price-and-discounted-price"]::text'),
+        'name': Field('div[data-testid="title"]::text'),
+        'location': Field('span[data-testid="address"]::text'),
+        'rating': Field('div[data-testid="review-score"] div::text'), # 'Scored 8.4'
+        'stars': Field('div[aria-label$="out of 5"]::attr(aria-label)'), # '4 out of 5'
+        'distance': Field('span[data-testid="distance"]::text'),
+        'image_url': Field('img[data-testid="image"]::attr(src)'),
+        'hotel_url': Field('a[data-testid="title-link"]::attr(href)', url=True),
+    })
+    # The Apollo store the results page is hydrated from; in the plain HTTP response too.
+    result_count = Field('h1::text') # 'London: 1,234 properties found'
+    embedded_json = EmbeddedJson('data-capla-store-data="apollo">', locate=search_query)
+    image_base_url = 'https://cf.bstatic.com'
+    currency_code = 'USD' # requested via selected_currency; the max price filter is in it too
+    sorted_by_price = True # results are requested cheapest first (see TopKEarlyStop)
 
     def __init__(self, city=None, price=None, rating=None, checkin=None, search_task_id=None, *args, **kwargs):
         super(BookingSpider, self).__init__(*args, **kwargs)
@@ -21,9 +57,20 @@ class BookingSpider(scrapy.Spider):
         if not self.city:
             raise ValueError("City argument is required for booking_spider.")
 
-        params = {'ss': self.city, 'checkin': self.checkin}
+        self.max_price = parse_max_price(price)
+        self.min_stars = parse_min_stars(rating)
+        # nflt holds the sidebar filters: 'price=USD-0-150-1' (per night) and one 'class=N' per star class.
+        filters = [f'price={self.currency_code}-0-{math.ceil(self.max_price)}-1'] if self.max_price else []
+        filters += [f'class={stars}' for stars in star_classes(self.min_stars)]
+        params = {
+            'ss': self.city,
+            'checkin': self.checkin,
+            'selected_currency': self.currency_code,
+            'order': 'price',
+            'nflt': ';'.join(filters) or None,
+        }
 
-        self.start_urls = [f'{self.base_search_url}?{urlencode(params)}']
+        self.start_urls = [f'{self.base_search_url}?{urlencode({k: v for k, v in params.items() if v is not None})}']
         self.logger.info(f"Starting spider '{self.name}' for city: '{self.city}', task_id: '{self.search_task_id}'")
         self.logger.info(f"Initial URL: {self.start_urls[0]}")
 
@@ -71,66 +118,41 @@ class BookingSpider(scrapy.Spider):
         self.logger.info(f"Found {len(hotels)} hotels on page: {response.url}")
         
         for hotel in hotels:
-            item = ScraperItem()
-            item['search_task_id'] = self.search_task_id
-            item['source'] = self.name
-
-            item['name'] = hotel['name']
-            item['location'] = hotel['location']
-            item['price'] = hotel['price']
-            item['rating'] = hotel['rating']
-            item['image_url'] = hotel['image_url']
-            item['hotel_url'] = hotel['hotel_url']
-            
-            yield item
+            yield HotelItem(
+                search_task_id=self.search_task_id, source=self.name,
+                **normalize_hotel(currency=self.currency_code, **hotel),
+            )
 
     def parse(self, response):
         """
-        Parses the search results page.
+        Parses the search results page: from the embedded JSON when the page has it,
+        from the rendered property cards otherwise.
         """
         self.logger.info(f"Parsing URL: {response.url}")
-        
-        hotel_cards = response.css('div[data-testid="property-card"]')
+
+        search = self.embedded_json.find(response)
+        if search is not None:
+            yield from self.parse_embedded_json(response, search)
+            return
+
+        hotel_cards = list(self.extractor.extract(response))
 
         if not hotel_cards:
             self.logger.warning(f"No hotel cards found on {response.url}. Selectors might be outdated or no results.")
 
-        for card in hotel_cards:
-            item = ScraperItem()
-            item['search_task_id'] = self.search_task_id
-            item['source'] = self.name
-            
-            # self.logger.info(f"-=-=-=> card: {card}")
-            
-            
-            price_text = card.css('span[data-testid="price-and-discounted-price"]::text').get()
-            self.logger.info(f"==> price: {price_text}")
-            
-            if price_text:
-                # Remove everything except digits
-                price_numeric = re.sub(r"[^\d]", "", price_text)
-                if price_numeric:
-                    price_numeric = int(price_numeric)  # Convert to integer
-                else:
-                    price_numeric = None
-            else:
-                price_numeric = None
-
-            item['price'] = price_numeric
-            
-            item['name'] = card.css('div[data-testid="title"]::text').get()
-            item['location'] = card.css('span[data-testid="address"]::text').get()
-            # item['price'] = card.css('span[data-testid="price-and-discounted-price"]::text').get()
-            item['rating'] = str(card.css('div[data-testid="review-score"] div::text').get()).replace('Scored', '').strip()
-            item['image_url'] = card.css('img[data-testid="image"]::attr(src)').get()
-            
-            hotel_relative_url = card.css('a[data-testid="title-link"]::attr(href)').get()
-            if hotel_relative_url:
-                item['hotel_url'] = urljoin(response.url, hotel_relative_url)
-            else:
-                item['hotel_url'] = None
-
-            yield item
+        for values in hotel_cards:
+            yield HotelItem(search_task_id=self.search_task_id, source=self.name, **normalize_hotel(**values))
+
+        if is_fanned_out(response):
+            return
+
+        # The first page knows the result count: request every other page at once.
+        if hotel_cards and not int(url_query_parameter(response.url, 'offset') or 0):
+            total = parse_result_count(self.result_count.extract(response.selector.root, response.url))
+            requests = fan_out(self, response, total or 0, len(hotel_cards), 'offset', 0, len(hotel_cards), self.parse)
+            if requests:
+                yield from requests
+                return
 
         next_page_link = response.css('a[data-testid="pagination-page-next"]::attr(href)').get()
         if next_page_link:
@@ -149,3 +171,32 @@ class BookingSpider(scrapy.Spider):
         else:
             self.logger.info(f"No next page link found on {response.url}. Finished scraping.")
 
+    def parse_embedded_json(self, response, search):
+        results = [result for result in search['results'] if result.get('basicPropertyData')] # skips ad slots
+        self.logger.info(f"Found {len(results)} hotels in embedded JSON on {response.url}")
+
+        for result in results:
+            prop = result['basicPropertyData']
+            price = dig(result, 'priceDisplayInfoIrene', 'displayPrice', 'amountPerStay', default={})
+            score = dig(prop, 'reviewScore', 'score')
+            image_path = dig(prop, 'photos', 'main', 'highResUrl', 'relativeUrl')
+            page_name = prop.get('pageName')
+            country_code = dig(prop, 'location', 'countryCode')
+
+            yield HotelItem(search_task_id=self.search_task_id, source=self.name, **normalize_hotel(
+                name=dig(result, 'displayName', 'text'),
+                location=dig(result, 'location', 'displayLocation'),
+                price=price.get('amount'),
+                currency=price.get('currency'),
+                rating=score,
+                stars=dig(prop, 'starRating', 'value'),
+                distance=dig(result, 'location', 'mainDistance'),
+                image_url=urljoin(self.image_base_url, image_path) if image_path else None,
+                hotel_url=response.urljoin(f"/hotel/{country_code}/{page_name}.html") if page_name and country_code else None,
+            ))
+
+        # Pages are windows of `offset`; there is no next link to follow without the DOM.
+        if not is_fanned_out(response):
+            offset = int(url_query_parameter(response.url, 'offset') or 0)
+            total = dig(search, 'pagination', 'nbResultsTotal', default=0)
+            yield from fan_out(self, response, total - offset, len(results), 'offset', offset, len(results), self.parse)
@@ -0,0 +1,119 @@
+"""
+Tests of the AdaptiveConcurrency extension against a stand-in downloader slot:
+back-off on 429/503 and captcha pages, and ramping back up. Run from this directory:
+
+    uv run python -m unittest test_adaptive_concurrency
+"""
+import unittest
+from types import SimpleNamespace
+
+from scrapy import Request, Spider, signals
+from scrapy.http import HtmlResponse
+from scrapy.settings import Settings
+from scrapy.signalmanager import SignalManager
+from scrapy.statscollectors import MemoryStatsCollector
+
+from scraper import settings as scraper_settings # sets up Django, which the extensions module needs
+from scraper.extensions import AdaptiveConcurrency
+
+SLOT = 'www.booking.com'
+URL = 'https://www.booking.com/searchresults.html?ss=London'
+
+
+class AdaptiveConcurrencyTests(unittest.TestCase):
+
+    def setUp(self):
+        self.spider = Spider(name='adaptive_concurrency_test')
+        self.slot = SimpleNamespace(concurrency=4, delay=1.0) # the parts of a downloader Slot it adjusts
+        settings = Settings({
+            'ADAPTIVE_CONCURRENCY_ENABLED': True,
+            'ADAPTIVE_CONCURRENCY_MAX': 6,
+            'ADAPTIVE_CONCURRENCY_MIN_DELAY': 0.25,
+            'ADAPTIVE_CONCURRENCY_MAX_DELAY': 10.0,
+            'ADAPTIVE_CONCURRENCY_BACKOFF_DELAY': 2.0,
+            'ADAPTIVE_CONCURRENCY_TARGET_LATENCY': 5.0,
+            'ADAPTIVE_CONCURRENCY_RAMP_UP_AFTER': 3,
+            'ADAPTIVE_CONCURRENCY_BACKOFF_STATUSES': [429, 503],
+            'ADAPTIVE_CONCURRENCY_CAPTCHA_MARKERS': scraper_settings.ADAPTIVE_CONCURRENCY_CAPTCHA_MARKERS,
+        })
+        self.stats = MemoryStatsCollector(SimpleNamespace(settings=settings))
+        self.crawler = SimpleNamespace(
+            settings=settings,
+            stats=self.stats,
+            signals=SignalManager(),
+            engine=SimpleNamespace(downloader=SimpleNamespace(slots={SLOT: self.slot})),
+        )
+        self.extension = AdaptiveConcurrency.from_crawler(self.crawler) # signals only hold weak references
+
+    def download(self, status=200, latency=0.5, headers=None, body=b'<html><body>Z Soho</body></html>'):
+        request = Request(URL, meta={'download_slot': SLOT})
+        self.crawler.signals.send_catch_log(signals.request_reached_downloader, request=request, spider=self.spider)
+        request.meta['download_latency'] = latency
+        response = HtmlResponse(URL, status=status, headers=headers, body=body, request=request)
+        for signal in (signals.response_downloaded, signals.response_received):
+            self.crawler.signals.send_catch_log(signal, response=response, request=request, spider=self.spider)
+        self.crawler.signals.send_catch_log(signals.request_left_downloader, request=request, spider=self.spider)
+
+    def assertSlot(self, concurrency, delay):
+        self.assertEqual((self.slot.concurrency, self.slot.delay), (concurrency, delay))
+
+    def test_429_and_503_halve_concurrency_and_double_the_delay(self):
+        self.download(status=429)
+        self.assertSlot(2, 2.0) # at least ADAPTIVE_CONCURRENCY_BACKOFF_DELAY
+        self.download(status=503)
+        self.assertSlot(1, 4.0)
+        self.download(status=503)
+        self.assertSlot(1, 8.0) # concurrency stays at 1
+        self.assertEqual(self.stats.get_value(f'adaptive_concurrency/{SLOT}/back_off/429'), 1)
+        self.assertEqual(self.stats.get_value(f'adaptive_concurrency/{SLOT}/back_off/503'), 2)
+        self.assertEqual(self.stats.get_value(f'adaptive_concurrency/{SLOT}/concurrency'), 1)
+        self.assertEqual(self.stats.get_value(f'adaptive_concurrency/{SLOT}/delay_ms'), 8000)
+
+    def test_retry_after_sets_a_longer_delay(self):
+        self.download(status=429, headers={'Retry-After': '7'})
+        self.assertSlot(2, 7.0)
+        self.download(status=429, headers={'Retry-After': 'Wed, 21 Oct 2026 07:28:00 GMT'}) # not seconds: ignored
+        self.assertSlot(1, 10.0)
+
+    def test_the_delay_is_capped(self):
+        self.download(status=429, headers={'Retry-After': '3600'})
+        self.assertSlot(2, 10.0) # ADAPTIVE_CONCURRENCY_MAX_DELAY
+        self.download(status=503)
+        self.assertSlot(1, 10.0)
+
+    def test_a_captcha_page_backs_off(self):
+        self.download(body=b'<html><body><div id="px-captcha"></div></body></html>')
+        self.assertSlot(2, 2.0)
+        self.assertEqual(self.stats.get_value(f'adaptive_concurrency/{SLOT}/back_off/captcha'), 1)
+
+    def test_a_healthy_streak_ramps_up_within_bounds(self):
+        self.download(status=429)
+        self.assertSlot(2, 2.0)
+        for _ in range(2):
+            self.download()
+        self.assertSlot(2, 2.0) # not yet ADAPTIVE_CONCURRENCY_RAMP_UP_AFTER in a row
+        self.download()
+        self.assertSlot(3, 1.0)
+
+        for _ in range(3 * 5):
+            self.download()
+        self.assertSlot(6, 0.25) # ADAPTIVE_CONCURRENCY_MAX and ADAPTIVE_CONCURRENCY_MIN_DELAY
+        self.assertEqual(self.stats.get_value(f'adaptive_concurrency/{SLOT}/ramp_up'), 6)
+
+    def test_a_back_off_restarts_the_streak(self):
+        for _ in range(2):
+            self.download()
+        self.download(status=503)
+        self.assertSlot(2, 2.0)
+        for _ in range(2):
+            self.download()
+        self.assertSlot(2, 2.0)
+
+    def test_a_slow_response_drops_one_request_in_flight(self):
+        self.download(latency=8.0)
+        self.assertSlot(3, 1.0)
+        self.assertEqual(self.stats.get_value(f'adaptive_concurrency/{SLOT}/slow'), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+"""
+Tests of SqliteZstdCacheStorage: cache keys, the zstd round trip, per-spider TTLs
+and the hit rate. Run from this directory:
+
+    uv run python -m unittest test_httpcache
+"""
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+from scrapy import Request, Spider
+from scrapy.http import HtmlResponse
+from scrapy.settings import Settings
+from scrapy.statscollectors import MemoryStatsCollector
+
+from scraper.httpcache import SqliteZstdCacheStorage, canonical_url
+
+SEARCH_URL = 'https://www.booking.com/searchresults.html?ss=London&checkin=2025-08-01&checkout=2025-08-03'
+
+
+class SqliteZstdCacheStorageTests(unittest.TestCase):
+
+    def setUp(self):
+        cachedir = tempfile.TemporaryDirectory()
+        self.addCleanup(cachedir.cleanup)
+        self.storage = SqliteZstdCacheStorage(Settings({
+            'HTTPCACHE_DIR': cachedir.name,
+            'HTTPCACHE_EXPIRATION_SECS': 3600,
+            'HTTPCACHE_TTL_MINUTES': {'booking_spider': 10},
+        }))
+        self.stats = MemoryStatsCollector(SimpleNamespace(settings=Settings()))
+        self.spider = Spider(name='booking_spider')
+        self.spider.crawler = SimpleNamespace(stats=self.stats)
+        self.storage.open_spider(self.spider)
+        self.addCleanup(self.storage.db.close)
+
+    def key(self, url):
+        return self.storage.request_key(Request(url))
+
+    def store(self, url=SEARCH_URL, body=b'<html><body>Z Soho US$120</body></html>'):
+        response = HtmlResponse(url, status=200, headers={'Content-Type': 'text/html; charset=utf-8'}, body=body)
+        self.storage.store_response(self.spider, Request(url), response)
+        return response
+
+    def test_canonical_url_drops_volatile_params_and_sorts_the_rest(self):
+        self.assertEqual(
+            canonical_url(SEARCH_URL + '&srpvid=ab12&searchrequestid=cd34&label=gen173nr'),
+            'https://www.booking.com/searchresults.html?checkin=2025-08-01&checkout=2025-08-03&ss=London',
+        )
+
+    def test_tracking_ids_share_a_key(self):
+        key = self.key(SEARCH_URL)
+        self.assertEqual(self.key(SEARCH_URL + '&srpvid=ab12'), key)
+        self.assertEqual(self.key(SEARCH_URL + '&searchrequestid=cd34&label=gen173nr'), key)
+        self.assertEqual(self.key(
+            'https://www.booking.com/searchresults.html?label=x&checkout=2025-08-03&srpvid=y&checkin=2025-08-01&ss=London'
+        ), key)
+
+    def test_search_params_change_the_key(self):
+        key = self.key(SEARCH_URL)
+        self.assertNotEqual(self.key(SEARCH_URL.replace('checkin=2025-08-01', 'checkin=2025-08-02')), key)
+        self.assertNotEqual(self.key(SEARCH_URL.replace('ss=London', 'ss=Paris')), key)
+
+    def test_round_trips_a_response(self):
+        body = '<html><body>Z Soho – US$120</body></html>'.encode() * 100
+        stored = self.store(body=body)
+        compressed = self.storage.db.execute('SELECT body FROM responses').fetchone()[0]
+        self.assertLess(len(compressed), len(body))
+
+        response = self.storage.retrieve_response(self.spider, Request(SEARCH_URL + '&srpvid=ab12'))
+        self.assertIsInstance(response, HtmlResponse)
+        self.assertEqual(response.url, stored.url)
+        self.assertEqual(response.status, 200)
+        self.assertEqual(response.headers.get('Content-Type'), b'text/html; charset=utf-8')
+        self.assertEqual(response.body, body)
+
+    def test_misses_an_unknown_request(self):
+        self.assertIsNone(self.storage.retrieve_response(self.spider, Request(SEARCH_URL)))
+
+    def test_pages_older_than_the_spiders_ttl_are_not_served(self):
+        self.assertEqual(self.storage.ttl_secs, 600) # HTTPCACHE_TTL_MINUTES, not HTTPCACHE_EXPIRATION_SECS
+        self.store()
+        self.storage.db.execute('UPDATE responses SET stored_at = stored_at - 590')
+        self.assertIsNotNone(self.storage.retrieve_response(self.spider, Request(SEARCH_URL)))
+
+        self.storage.db.execute('UPDATE responses SET stored_at = stored_at - 20')
+        self.assertIsNone(self.storage.retrieve_response(self.spider, Request(SEARCH_URL)))
+
+    def test_records_the_hit_rate_on_close(self):
+        self.stats.inc_value('httpcache/hit', 2) # counted by HttpCacheMiddleware
+        self.stats.inc_value('httpcache/miss', 1)
+        self.storage.close_spider(self.spider)
+        self.assertEqual(self.stats.get_value('httpcache/hit_rate'), 0.667)
+
+
+if __name__ == '__main__':
+    unittest.main()
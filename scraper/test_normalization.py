@@ -0,0 +1,145 @@
+"""
+Tests of the result-page value parsing in scraper/normalization.py. Run from this
+directory:
+
+    uv run python -m unittest test_normalization
+"""
+import unittest
+from decimal import Decimal
+
+from scraper.normalization import (
+    canonical_hotel_url, from_minor_units, normalize_hotel, parse_distance_km, parse_price, parse_rating,
+    split_location, to_minor_units,
+)
+
+
+class PriceTests(unittest.TestCase):
+
+    def test_thousands_separators(self):
+        self.assertEqual(parse_price('US$1,234.50'), (Decimal('1234.50'), 'USD'))
+        self.assertEqual(parse_price('€ 1.234,50'), (Decimal('1234.50'), 'EUR'))
+        self.assertEqual(parse_price('BDT 12 345'), (Decimal('12345'), 'BDT'))
+        self.assertEqual(parse_price('1,234,567'), (Decimal('1234567'), None))
+        self.assertEqual(parse_price('¥ 15,000'), (Decimal('15000'), 'JPY'))
+
+    def test_currency_symbols_and_codes(self):
+        self.assertEqual(parse_price('US$120')[1], 'USD')
+        self.assertEqual(parse_price('$120')[1], 'USD')
+        self.assertEqual(parse_price('AU$120')[1], 'AUD') # not '$'
+        self.assertEqual(parse_price('£95')[1], 'GBP')
+        self.assertEqual(parse_price('RM 320')[1], 'MYR')
+        self.assertEqual(parse_price('GBP 95')[1], 'GBP')
+        self.assertEqual(parse_price('CAD $140')[1], 'CAD') # the code wins over the symbol
+
+    def test_default_currency(self):
+        self.assertEqual(parse_price('5,000', default_currency='BDT'), (Decimal('5000'), 'BDT'))
+        self.assertEqual(parse_price('Sold out', default_currency='BDT'), (None, 'BDT'))
+        self.assertEqual(parse_price(None, default_currency='BDT'), (None, 'BDT'))
+
+    def test_minor_units(self):
+        self.assertEqual(to_minor_units(Decimal('1234.50'), 'USD'), 123450)
+        self.assertEqual(to_minor_units(Decimal('99.995'), 'EUR'), 10000) # half up
+        self.assertEqual(from_minor_units(123450, 'USD'), Decimal('1234.50'))
+        self.assertIsNone(to_minor_units(None, 'USD'))
+        self.assertIsNone(from_minor_units(None, 'USD'))
+
+    def test_minor_units_of_zero_decimal_currencies(self):
+        self.assertEqual(to_minor_units(Decimal('15000'), 'JPY'), 15000)
+        self.assertEqual(to_minor_units(Decimal('1500.6'), 'KRW'), 1501)
+        self.assertEqual(from_minor_units(15000, 'JPY'), Decimal('15000'))
+        self.assertEqual(from_minor_units(2350000, 'VND'), Decimal('2350000'))
+
+
+class RatingTests(unittest.TestCase):
+
+    def test_ten_point_scale(self):
+        self.assertEqual(parse_rating('Scored 8.4'), 8.4)
+        self.assertEqual(parse_rating('8,4'), 8.4)
+        self.assertEqual(parse_rating(8.4), 8.4)
+        self.assertEqual(parse_rating('9/10'), 9.0)
+        self.assertEqual(parse_rating('Rated 8.6 from 1,234 reviews'), 8.6)
+
+    def test_five_point_scale(self):
+        self.assertEqual(parse_rating('4.2 out of 5'), 8.4)
+        self.assertEqual(parse_rating('4.5 / 5'), 9.0)
+        self.assertEqual(parse_rating(4.2, scale=5), 8.4)
+        self.assertEqual(parse_rating('4.2', scale=5), 8.4)
+        self.assertEqual(parse_rating('8.4/10', scale=5), 8.4) # the text's own scale wins
+
+    def test_no_rating(self):
+        self.assertIsNone(parse_rating(None))
+        self.assertIsNone(parse_rating('No reviews yet'))
+
+
+class DistanceTests(unittest.TestCase):
+
+    def test_kilometres_and_metres(self):
+        self.assertEqual(parse_distance_km('1.1 km to center'), 1.1)
+        self.assertEqual(parse_distance_km('1,1 km from centre'), 1.1)
+        self.assertEqual(parse_distance_km('68 m from centre'), 0.068)
+        self.assertEqual(parse_distance_km('950m from downtown'), 0.95)
+        self.assertEqual(parse_distance_km('2 miles'), 3.219)
+        self.assertIsNone(parse_distance_km('City centre'))
+        self.assertIsNone(parse_distance_km(None))
+
+    def test_split_location(self):
+        self.assertEqual(split_location('Tower Hamlets, London - 1.1 km to center'), ('Tower Hamlets, London', 1.1))
+        self.assertEqual(split_location('Soho,  London (350 m from centre)'), ('Soho, London', 0.35))
+        self.assertEqual(split_location('Westminster Borough, London'), ('Westminster Borough, London', None))
+        self.assertEqual(split_location('  '), (None, None))
+
+
+class CanonicalHotelUrlTests(unittest.TestCase):
+
+    def test_drops_session_and_tracking_params(self):
+        self.assertEqual(
+            canonical_hotel_url(
+                'https://www.booking.com/hotel/gb/z-soho.html?aid=304142&label=gen173nr&sid=ab12'
+                '&checkin=2025-08-01&checkout=2025-08-03&srpvid=cd34&group_adults=2#hotelTmpl'
+            ),
+            'https://www.booking.com/hotel/gb/z-soho.html?checkin=2025-08-01&checkout=2025-08-03&group_adults=2',
+        )
+
+    def test_keeps_the_order_and_encoding_of_the_rest(self):
+        self.assertEqual(
+            canonical_hotel_url('https://www.agoda.com/z-soho/hotel/london-gb.html?checkIn=2025-08-01&cid=-1&childAges=&los=2&searchrequestid=x'),
+            'https://www.agoda.com/z-soho/hotel/london-gb.html?checkIn=2025-08-01&childAges=&los=2',
+        )
+
+    def test_urls_without_kept_params(self):
+        self.assertEqual(canonical_hotel_url('https://www.booking.com/hotel/gb/z-soho.html?aid=1&label=x'),
+                         'https://www.booking.com/hotel/gb/z-soho.html')
+        self.assertEqual(canonical_hotel_url('https://www.booking.com/hotel/gb/z-soho.html'),
+                         'https://www.booking.com/hotel/gb/z-soho.html')
+        self.assertIsNone(canonical_hotel_url(None))
+
+
+class NormalizeHotelTests(unittest.TestCase):
+
+    def test_types_every_field(self):
+        self.assertEqual(
+            normalize_hotel(
+                name='  Z  Soho ', location='Soho, London - 350 m to center', price='¥ 15,000', currency='USD',
+                rating='4.2 out of 5', stars='4-star hotel', image_url='', hotel_url='https://www.agoda.com/z-soho.html?cid=-1',
+            ),
+            {
+                'name': 'Z Soho',
+                'location': 'Soho, London',
+                'price': '¥ 15,000',
+                'price_minor': 15000,
+                'currency': 'JPY',
+                'rating': 8.4,
+                'stars': 4,
+                'distance_km': 0.35,
+                'image_url': None,
+                'hotel_url': 'https://www.agoda.com/z-soho.html',
+            },
+        )
+
+    def test_a_separate_distance_wins(self):
+        hotel = normalize_hotel(location='Soho, London - 350 m to center', distance='1.2 km from centre')
+        self.assertEqual((hotel['location'], hotel['distance_km']), ('Soho, London', 1.2))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,148 @@
+"""
+Tests of BulkHotelScraperPipeline against a test database (created from the Django
+project's DATABASES). Run from this directory:
+
+    uv run python -m unittest test_pipelines
+"""
+import asyncio
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest import mock
+
+from scrapy import Spider
+from scrapy.settings import Settings
+from scrapy.statscollectors import MemoryStatsCollector
+from scrapy.utils.reactor import install_reactor
+
+from scraper import settings as scraper_settings # sets up Django, which the pipelines module needs
+
+install_reactor(scraper_settings.TWISTED_REACTOR) # close_spider's Deferred wraps an asyncio coroutine
+
+from django.test import TestCase
+from django.test.utils import setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+
+from hotel_search import price_history
+from hotel_search.models import Hotel, Offer, SearchRun
+from scraper.items import HotelItem
+from scraper.pipelines import BulkHotelScraperPipeline
+
+TASK_ID = '0d5e1f3a-8a52-4c61-9b7e-2f5c4d7a1b90'
+OTHER_TASK_ID = '9b3c2d1e-4f5a-4b6c-8d7e-0a1b2c3d4e5f'
+
+_old_databases = None
+
+
+def setUpModule():
+    global _old_databases
+    setup_test_environment()
+    _old_databases = setup_databases(verbosity=0, interactive=False)
+
+
+def tearDownModule():
+    teardown_databases(_old_databases, verbosity=0)
+    teardown_test_environment()
+
+
+def hotel_item(name, price_minor=10000, task_id=TASK_ID, location='Soho, London', source='booking_spider'):
+    return HotelItem(
+        search_task_id=task_id, source=source, name=name, location=location,
+        price=f"US${price_minor / 100:,.2f}", price_minor=price_minor, currency='USD', rating=8.4, stars=4,
+    )
+
+
+@mock.patch('scraper.pipelines.publish_offers')
+class BulkHotelScraperPipelineTests(TestCase):
+
+    def setUp(self):
+        self.spider = Spider(name='booking_spider')
+        self.stats = MemoryStatsCollector(SimpleNamespace(settings=Settings()))
+        price_history._known_partitions.clear() # each test's partitions are rolled back with it
+
+    def pipeline(self, batch_size=10):
+        return BulkHotelScraperPipeline(self.stats, batch_size=batch_size, max_latency=60)
+
+    async def process(self, pipeline, *items):
+        for item in items:
+            self.assertIs(await pipeline.process_item(item, self.spider), item)
+
+    async def close(self, pipeline):
+        await pipeline.close_spider(self.spider).asFuture(asyncio.get_running_loop())
+        self.assertIsNone(self.stats.get_value('hotel_pipeline/flush_errors'))
+
+    async def count(self, queryset):
+        return await queryset.acount()
+
+    async def test_deduplicates_a_batch_on_name_location_source(self, publish_offers):
+        pipeline = self.pipeline()
+        await self.process(
+            pipeline,
+            hotel_item('Z Soho', 10000),
+            hotel_item('Z Soho', 9000), # seen again before the flush: the latest wins
+            hotel_item('Z Soho', 9500, source='agoda_spider'),
+            hotel_item('Z Soho', 9900, location='Soho, London W1'),
+        )
+        await self.close(pipeline)
+
+        self.assertEqual(await self.count(Hotel.objects.all()), 3)
+        hotel = await Hotel.objects.aget(name='Z Soho', location='Soho, London', source='booking_spider')
+        self.assertEqual(hotel.price_amount, Decimal('90.00'))
+        self.assertEqual(await self.count(Offer.objects.all()), 3)
+        self.assertEqual(self.stats.get_value('hotel_pipeline/items_upserted'), 3)
+
+    async def test_flushes_when_the_batch_is_full(self, publish_offers):
+        pipeline = self.pipeline(batch_size=2)
+        await self.process(pipeline, hotel_item('A'))
+        self.assertEqual(await self.count(Hotel.objects.all()), 0)
+        await self.process(pipeline, hotel_item('B'))
+
+        self.assertEqual(await self.count(Hotel.objects.all()), 2) # before close_spider
+        self.assertEqual(self.stats.get_value('hotel_pipeline/flushes'), 1)
+        self.assertIsNone(pipeline.flush_timer)
+        publish_offers.assert_called_once()
+        await self.close(pipeline)
+        self.assertEqual(self.stats.get_value('hotel_pipeline/flushes'), 1) # nothing left to flush
+
+    async def test_flushes_a_partial_batch_on_close(self, publish_offers):
+        pipeline = self.pipeline(batch_size=10)
+        await self.process(pipeline, hotel_item('A'), hotel_item('B'), hotel_item('C'))
+        self.assertEqual(await self.count(Hotel.objects.all()), 0)
+
+        await self.close(pipeline)
+        self.assertEqual(await self.count(Hotel.objects.all()), 3)
+        self.assertEqual(self.stats.get_value('hotel_pipeline/flushes'), 1)
+
+    async def test_updates_an_existing_hotel(self, publish_offers):
+        existing = await Hotel.objects.acreate(
+            search_task_id=OTHER_TASK_ID, name='Z Soho', location='Soho, London', source='booking_spider',
+            price='US$150.00', price_amount=Decimal('150.00'), currency='USD',
+        )
+        pipeline = self.pipeline()
+        await self.process(pipeline, hotel_item('Z Soho', 12000))
+        await self.close(pipeline)
+
+        self.assertEqual(await self.count(Hotel.objects.all()), 1)
+        hotel = await Hotel.objects.aget(id=existing.id)
+        self.assertEqual(hotel.price_amount, Decimal('120.00'))
+        self.assertEqual(hotel.price, 'US$120.00')
+        self.assertEqual(hotel.rating, '8.4')
+        self.assertEqual(hotel.search_task_id, TASK_ID)
+
+    async def test_records_an_offer_per_run(self, publish_offers):
+        for task_id, price_minor in ((TASK_ID, 12000), (OTHER_TASK_ID, 11000)): # one crawl per search
+            pipeline = self.pipeline()
+            await self.process(pipeline, hotel_item('Z Soho', price_minor, task_id=task_id))
+            await self.close(pipeline)
+
+        self.assertEqual(await self.count(Hotel.objects.all()), 1)
+        for task_id, price in ((TASK_ID, Decimal('120.00')), (OTHER_TASK_ID, Decimal('110.00'))):
+            offers = [offer async for offer in Offer.objects.filter(run__task_id=task_id).select_related('hotel')]
+            self.assertEqual([(offer.hotel.name, offer.price_amount, offer.currency) for offer in offers],
+                             [('Z Soho', price, 'USD')])
+        self.assertEqual(publish_offers.call_count, 2)
+
+    async def test_skips_items_without_essential_fields(self, publish_offers):
+        pipeline = self.pipeline()
+        await self.process(pipeline, hotel_item('A', location=None))
+        await self.close(pipeline)
+        self.assertEqual(await self.count(Hotel.objects.all()), 0)
+        self.assertEqual(self.stats.get_value('hotel_pipeline/items_skipped'), 1)
@@ -0,0 +1,89 @@
+"""
+Tests of DistributedRateLimitMiddleware against a real Redis (RATE_LIMIT_REDIS_URL):
+the Lua token bucket and the fail-open path. Run from this directory:
+
+    uv run python -m unittest test_rate_limit
+"""
+import time
+import unittest
+import uuid
+
+import redis
+from scrapy import Request, Spider
+
+from scraper import settings # sets up Django, which the middlewares module needs
+from scraper.middlewares import DistributedRateLimitMiddleware
+
+
+def redis_available():
+    try:
+        return redis.Redis.from_url(settings.RATE_LIMIT_REDIS_URL).ping()
+    except redis.RedisError:
+        return False
+
+
+class Stats(dict):
+    """
+    The part of a stats collector the middleware uses.
+    """
+
+    def inc_value(self, key, count=1):
+        self[key] = self.get(key, 0) + count
+
+    get_value = dict.get
+
+
+class DistributedRateLimitMiddlewareTests(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.spider = Spider(name='rate_limit_test')
+        self.stats = Stats()
+        self.key_prefix = f"test:rate_limit:{uuid.uuid4().hex}:"
+
+    def middleware(self, redis_url=settings.RATE_LIMIT_REDIS_URL, rate=10.0, burst=2):
+        middleware = DistributedRateLimitMiddleware(self.stats, redis_url, {'rate': rate, 'burst': burst})
+        middleware.KEY_PREFIX = self.key_prefix
+        return middleware
+
+    async def fetch(self, middleware, url='https://www.example.com/search'):
+        started = time.monotonic()
+        self.assertIsNone(await middleware.process_request(Request(url), self.spider))
+        return time.monotonic() - started
+
+    @unittest.skipUnless(redis_available(), "Redis isn't reachable")
+    async def test_requests_beyond_the_burst_are_delayed(self):
+        middleware = self.middleware(rate=10.0, burst=2)
+        try:
+            self.assertLess(await self.fetch(middleware), 0.05)
+            self.assertLess(await self.fetch(middleware), 0.05)
+            self.assertGreaterEqual(await self.fetch(middleware), 0.08) # a token refills in 0.1 s
+        finally:
+            await middleware.client.delete(self.key_prefix + 'example.com')
+            await middleware.client.close()
+        self.assertEqual(self.stats.get_value('rate_limit/example.com/waited'), 1)
+        self.assertIsNone(self.stats.get_value('rate_limit/redis_errors'))
+
+    @unittest.skipUnless(redis_available(), "Redis isn't reachable")
+    async def test_buckets_are_shared_across_middlewares(self):
+        first, second = self.middleware(burst=1), self.middleware(burst=1) # two crawl processes
+        try:
+            self.assertLess(await self.fetch(first), 0.05)
+            self.assertGreaterEqual(await self.fetch(second), 0.08)
+        finally:
+            await first.client.delete(self.key_prefix + 'example.com')
+            await first.client.close()
+            await second.client.close()
+
+    async def test_redis_error_lets_the_request_through(self):
+        middleware = self.middleware(redis_url='redis://127.0.0.1:1/0', burst=1) # nothing listens there
+        try:
+            for _ in range(3):
+                self.assertLess(await self.fetch(middleware), 1.0)
+        finally:
+            await middleware.client.close()
+        self.assertEqual(self.stats.get_value('rate_limit/redis_errors'), 3)
+        self.assertTrue(middleware.redis_failing)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+"""
+Tests of the search form's filters, the TopKEarlyStop extension and the top-K cap
+on fanned-out pages. Run from this directory:
+
+    uv run python -m unittest test_search_filters
+"""
+import unittest
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest import mock
+
+from scrapy import Spider, signals
+from scrapy.exceptions import NotConfigured
+from scrapy.settings import Settings
+from scrapy.signalmanager import SignalManager
+from scrapy.statscollectors import MemoryStatsCollector
+
+from scraper import settings # sets up Django, which the extensions module needs
+from scraper.extensions import TopKEarlyStop
+from scraper.items import HotelItem
+from scraper.pagination import DEFAULT_MAX_PAGES, max_pages
+from scraper.search_filters import parse_max_price, parse_min_stars, qualifies, star_classes
+
+
+def hotel_item(price_minor=12000, currency='USD', stars=4):
+    return HotelItem(name='Z Soho', price_minor=price_minor, currency=currency, stars=stars)
+
+
+class SearchFilterTests(unittest.TestCase):
+
+    def test_parse_max_price(self):
+        self.assertEqual(parse_max_price('150'), Decimal('150'))
+        self.assertEqual(parse_max_price('$1,250.50'), Decimal('1250.50'))
+        for no_limit in ('', None, '0', '-5', 'any'):
+            self.assertIsNone(parse_max_price(no_limit), no_limit)
+
+    def test_parse_min_stars(self):
+        self.assertEqual(parse_min_stars('4'), 4)
+        self.assertEqual(parse_min_stars('3.0'), 3)
+        for no_filter in ('', None, 'Any', '0', '6'):
+            self.assertIsNone(parse_min_stars(no_filter), no_filter)
+
+    def test_star_classes(self):
+        self.assertEqual(star_classes(4), [4, 5])
+        self.assertEqual(star_classes(1), [1, 2, 3, 4, 5])
+        self.assertEqual(star_classes(None), [])
+
+    def test_qualifies_within_the_filters(self):
+        self.assertTrue(qualifies(hotel_item(), max_price=Decimal('150'), min_stars=4))
+        self.assertTrue(qualifies(hotel_item(price_minor=15000), max_price=Decimal('150'))) # the limit is inclusive
+        self.assertTrue(qualifies(hotel_item())) # no filters
+
+    def test_a_price_above_the_limit_does_not_qualify(self):
+        self.assertFalse(qualifies(hotel_item(price_minor=15001), max_price=Decimal('150')))
+        self.assertFalse(qualifies(hotel_item(price_minor=20000, currency='JPY'), max_price=Decimal('15000')))
+
+    def test_an_item_without_a_price_does_not_qualify(self):
+        self.assertFalse(qualifies(hotel_item(price_minor=None)))
+
+    def test_stars(self):
+        self.assertFalse(qualifies(hotel_item(stars=3), min_stars=4))
+        self.assertTrue(qualifies(hotel_item(stars=None), min_stars=4)) # the site applied the filter
+
+
+class TopKEarlyStopTests(unittest.TestCase):
+
+    def setUp(self):
+        self.crawler = SimpleNamespace(
+            settings=Settings({'SEARCH_TOP_K': 3}),
+            signals=SignalManager(),
+            stats=MemoryStatsCollector(SimpleNamespace(settings=Settings())),
+            engine=mock.Mock(),
+        )
+        self.extension = TopKEarlyStop.from_crawler(self.crawler)
+
+    def spider(self, sorted_by_price=True, max_price=Decimal('150'), min_stars=None):
+        spider = Spider(name='booking_spider')
+        spider.sorted_by_price = sorted_by_price
+        spider.max_price = max_price
+        spider.min_stars = min_stars
+        return spider
+
+    def scrape(self, spider, *items):
+        for item in items:
+            self.crawler.signals.send_catch_log(signals.item_scraped, item=item, response=None, spider=spider)
+
+    def test_closes_a_price_sorted_spider_after_k_qualifying_items(self):
+        spider = self.spider()
+        self.scrape(spider, hotel_item(), hotel_item(price_minor=20000), hotel_item())
+        self.crawler.engine.close_spider.assert_not_called() # the pricier item doesn't count
+        self.assertEqual(self.crawler.stats.get_value('top_k/qualifying'), 2)
+
+        self.scrape(spider, hotel_item())
+        self.crawler.engine.close_spider.assert_called_once_with(spider, 'top_k_reached')
+        self.assertEqual(self.crawler.stats.get_value('top_k/qualifying'), 3)
+
+        self.scrape(spider, hotel_item(), hotel_item()) # pages still in flight
+        self.crawler.engine.close_spider.assert_called_once()
+
+    def test_ignores_unsorted_spiders(self):
+        spider = self.spider(sorted_by_price=False)
+        self.scrape(spider, *[hotel_item() for _ in range(5)])
+        self.crawler.engine.close_spider.assert_not_called()
+        self.assertIsNone(self.crawler.stats.get_value('top_k/qualifying'))
+
+    def test_is_disabled_by_a_zero_top_k(self):
+        self.crawler.settings = Settings({'SEARCH_TOP_K': 0})
+        with self.assertRaises(NotConfigured):
+            TopKEarlyStop.from_crawler(self.crawler)
+
+
+class MaxPagesTests(unittest.TestCase):
+
+    def spider(self, sorted_by_price=True, **settings):
+        spider = Spider(name='booking_spider')
+        spider.sorted_by_price = sorted_by_price
+        spider.settings = Settings({'SEARCH_MAX_PAGES': 10, 'SEARCH_TOP_K': 100, **settings})
+        return spider
+
+    def test_top_k_caps_the_pages_of_a_price_sorted_search(self):
+        self.assertEqual(max_pages(self.spider(), page_size=25), 4)
+        self.assertEqual(max_pages(self.spider(), page_size=30), 4) # the last page is partly needed
+        self.assertEqual(max_pages(self.spider(SEARCH_TOP_K=1000), page_size=25), 10) # SEARCH_MAX_PAGES still applies
+
+    def test_unsorted_or_uncapped_searches_get_search_max_pages(self):
+        self.assertEqual(max_pages(self.spider(sorted_by_price=False), page_size=25), 10)
+        self.assertEqual(max_pages(self.spider(SEARCH_TOP_K=0), page_size=25), 10)
+
+    def test_outside_a_crawl(self):
+        self.assertEqual(max_pages(Spider(name='booking_spider'), page_size=25), DEFAULT_MAX_PAGES)
+
+
+if __name__ == '__main__':
+    unittest.main()